@@ -66,6 +66,15 @@ def create_app():
     async def setup():
         from . import models
         await create_tables()
+        from .cache import start_invalidation_listener
+        start_invalidation_listener()
+        from .scheduler import ENABLED as refresh_enabled, get_scheduler
+        if refresh_enabled:
+            get_scheduler().start()
+        if os.environ.get('SIGAA_CONCURRENCY_BUDGET', '1') != '0':
+            from .sigaa_api.session import set_request_gate
+            from .sigaa_budget import get_budget
+            set_request_gate(get_budget())
         backend_pref = os.environ.get('SIGAA_BACKEND', 'auto').strip().lower()
         app.logger.info(f'⚙️ Sistema de API configurado (SIGAA_BACKEND): {backend_pref.upper()}')
         from .sigaa_remote import is_configured, get_client
@@ -77,6 +86,7 @@ def create_app():
             if client:
                 try:
                     is_healthy = await client.healthy(force=True)
+                    client.start_monitor()
                     if is_healthy:
                         app.logger.info('✅ Comunicação com a API Remota estabelecida com sucesso!')
                     else:
@@ -103,6 +113,18 @@ def create_app():
 
     @app.after_serving
     async def teardown():
+        from .sigaa_api.session import close_connectors
+        from .sigaa_api.session_pool import close_session_pool
+        from .sigaa_remote.client import close_client
+        from .cache import stop_invalidation_listener
+        from .singleflight import get_singleflight
+        from .scheduler import get_scheduler
+        await get_scheduler().aclose()
+        await close_session_pool()
+        await close_client()
+        await stop_invalidation_listener()
+        await get_singleflight().aclose()
+        await close_connectors()
         await close_db()
 
     @app.after_request
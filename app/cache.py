@@ -1,15 +1,47 @@
+import asyncio
 import os
 import json
 import logging
+import time
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
 from typing import Any, Optional
 import redis.asyncio as aioredis
+from .sigaa_api.env import env_int
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 client: aioredis.Redis = aioredis.from_url(REDIS_URL, decode_responses=True, max_connections=30, socket_timeout=3, socket_connect_timeout=1, socket_keepalive=True, health_check_interval=30, retry_on_timeout=True)
+# Namespaces com codec binário precisam de bytes crus; o pool é pequeno porque só eles passam por aqui.
+binary_client: aioredis.Redis = aioredis.from_url(REDIS_URL, decode_responses=False, max_connections=10, socket_timeout=3, socket_connect_timeout=1, socket_keepalive=True, health_check_interval=30, retry_on_timeout=True)
 _DEFAULT_TTLS: dict[str, int] = {'profile': 600, 'history': 600, 'historico': 30, 'notas': 30}
 _FALLBACK_TTL = 30
-import time
-_local_cache: dict[str, tuple[Any, float]] = {}
+
+L1_NAMESPACES = frozenset((ns.strip() for ns in os.getenv('CACHE_L1_NAMESPACES', 'sigaa_status,prof,sync_meta,profile').split(',') if ns.strip())) - {'sigaa_pwd'}
+L1_MAX_ENTRIES = env_int('CACHE_L1_MAX_ENTRIES', 2048)
+L1_MAX_TTL = env_int('CACHE_L1_MAX_TTL', 30)
+LOCAL_FALLBACK_MAX_ENTRIES = env_int('CACHE_FALLBACK_MAX_ENTRIES', 4096)
+BINARY_NAMESPACES = frozenset((ns.strip() for ns in os.getenv('CACHE_BINARY_NAMESPACES', 'profile,history').split(',') if ns.strip()))
+COMPRESS_MIN_BYTES = env_int('CACHE_COMPRESS_MIN_BYTES', 1024)
+# Primeiro byte dos valores binários. Entradas antigas são JSON em texto e
+# nunca começam com esses bytes, então continuam legíveis.
+_CODEC_JSON = 1
+_CODEC_JSON_ZLIB = 2
+_CODEC_JSON_ZSTD = 3
+_INVALIDATION_CHANNEL = 'cache:invalidate'
+_INSTANCE_ID = uuid.uuid4().hex
+_local_cache: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+_l1: OrderedDict[str, tuple[str | bytes, float]] = OrderedDict()
+_l1_stats: dict[str, dict[str, int]] = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_listener = {'task': None, 'ready': False}
 
 def _make_key(namespace: str, identifier: str) -> str:
     return f'{namespace}:{identifier}'
@@ -19,42 +51,202 @@ def _resolve_ttl(namespace: str, ttl: Optional[int]=None) -> int:
         return ttl
     return _DEFAULT_TTLS.get(namespace, _FALLBACK_TTL)
 
+def _bounded_put(store: OrderedDict, key: str, value: Any, expires_at: float, limit: int) -> None:
+    store[key] = (value, expires_at)
+    store.move_to_end(key)
+    while len(store) > limit:
+        store.popitem(last=False)
+
+def _l1_active(namespace: str) -> bool:
+    # Sem o listener de invalidação, o L1 serviria dados velhos de outros processos.
+    return namespace in L1_NAMESPACES and _listener['ready']
+
+def _l1_get(key: str) -> Optional[str | bytes]:
+    entry = _l1.get(key)
+    if entry is None:
+        return None
+    raw, expires_at = entry
+    if time.time() >= expires_at:
+        _l1.pop(key, None)
+        return None
+    _l1.move_to_end(key)
+    return raw
+
+def _l1_put(namespace: str, key: str, raw: str | bytes, ttl: int) -> None:
+    _bounded_put(_l1, key, raw, time.time() + min(ttl, L1_MAX_TTL), L1_MAX_ENTRIES)
+
+async def _publish_invalidation(key: str) -> None:
+    try:
+        await client.publish(_INVALIDATION_CHANNEL, f'{_INSTANCE_ID} {key}')
+    except Exception as exc:
+        logger.warning('Redis PUBLISH failed for %s: %s', key, exc)
+
+async def _listen_invalidations() -> None:
+    delay = 1
+    while True:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(_INVALIDATION_CHANNEL)
+            _listener['ready'] = True
+            delay = 1
+            async for message in pubsub.listen():
+                origin, _, key = str(message.get('data') or '').partition(' ')
+                if origin != _INSTANCE_ID:
+                    _l1.pop(key, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning('Listener de invalidação do cache caiu (%s); L1 desligado até reconectar.', exc)
+        finally:
+            _listener['ready'] = False
+            _l1.clear()
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+def start_invalidation_listener() -> None:
+    if not L1_NAMESPACES:
+        return
+    task = _listener['task']
+    if task is None or task.done():
+        _listener['task'] = asyncio.get_running_loop().create_task(_listen_invalidations())
+
+async def stop_invalidation_listener() -> None:
+    task, _listener['task'] = (_listener['task'], None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+def stats() -> dict:
+    namespaces = {}
+    for namespace, counters in sorted(_l1_stats.items()):
+        total = counters['hits'] + counters['misses']
+        namespaces[namespace] = dict(counters, hit_rate=round(counters['hits'] / total, 4) if total else 0.0)
+    return {'l1_enabled': _listener['ready'], 'l1_entries': len(_l1), 'l1_max_entries': L1_MAX_ENTRIES, 'fallback_entries': len(_local_cache), 'namespaces': namespaces}
+
+def _dump_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value).encode('utf-8')
+
+def encode(value: Any) -> bytes:
+    body = _dump_json(value)
+    if len(body) < COMPRESS_MIN_BYTES:
+        return bytes((_CODEC_JSON,)) + body
+    if zstandard is not None:
+        return bytes((_CODEC_JSON_ZSTD,)) + zstandard.ZstdCompressor(level=3).compress(body)
+    return bytes((_CODEC_JSON_ZLIB,)) + zlib.compress(body, 6)
+
+def json_bytes(raw: str | bytes) -> Optional[bytes]:
+    """O JSON de um valor gravado, em qualquer formato (binário ou legado)."""
+    if isinstance(raw, str):
+        return raw.encode('utf-8')
+    if not raw:
+        return None
+    codec = raw[0]
+    if codec == _CODEC_JSON:
+        return raw[1:]
+    if codec == _CODEC_JSON_ZLIB:
+        return zlib.decompress(raw[1:])
+    if codec == _CODEC_JSON_ZSTD:
+        if zstandard is None:
+            logger.warning('Entrada do cache em zstd, mas o pacote zstandard não está instalado.')
+            return None
+        return zstandard.ZstdDecompressor().decompress(raw[1:])
+    return raw
+
+def _decode(raw: str | bytes) -> Optional[Any]:
+    try:
+        body = json_bytes(raw)
+        if body is None:
+            return None
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    except Exception:
+        return None
+
+def _local_get(key: str) -> Optional[Any]:
+    if key in _local_cache:
+        val, exp = _local_cache[key]
+        if time.time() < exp:
+            return val
+        else:
+            del _local_cache[key]
+    return None
+
+async def _fetch(namespace: str, key: str) -> Optional[str | bytes]:
+    use_l1 = _l1_active(namespace)
+    if use_l1:
+        # O L1 guarda o valor serializado, não o objeto: quem recebe pode mutar à vontade.
+        raw = _l1_get(key)
+        if raw is not None:
+            _l1_stats[namespace]['hits'] += 1
+            return raw
+        _l1_stats[namespace]['misses'] += 1
+    raw = await (binary_client if namespace in BINARY_NAMESPACES else client).get(key)
+    if raw is not None and use_l1:
+        _l1_put(namespace, key, raw, _resolve_ttl(namespace))
+    return raw
+
 async def get(namespace: str, identifier: str) -> Optional[Any]:
     key = _make_key(namespace, identifier)
     try:
-        raw = await client.get(key)
+        raw = await _fetch(namespace, key)
     except Exception as exc:
         logger.warning('Redis GET failed for %s: %s', key, exc)
-        if key in _local_cache:
-            val, exp = _local_cache[key]
-            if time.time() < exp:
-                return val
-            else:
-                del _local_cache[key]
+        return _local_get(key)
+    if raw is None:
         return None
+    return _decode(raw)
+
+async def get_json(namespace: str, identifier: str) -> Optional[bytes]:
+    """Como ``get``, mas devolve o JSON pronto para responder, sem montar o objeto."""
+    key = _make_key(namespace, identifier)
+    try:
+        raw = await _fetch(namespace, key)
+    except Exception as exc:
+        logger.warning('Redis GET failed for %s: %s', key, exc)
+        value = _local_get(key)
+        return None if value is None else _dump_json(value)
     if raw is None:
         return None
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+        return json_bytes(raw)
+    except Exception:
         return None
 
 async def set(namespace: str, identifier: str, value: Any, ttl: Optional[int]=None) -> None:
     key = _make_key(namespace, identifier)
     resolved_ttl = _resolve_ttl(namespace, ttl)
+    binary = namespace in BINARY_NAMESPACES
+    raw = encode(value) if binary else json.dumps(value)
     try:
-        await client.set(key, json.dumps(value), ex=resolved_ttl)
+        await (binary_client if binary else client).set(key, raw, ex=resolved_ttl)
     except Exception as exc:
         logger.warning('Redis SET failed for %s: %s', key, exc)
-        _local_cache[key] = (value, time.time() + resolved_ttl)
+        _bounded_put(_local_cache, key, value, time.time() + resolved_ttl, LOCAL_FALLBACK_MAX_ENTRIES)
+        _l1.pop(key, None)
+        return
+    if namespace in L1_NAMESPACES:
+        if _listener['ready']:
+            _l1_put(namespace, key, raw, resolved_ttl)
+        await _publish_invalidation(key)
 
 async def delete(namespace: str, identifier: str) -> None:
     key = _make_key(namespace, identifier)
+    _l1.pop(key, None)
     try:
         await client.delete(key)
     except Exception as exc:
         logger.warning('Redis DEL failed for %s: %s', key, exc)
     _local_cache.pop(key, None)
+    if namespace in L1_NAMESPACES:
+        await _publish_invalidation(key)
 _TEMP_PWD_NS = 'sigaa_pwd'
 
 def temp_password_ttl() -> int:
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Optional
+from .cache import get as cache_get, set as cache_set
+from .sigaa_api.env import env_int
+logger = logging.getLogger(__name__)
+_FP_NS = 'course_fp'
+# Só o hash e o agendamento da próxima consulta; as notas ficam no retrato criptografado do banco.
+_FP_TTL = 24 * 3600
+
+MIN_RECHECK_INTERVAL = env_int('SIGAA_COURSE_MIN_RECHECK', 180)
+# Uma nota lançada pode ficar escondida por até este intervalo; mantenha bem abaixo de uma hora.
+MAX_RECHECK_INTERVAL = env_int('SIGAA_COURSE_MAX_RECHECK', 900)
+
+def _identifier(institution: str, username: str, registration: Optional[str], turma_key: str) -> str:
+    return f'{(institution or "").upper()}:{username}:{registration or ""}:{turma_key}'
+
+def fingerprint(grades: Any, frequency: Any) -> str:
+    payload = json.dumps({'grades': grades or [], 'frequency': frequency}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_due(snapshot: Optional[dict], now: Optional[float]=None) -> bool:
+    if not snapshot:
+        return True
+    now = time.time() if now is None else now
+    try:
+        return now >= float(snapshot.get('next_check_at', 0))
+    except (TypeError, ValueError):
+        return True
+
+def matches(snapshot: Optional[dict], grades: Any, frequency: Any) -> bool:
+    return bool(snapshot) and snapshot.get('fp') == fingerprint(grades, frequency)
+
+async def load_snapshot(institution: str, username: str, registration: Optional[str], turma_key: str) -> Optional[dict]:
+    if not turma_key or not username:
+        return None
+    snapshot = await cache_get(_FP_NS, _identifier(institution, username, registration, turma_key))
+    return snapshot if isinstance(snapshot, dict) else None
+
+async def record_snapshot(institution: str, username: str, registration: Optional[str], turma_key: str, grades: Any, frequency: Any, previous: Optional[dict]=None) -> bool:
+    if not turma_key or not username:
+        return True
+    fp = fingerprint(grades, frequency)
+    changed = not previous or previous.get('fp') != fp
+    if changed:
+        interval = MIN_RECHECK_INTERVAL
+    else:
+        interval = min(MAX_RECHECK_INTERVAL, max(MIN_RECHECK_INTERVAL, int(previous.get('interval') or MIN_RECHECK_INTERVAL) * 2))
+    now = time.time()
+    snapshot = {'fp': fp, 'checked_at': now, 'interval': interval, 'next_check_at': now + interval}
+    await cache_set(_FP_NS, _identifier(institution, username, registration, turma_key), snapshot, ttl=_FP_TTL)
+    return changed
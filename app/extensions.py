@@ -1,3 +1,4 @@
+import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy import text
@@ -9,6 +10,7 @@ class Base(DeclarativeBase):
     pass
 engine = None
 db_session: async_sessionmaker[AsyncSession] | None = None
+_background_tasks = set()
 
 def init_db(database_url: str, **engine_kwargs):
     global engine, db_session
@@ -89,4 +91,14 @@ class GoogleOAuth:
             resp = await client.get(self.USERINFO_URL, headers={'Authorization': f'Bearer {access_token}'})
             resp.raise_for_status()
             return resp.json()
-google_oauth = GoogleOAuth()
\ No newline at end of file
+google_oauth = GoogleOAuth()
+
+def spawn(coro):
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        coro.close()
+        return None
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -0,0 +1,106 @@
+import json
+import logging
+from .extensions import spawn
+from .models import compute_history_key, get_cipher_suite
+logger = logging.getLogger(__name__)
+_FINAL_STATUSES = ('aprovado', 'reprovado', 'dispensado', 'cancelado', 'trancado', 'concluído', 'concluido')
+
+def is_final(subject) -> bool:
+    status = (subject.get('status') or '').lower()
+    professor = (subject.get('professor') or '').strip().lower()
+    return any((st in status for st in _FINAL_STATUSES)) and subject.get('final_grade') is not None and professor not in ('', 'desconhecido')
+
+class HistoryArchive:
+
+    def __init__(self, institution, username=None):
+        self.institution = (institution or '').upper()
+        self.username = username
+        self._known = set()
+
+    def _owner(self, registration):
+        return compute_history_key(self.institution, registration)
+
+    def _account(self):
+        return compute_history_key(self.institution, 'conta', self.username) if self.username else None
+
+    def _key(self, registration, semester, title):
+        return compute_history_key(self.institution, registration, semester, title)
+
+    async def load(self, registration):
+        if not registration:
+            return {}
+        from sqlalchemy import select
+        from .extensions import db_session
+        from .models import HistoricoTurma
+        try:
+            async with db_session() as db:
+                rows = (await db.execute(select(HistoricoTurma.chave, HistoricoTurma.dados).where(HistoricoTurma.aluno == self._owner(registration)))).all()
+        except Exception as e:
+            logger.warning(f'Arquivo de histórico: falha ao consultar o banco: {e}')
+            return {}
+        cipher = get_cipher_suite()
+        index = {}
+        for key, data in rows:
+            try:
+                record = json.loads(cipher.decrypt(data.encode('utf-8')).decode('utf-8'))
+            except Exception as e:
+                logger.warning(f'Arquivo de histórico: registro ilegível ignorado: {e}')
+                continue
+            self._known.add(key)
+            index[record['semester'], record['subject'].get('name')] = record['subject']
+        return index
+
+    def save(self, registration, history, skip_semesters=()):
+        if not registration:
+            return
+        cipher = get_cipher_suite()
+        rows = {}
+        for sem, subjects in (history or {}).items():
+            if sem in skip_semesters or sem == 'Unknown':
+                continue
+            for subj in subjects or []:
+                key = self._key(registration, sem, subj.get('name'))
+                if key in self._known or key in rows or not is_final(subj):
+                    continue
+                # Serializa já: o perfil ainda vai alterar estes dicionários.
+                payload = json.dumps({'semester': sem, 'subject': subj})
+                rows[key] = cipher.encrypt(payload.encode('utf-8')).decode('utf-8')
+        if not rows:
+            return
+        self._known.update(rows)
+        spawn(self._insert(self._owner(registration), self._account(), rows))
+
+    async def purge(self, registration=None):
+        """Apaga as turmas arquivadas da matrícula ou, sem ela, de todas as matrículas da conta."""
+        from sqlalchemy import delete
+        from .extensions import db_session
+        from .models import HistoricoTurma
+        if registration:
+            condition = HistoricoTurma.aluno == self._owner(registration)
+        elif self.username:
+            condition = HistoricoTurma.conta == self._account()
+        else:
+            return 0
+        async with db_session() as db:
+            result = await db.execute(delete(HistoricoTurma).where(condition))
+            await db.commit()
+        self._known.clear()
+        logger.info(f'Arquivo de histórico: {result.rowcount} turmas apagadas.')
+        return result.rowcount
+
+    @staticmethod
+    async def _insert(owner, account, rows):
+        from sqlalchemy import select
+        from .extensions import db_session
+        from .models import HistoricoTurma
+        try:
+            async with db_session() as db:
+                existing = set((await db.execute(select(HistoricoTurma.chave).where(HistoricoTurma.chave.in_(list(rows))))).scalars())
+                for key, data in rows.items():
+                    if key not in existing:
+                        db.add(HistoricoTurma(chave=key, aluno=owner, conta=account, dados=data))
+                await db.commit()
+            logger.info(f'Arquivo de histórico: {len(rows) - len(existing)} turmas encerradas arquivadas.')
+        except Exception as e:
+            # Outro processo pode ter arquivado a mesma turma; o registro é o mesmo.
+            logger.debug(f'Arquivo de histórico: falha ao gravar no banco: {e}')
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import math
+import time
+from .sigaa_api.env import env_float
+logger = logging.getLogger(__name__)
+
+ALPHA = env_float('SIGAA_LATENCY_ALPHA', 0.2)
+MAX_WORKERS = int(env_float('SIGAA_MAX_STREAM_WORKERS', 10))
+MAX_HISTORY_SESSIONS = int(env_float('SIGAA_MAX_HISTORY_SESSIONS', 5))
+SLOW_SCRAPE = env_float('SIGAA_SLOW_SCRAPE_SECONDS', 12)
+REFRESH_INTERVAL = env_float('SIGAA_LATENCY_REFRESH', 5)
+_TTL = 7 * 24 * 3600
+DEFAULTS = {'login': 7.0, 'scrape': 4.0, 'errors': 0.0}
+_EWMA_LUA = """
+local cur = redis.call('HGET', KEYS[1], ARGV[1])
+local alpha = tonumber(ARGV[3])
+local v = tonumber(ARGV[2])
+if cur then v = (1 - alpha) * tonumber(cur) + alpha * v end
+redis.call('HSET', KEYS[1], ARGV[1], v, 'updated_at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(v)
+"""
+
+class LatencyController:
+    """EWMA de latência de login/scrape e taxa de erro por instituição.
+
+    As médias ficam num hash do Redis compartilhado entre processos; sem Redis,
+    cada processo segue só com as próprias amostras."""
+
+    def __init__(self, alpha: float=ALPHA):
+        self.alpha = alpha
+        self._stats: dict[str, dict[str, float]] = {}
+        self._fetched_at: dict[str, float] = {}
+        self._script = None
+        self._pending: set = set()
+
+    @staticmethod
+    def _key(institution: str) -> str:
+        return f'sigaa:latency:{(institution or "").upper()}'
+
+    def _local(self, institution: str) -> dict:
+        return self._stats.setdefault((institution or '').upper(), dict(DEFAULTS))
+
+    def _blend(self, stats: dict, field: str, sample: float):
+        stats[field] = (1 - self.alpha) * stats.get(field, DEFAULTS[field]) + self.alpha * sample
+
+    def observe(self, institution: str, kind: str, seconds: float=None, ok: bool=True):
+        """Registra uma amostra. ``kind`` é 'login' ou 'scrape'; falhas só
+        entram na taxa de erro, não na latência."""
+        stats = self._local(institution)
+        samples = [('errors', 0.0 if ok else 1.0)]
+        if ok and seconds is not None and kind in DEFAULTS:
+            samples.append((kind, float(seconds)))
+        for field, value in samples:
+            self._blend(stats, field, value)
+        try:
+            task = asyncio.get_running_loop().create_task(self._push(institution, samples))
+        except RuntimeError:
+            return
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _push(self, institution: str, samples):
+        from .cache import client
+        try:
+            if self._script is None:
+                self._script = client.register_script(_EWMA_LUA)
+            now = str(time.time())
+            for field, value in samples:
+                await self._script(keys=[self._key(institution)], args=[field, value, self.alpha, _TTL, now])
+        except Exception as exc:
+            logger.debug('Latência: falha ao gravar no Redis (%s); mantendo só a média local.', exc)
+
+    async def refresh(self, institution: str, force: bool=False) -> dict:
+        inst = (institution or '').upper()
+        now = time.monotonic()
+        if not force and now - self._fetched_at.get(inst, 0.0) < REFRESH_INTERVAL:
+            return self.current(inst)
+        self._fetched_at[inst] = now
+        from .cache import client
+        try:
+            raw = await client.hgetall(self._key(inst))
+        except Exception as exc:
+            logger.debug('Latência: Redis indisponível (%s); usando médias locais.', exc)
+            return self.current(inst)
+        stats = self._local(inst)
+        for field in DEFAULTS:
+            try:
+                if raw.get(field) is not None:
+                    stats[field] = float(raw[field])
+            except (TypeError, ValueError):
+                pass
+        return self.current(inst)
+
+    def current(self, institution: str) -> dict:
+        return dict(self._local(institution))
+
+    def max_parallel(self, stats: dict, ceiling: int) -> int:
+        cap = ceiling
+        if stats['scrape'] > SLOW_SCRAPE:
+            cap //= 2
+        cap = int(cap * max(0.0, 1.0 - 2.0 * stats['errors']))
+        return max(1, cap)
+
+    def plan_workers(self, institution: str, n_pending: int, warm: int=0) -> int:
+        """Total de workers (incluindo a sessão principal) para ``n_pending``
+        disciplinas: cada worker extra além das ``warm`` sessões já logadas
+        paga um login, e todos dividem os scrapes."""
+        if n_pending <= 1:
+            return 1
+        stats = self.current(institution)
+        cap = min(n_pending, self.max_parallel(stats, MAX_WORKERS))
+        best_w = 1
+        best_t = n_pending * stats['scrape']
+        for w in range(2, cap + 1):
+            login = stats['login'] if w - 1 > warm else 0.0
+            t = login + math.ceil(n_pending / w) * stats['scrape']
+            if t < best_t * 0.95:
+                best_w, best_t = (w, t)
+        return best_w
+
+    def history_costs(self, institution: str) -> dict:
+        stats = self.current(institution)
+        return {'login_cost': stats['login'], 'scrape_cost': stats['scrape'], 'max_sessions': self.max_parallel(stats, MAX_HISTORY_SESSIONS)}
+_controller = None
+
+def get_controller() -> LatencyController:
+    global _controller
+    if _controller is None:
+        _controller = LatencyController()
+    return _controller
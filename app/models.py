@@ -90,8 +90,7 @@ class LinkedAccount(Base):
     def __repr__(self):
         return f'<LinkedAccount {self.institution}:{self.username}>'
 
-@lru_cache(maxsize=1)
-def get_vote_hash_key() -> bytes:
+def _derive_key(salt: bytes) -> bytes:
     key = os.environ.get('ENCRYPTION_KEY')
     if not key:
         from .security import is_production
@@ -100,14 +99,25 @@ def get_vote_hash_key() -> bytes:
         key = base64.urlsafe_b64encode(b'0' * 32)
     if isinstance(key, str):
         key = key.encode('utf-8')
-    salt = b'sigaa-api-vote-hash-salt-v1'
     kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=480000)
     return kdf.derive(key)
 
+@lru_cache(maxsize=1)
+def get_vote_hash_key() -> bytes:
+    return _derive_key(b'sigaa-api-vote-hash-salt-v1')
+
+@lru_cache(maxsize=1)
+def get_history_hash_key() -> bytes:
+    return _derive_key(b'sigaa-api-history-key-salt-v1')
+
 def compute_vote_hash(aluno_ref: int, disciplina_id: int, professor_id: int) -> str:
     msg = f'{aluno_ref}:{disciplina_id}:{professor_id}'.encode('utf-8')
     return hmac.new(get_vote_hash_key(), msg, hashlib.sha256).hexdigest()
 
+def compute_history_key(*parts) -> str:
+    msg = ':'.join((str(p) for p in parts)).encode('utf-8')
+    return hmac.new(get_history_hash_key(), msg, hashlib.sha256).hexdigest()
+
 class Disciplina(Base):
     __tablename__ = 'disciplinas'
     id = Column(Integer, primary_key=True)
@@ -150,4 +160,24 @@ class Config(Base):
     __tablename__ = 'config'
     id = Column(Integer, primary_key=True)
     key = Column(String(50), unique=True, nullable=False, index=True)
-    value = Column(String(255), nullable=True)
\ No newline at end of file
+    value = Column(String(255), nullable=True)
+
+class DiretorioProfessor(Base):
+    __tablename__ = 'diretorio_professores'
+    id = Column(Integer, primary_key=True)
+    institution = Column(String(50), nullable=False)
+    chave = Column(String(255), nullable=False)
+    professor = Column(String(255), nullable=False)
+    turma = Column(String(64), nullable=True)
+    ambigua = Column(Boolean, default=False, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (UniqueConstraint('institution', 'chave', name='uq_diretorio_professor'),)
+
+class HistoricoTurma(Base):
+    __tablename__ = 'historico_turmas'
+    id = Column(Integer, primary_key=True)
+    chave = Column(String(64), unique=True, nullable=False)
+    aluno = Column(String(64), nullable=False, index=True)
+    conta = Column(String(64), nullable=True, index=True)
+    dados = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
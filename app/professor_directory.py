@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import re
+from .cache import get as cache_get, set as cache_set
+from .extensions import spawn
+logger = logging.getLogger(__name__)
+PROFESSOR_TTL = 7 * 24 * 3600
+_UNKNOWN = {'', 'desconhecido'}
+_CODE_RE = re.compile('^\\s*([A-Z]{2,}[A-Z0-9]*\\d[A-Z0-9]*)\\s*-')
+
+def component_code(title):
+    """'MAT100 - CÁLCULO' -> 'MAT100'."""
+    match = _CODE_RE.match(title or '')
+    return match.group(1) if match else None
+
+def _code_key(code=None, semester=None):
+    return f'{code}@{semester}' if code and semester else None
+
+def _valid(name):
+    return bool(name) and name.strip().lower() not in _UNKNOWN
+
+def _state(row):
+    return {'professor': row.professor, 'turma': row.turma, 'ambigua': bool(row.ambigua)}
+
+def _merge(state, name, turma):
+    if state is None:
+        return {'professor': name, 'turma': turma, 'ambigua': False}
+    if state['ambigua']:
+        return state
+    if state['professor'] != name or (turma and state['turma'] and state['turma'] != turma):
+        return {'professor': '', 'turma': None, 'ambigua': True}
+    return {**state, 'turma': state['turma'] or turma}
+
+def _resolve(turma_id, state):
+    if not isinstance(state, dict) or state.get('ambigua') or not _valid(state.get('professor')):
+        return None
+    if turma_id and state.get('turma') and state['turma'] != str(turma_id):
+        return None
+    return state['professor']
+
+async def lookup_many(institution, entries):
+    """Professores para [(turma_id, código, semestre), ...], alinhados com ``entries`` (None se ninguém sabe)."""
+    inst = (institution or '').upper()
+    turma_keys = [str(t) for t, _, _ in entries if t]
+    code_keys = [k for k in (_code_key(c, sem) for _, c, sem in entries) if k]
+    flat = list(dict.fromkeys(turma_keys + code_keys))
+    if not flat:
+        return [None] * len(entries)
+    cached = await asyncio.gather(*(cache_get('prof', f'{inst}:{k}') for k in flat), return_exceptions=True)
+    found = {k: v for k, v in zip(flat, cached) if (isinstance(v, dict) if '@' in k else isinstance(v, str) and _valid(v))}
+    missing = [k for k in flat if k not in found]
+    if missing:
+        try:
+            from sqlalchemy import select
+            from .extensions import db_session
+            from .models import DiretorioProfessor
+            async with db_session() as db:
+                rows = (await db.execute(select(DiretorioProfessor).where(DiretorioProfessor.institution == inst, DiretorioProfessor.chave.in_(missing)))).scalars().all()
+            for row in rows:
+                found[row.chave] = _state(row) if '@' in row.chave else row.professor
+                spawn(cache_set('prof', f'{inst}:{row.chave}', found[row.chave], ttl=PROFESSOR_TTL))
+        except Exception as e:
+            logger.warning(f'Diretório de professores: falha ao consultar o banco: {e}')
+    results = []
+    for turma_id, code, semester in entries:
+        name = found.get(str(turma_id)) if turma_id else None
+        results.append(name if _valid(name) else _resolve(turma_id, found.get(_code_key(code, semester))))
+    return results
+
+async def lookup(institution, turma_id=None, code=None, semester=None):
+    return (await lookup_many(institution, [(turma_id, code, semester)]))[0]
+
+async def record_many(institution, entries):
+    """Grava [(nome, turma_id, código, semestre), ...] no banco e no Redis."""
+    inst = (institution or '').upper()
+    turmas = {}
+    codes = {}
+    for name, turma_id, code, semester in entries:
+        if not _valid(name):
+            continue
+        name = name.strip()
+        if turma_id:
+            turmas[str(turma_id)] = name
+        key = _code_key(code, semester)
+        if key:
+            codes.setdefault(key, []).append((name, str(turma_id) if turma_id else None))
+    if not turmas and (not codes):
+        return
+    states = {}
+    try:
+        from sqlalchemy import select
+        from .extensions import db_session
+        from .models import DiretorioProfessor
+        async with db_session() as db:
+            existing = {row.chave: row for row in (await db.execute(select(DiretorioProfessor).where(DiretorioProfessor.institution == inst, DiretorioProfessor.chave.in_(list(turmas) + list(codes))))).scalars()}
+            for key, name in turmas.items():
+                row = existing.get(key)
+                if row is None:
+                    db.add(DiretorioProfessor(institution=inst, chave=key, professor=name))
+                elif row.professor != name:
+                    row.professor = name
+            for key, seen in codes.items():
+                row = existing.get(key)
+                state = _state(row) if row is not None else None
+                for name, turma in seen:
+                    state = _merge(state, name, turma)
+                if row is None:
+                    db.add(DiretorioProfessor(institution=inst, chave=key, **state))
+                else:
+                    row.professor, row.turma, row.ambigua = (state['professor'], state['turma'], state['ambigua'])
+                states[key] = state
+            await db.commit()
+    except Exception as e:
+        # Sem o banco não dá para conferir conflitos: só a chave da turma vai ao Redis.
+        logger.debug(f'Diretório de professores: falha ao gravar no banco: {e}')
+        states = {}
+    values = {**turmas, **states}
+    await asyncio.gather(*(cache_set('prof', f'{inst}:{k}', v, ttl=PROFESSOR_TTL) for k, v in values.items()), return_exceptions=True)
+
+async def record(institution, name, turma_id=None, code=None, semester=None):
+    await record_many(institution, [(name, turma_id, code, semester)])
+
+def record_history(institution, history):
+    """Professores revelados pelo histórico (chave código + semestre)."""
+    entries = [(subj.get('professor'), None, component_code(subj.get('name')), sem) for sem, subjects in (history or {}).items() for subj in subjects or []]
+    spawn(record_many(institution, entries))
+
+def record_enrollment(institution, levels):
+    """Professores das turmas oferecidas na matrícula (chave id da turma)."""
+    entries = [(cls.get('teacher'), cls.get('class_id'), None, None) for level in levels or [] for disc in level.get('disciplines') or [] for cls in disc.get('classes') or []]
+    spawn(record_many(institution, entries))
+
+class BondDirectory:
+
+    def __init__(self, institution):
+        self.institution = institution
+
+    async def lookup_many(self, entries):
+        return await lookup_many(self.institution, [(turma_id, component_code(title), semester) for turma_id, title, semester in entries])
+
+    def record(self, name, turma_id=None, title=None, semester=None):
+        spawn(record(self.institution, name, turma_id, component_code(title), semester))
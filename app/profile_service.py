@@ -0,0 +1,196 @@
+import copy
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from . import professor_directory
+from .cache import delete as cache_delete, set as cache_set
+from .models import LinkedAccount, get_cipher_suite
+from .singleflight import SingleFlight
+logger = logging.getLogger(__name__)
+HISTORY_MAX_AGE = timedelta(days=3)
+
+def cache_key(user_id, username, institution) -> str:
+    return f'{user_id}_{username}_{(institution or "").upper()}_profile'
+
+def flight_key(institution, username, account_id) -> str:
+    # Com a conta na chave, quem espera o scrape de outro usuário do app não
+    # fica sem o perfil gravado na própria conta.
+    return SingleFlight.key(institution, username, f'profile:{account_id}')
+
+def active_student_bonds(bonds):
+    return [b for b in bonds if b.get('status') == 'active' and b.get('type') == 'student']
+
+def load_profile(linked_account):
+    """Perfil salvo (descriptografado) da conta vinculada, ou None."""
+    if not linked_account or not linked_account.history_json:
+        return None
+    try:
+        cipher = get_cipher_suite()
+        return json.loads(cipher.decrypt(linked_account.history_json.encode('utf-8')).decode('utf-8'))
+    except Exception as e:
+        logger.error(f'Cache decryption failed: {e}')
+        return None
+
+def is_fresh(linked_account, max_age=HISTORY_MAX_AGE) -> bool:
+    updated_at = linked_account.history_updated_at if linked_account else None
+    return bool(updated_at and datetime.utcnow() - updated_at < max_age)
+
+def load_portal(linked_account):
+    """Último retrato salvo do semestre atual (``portal_cache_json``), ou None."""
+    if not linked_account or not linked_account.portal_cache_json:
+        return None
+    try:
+        cipher = get_cipher_suite()
+        return json.loads(cipher.decrypt(linked_account.portal_cache_json.encode('utf-8')).decode('utf-8'))
+    except Exception as e:
+        logger.warning(f'Failed to load cached portal: {e}')
+        return None
+
+async def persist_portal(account_id, courses, previous=None):
+    """Grava o retrato do semestre atual. Disciplinas que ficaram sem dados
+    nesta carga (puladas ou com falha) herdam o retrato anterior."""
+    if not account_id:
+        return
+    old = {}
+    for course in (previous or {}).get('courses') or []:
+        old[course.get('turma_id') or course.get('name')] = course
+    kept = []
+    for course in courses:
+        if course.get('data') is None:
+            course = old.get(course.get('turma_id') or course.get('name'), {}) | {k: v for k, v in course.items() if v is not None}
+        if course.get('data') is not None:
+            kept.append(course)
+    if not kept:
+        return
+    from .extensions import db_session
+    try:
+        async with db_session() as db:
+            linked_account = await db.get(LinkedAccount, account_id)
+            if linked_account:
+                cipher = get_cipher_suite()
+                payload = json.dumps({'saved_at': time.time(), 'courses': kept})
+                linked_account.portal_cache_json = cipher.encrypt(payload.encode('utf-8')).decode('utf-8')
+                linked_account.portal_cache_updated_at = datetime.utcnow()
+                await db.commit()
+    except Exception as e:
+        logger.error(f'Portal cache encryption failed: {e}')
+
+def build_profile(history, inst_data, calculator, log=True):
+    total_grades = []
+    best_grade = 0
+    best_subject = '-'
+    semesters_data = []
+    for sem, subjects in history.items():
+        sem_grades = []
+        for subj in subjects:
+            try:
+                if subj.get('final_grade') is None:
+                    res = calculator.calculate(subj.get('grades', []))
+                    subj['final_grade'] = res.average
+                    subj['status_dict'] = res.to_dict()
+                else:
+                    subj.pop('status_dict', None)
+                if log:
+                    logger.info(f"Final grade for '{subj.get('name')}': {subj.get('final_grade')} ({subj.get('status', '')})")
+            except Exception as e:
+                logger.error(f"Failed to calculate history grades for {subj.get('name')}: {e}")
+            grade = subj.get('final_grade')
+            if grade is not None:
+                sem_grades.append(grade)
+                total_grades.append(grade)
+                if grade > best_grade:
+                    best_grade = grade
+                    best_subject = subj.get('name')
+        sem_avg = sum(sem_grades) / len(sem_grades) if sem_grades else 0
+        if sem_grades:
+            semesters_data.append({'semester': sem, 'average': round(sem_avg, 2), 'count': len(sem_grades)})
+    general_avg = sum(total_grades) / len(total_grades) if total_grades else 0
+    if inst_data.get('general_average'):
+        general_avg = inst_data.get('general_average')
+
+    final_data = {'general_average': round(general_avg, 4), 'best_subject': best_subject, 'best_grade': best_grade, 'semesters': semesters_data, 'history_raw': history}
+    if 'integration_percentage' in inst_data:
+        final_data['integration_percentage'] = inst_data['integration_percentage']
+    if 'error' in inst_data:
+        final_data['inst_error'] = inst_data['error']
+        final_data['inst_url'] = inst_data.get('url', '')
+    return final_data
+
+async def persist_profile(account_id, key, final_data):
+    # Sessão própria: sob single-flight (ou no agendador), quem grava pode não ser a requisição original.
+    if account_id:
+        from .extensions import db_session
+        try:
+            async with db_session() as db:
+                linked_account = await db.get(LinkedAccount, account_id)
+                if linked_account:
+                    cipher = get_cipher_suite()
+                    json_str = json.dumps(final_data)
+                    encrypted_data = cipher.encrypt(json_str.encode('utf-8')).decode('utf-8')
+                    linked_account.history_json = encrypted_data
+                    linked_account.history_updated_at = datetime.utcnow()
+                    await db.commit()
+        except Exception as e:
+            logger.error(f'Cache encryption failed: {e}')
+    try:
+        await cache_set('profile', key, final_data)
+        logger.info('Redis cache set for academic profile')
+    except Exception as e:
+        logger.error(f'Redis cache set failed: {e}')
+
+async def forget_account(user_id, institution, username):
+    """Apaga o que a conta vinculada deixa fora de ``linked_accounts``: o
+    arquivo de histórico e o perfil no Redis."""
+    from .history_archive import HistoryArchive
+    try:
+        await HistoryArchive(institution, username).purge()
+    except Exception as e:
+        logger.error(f'Falha ao apagar o arquivo de histórico da conta: {e}')
+    await cache_delete('profile', cache_key(user_id, username, institution))
+
+async def profile_bond(gateway):
+    all_bonds = await gateway.get_bonds()
+    active_bonds = active_student_bonds(all_bonds)
+    student_bonds = [b for b in all_bonds if b.get('type') == 'student']
+    bonds_to_use = active_bonds if active_bonds else student_bonds
+    return bonds_to_use[0]['bond_id'] if bonds_to_use else None
+
+async def institutional_data(gateway, bond_id):
+    try:
+        return await gateway.get_institutional_data(bond_id)
+    except Exception as e:
+        import traceback
+        logger.error(f'Failed to fetch institutional data: {e}')
+        return {'error': str(e), 'traceback': traceback.format_exc()}
+
+async def fetch_profile(gateway, account_id, key, cached_history, calculator, emit=None):
+    """Busca o histórico, monta o perfil e grava no banco e no Redis.
+
+    Com ``emit``, o histórico vem em streaming e cada ``history_progress`` /
+    ``profile_partial`` é repassado a ``emit``. Devolve None quando a conta não
+    tem vínculo de aluno."""
+    start_time = time.time()
+    async with gateway.scope():
+        bond_id = await profile_bond(gateway)
+        if bond_id is None:
+            return None
+        inst_data = await institutional_data(gateway, bond_id)
+        if emit is None:
+            history = await gateway.get_history(bond_id, cached_history=cached_history)
+        else:
+            partial = {}
+            history = {}
+            async for kind, data in gateway.iter_history(bond_id, cached_history=cached_history):
+                if kind == 'progress':
+                    emit({'type': 'history_progress', 'done': data.get('done'), 'total': data.get('total')})
+                elif kind == 'partial' and data.get('semester'):
+                    partial[data['semester']] = data.get('subjects') or []
+                    emit({'type': 'profile_partial', 'data': build_profile(copy.deepcopy(partial), inst_data, calculator, log=False)})
+                elif kind == 'result':
+                    history = data or {}
+    logger.info(f'Historical data fetch took {time.time() - start_time:.2f}s')
+    professor_directory.record_history(gateway.institution, history)
+    final_data = build_profile(history, inst_data, calculator)
+    await persist_profile(account_id, key, final_data)
+    return final_data
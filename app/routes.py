@@ -11,7 +11,13 @@ from .models import User, LinkedAccount, Disciplina, Professor, Avaliacao, VotoC
 import asyncio
 import hmac
 import ipaddress
-from .cache import get as cache_get, set as cache_set, delete as cache_delete
+from .cache import get as cache_get, get_json as cache_get_json, set as cache_set, delete as cache_delete
+from . import course_sync, professor_directory
+from .latency import get_controller as latency_controller
+from .singleflight import SingleFlight, get_singleflight
+from . import profile_service
+from .profile_service import active_student_bonds as _active_student_bonds
+from .scheduler import record_activity
 import json
 import os
 import aiohttp
@@ -24,7 +30,6 @@ logger = logging.getLogger(__name__)
 SUPPORTERS_URL = 'https://raw.githubusercontent.com/AlbertCohenhgs/public_lists/refs/heads/main/apoiadores.json'
 _supporters_cache = {'data': None, 'at': 0.0}
 _SUPPORTERS_TTL = 600
-_PROFESSOR_TTL = 7 * 24 * 3600
 _SYNC_META_TTL = 30 * 24 * 3600
 _background_tasks = set()
 
@@ -252,16 +257,13 @@ def _save_gateway(gateway):
 def _clear_sigaa_session():
     session.pop('sigaa_state', None)
 
-def _active_student_bonds(bonds):
-    return [b for b in bonds if b.get('status') == 'active' and b.get('type') == 'student']
-
 async def _enumerate_courses(gateway, bonds=None):
     if bonds is None:
         bonds = _active_student_bonds(await gateway.get_bonds())
     listing = []
     for bond in bonds:
         for course in await gateway.get_courses(bond['bond_id']):
-            listing.append({'id': len(listing) + 1, 'bond_id': bond['bond_id'], 'course_id': course['id'], 'title': course.get('title'), 'program': bond.get('program'), 'turma_id': course.get('turma_id'), 'schedule_code': course.get('schedule_code')})
+            listing.append({'id': len(listing) + 1, 'bond_id': bond['bond_id'], 'course_id': course['id'], 'title': course.get('title'), 'program': bond.get('program'), 'turma_id': course.get('turma_id'), 'schedule_code': course.get('schedule_code'), 'registration': bond.get('registration')})
     return (bonds, listing)
 
 @bp.route('/')
@@ -496,6 +498,7 @@ async def unlink_account(id):
         if account and account.user_id == session['user_id']:
             await s.delete(account)
             await s.commit()
+            await profile_service.forget_account(account.user_id, account.institution, account.username)
             if session.get('active_account_id') == id:
                 session.pop('active_account_id', None)
                 _clear_sigaa_session()
@@ -639,6 +642,42 @@ async def test_onboarding():
 def _scrub_active_semester_from_cache(cached_data):
     return cached_data
 
+def _stream_profile(gateway, account_id, cache_key, cached_history_raw, calculator, flight_key):
+    """NDJSON do histórico: ``history_progress`` e ``profile_partial`` (perfil
+    provisório com os semestres já prontos) enquanto o worker trabalha, e
+    ``profile_data`` com o perfil final. Se outra aba já está buscando o mesmo
+    perfil, esta só recebe o ``profile_data`` final."""
+
+    async def generate():
+        events = asyncio.Queue()
+        emit = lambda event: events.put_nowait(json.dumps(event) + '\n')
+        flight = asyncio.ensure_future(get_singleflight().do(flight_key, lambda: profile_service.fetch_profile(gateway, account_id, cache_key, cached_history_raw, calculator, emit=emit)))
+        try:
+            while not flight.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, flight}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            final_data = flight.result()
+            if final_data is None:
+                yield (json.dumps({'error': 'No student bonds found'}) + '\n')
+                return
+            yield (json.dumps({'type': 'profile_data', 'data': final_data}) + '\n')
+        except SigaaQuestionnaire as e:
+            logger.warning(f'Profile error - questionnaire: {e}')
+            yield (json.dumps({'error': QUESTIONNAIRE_MESSAGE, 'is_questionnaire': True}) + '\n')
+        except SigaaSessionExpired:
+            yield (json.dumps({'error': 'Session expired', 'session_expired': True}) + '\n')
+        except Exception as e:
+            logger.error(f'Profile error: {e}')
+            yield (json.dumps({'error': 'Failed to fetch profile'}) + '\n')
+        finally:
+            if not flight.done():
+                flight.cancel()
+    return generate()
+
 @bp.route('/api/academic_profile')
 async def academic_profile():
     if not session.get('sigaa_state'):
@@ -651,103 +690,39 @@ async def academic_profile():
     linked_account = None
     if active_account_id:
         linked_account = await g.db_session.get(LinkedAccount, active_account_id)
-    cache_key = f"{session.get('user_id')}_{session.get('username')}_{session.get('sigaa_inst')}_profile"
+        if linked_account:
+            _fire_and_forget(record_activity(linked_account.id))
+    cache_key = profile_service.cache_key(session.get('user_id'), session.get('username'), session.get('sigaa_inst'))
     if not force_update:
-        cached = await cache_get('profile', cache_key)
+        cached = await cache_get_json('profile', cache_key)
         if cached:
             logger.info('Redis cache hit for academic profile')
-            return jsonify(_scrub_active_semester_from_cache(cached))
+            return Response(cached, mimetype='application/json')
     cached_history_raw = None
-    if linked_account and linked_account.history_json:
-        try:
-            cipher = get_cipher_suite()
-            decrypted_json = cipher.decrypt(linked_account.history_json.encode('utf-8')).decode('utf-8')
-            cached_data = json.loads(decrypted_json)
-            cached_history_raw = cached_data.get('history_raw')
-            if not force_update and linked_account.history_updated_at:
-                if datetime.utcnow() - linked_account.history_updated_at < timedelta(days=3):
-                    return jsonify(_scrub_active_semester_from_cache(cached_data))
-        except Exception as e:
-            logger.error(f'Cache decryption failed: {e}')
-            pass
+    cached_data = profile_service.load_profile(linked_account)
+    if cached_data:
+        cached_history_raw = cached_data.get('history_raw')
+        if not force_update and profile_service.is_fresh(linked_account):
+            return jsonify(_scrub_active_semester_from_cache(cached_data))
     inst_type = _inst_type()
     gateway = await _get_gateway()
     if gateway is None:
         return (jsonify({'error': 'Unauthorized', 'session_expired': True}), 401)
+    calculator = CalculatorFactory.get_calculator(inst_type)
+    account_id = linked_account.id if linked_account else None
+    flight_key = profile_service.flight_key(session.get('sigaa_inst'), session.get('username'), account_id)
     try:
-        start_time = time.time()
-        async with gateway.scope():
-            all_bonds = await gateway.get_bonds()
-            active_bonds = _active_student_bonds(all_bonds)
-            student_bonds = [b for b in all_bonds if b.get('type') == 'student']
-            bonds_to_use = active_bonds if active_bonds else student_bonds
-            if not bonds_to_use:
-                return (jsonify({'error': 'No student bonds found'}), 404)
-            try:
-                inst_data = await gateway.get_institutional_data(bonds_to_use[0]['bond_id'])
-            except Exception as e:
-                import traceback
-                logger.error(f'Failed to fetch institutional data: {e}')
-                inst_data = {'error': str(e), 'traceback': traceback.format_exc()}
-            history = await gateway.get_history(bonds_to_use[0]['bond_id'], cached_history=cached_history_raw)
+        if request.args.get('stream') == '1':
+            # O cookie da sessão sai com os headers: um re-login no meio do stream
+            # se perderia, então a sessão do SIGAA é validada (e salva) antes.
+            async with gateway.scope():
+                await gateway.get_bonds()
+            _save_gateway(gateway)
+            return Response(_stream_profile(gateway, account_id, cache_key, cached_history_raw, calculator, flight_key), mimetype='application/x-ndjson')
+        final_data = await get_singleflight().do(flight_key, lambda: profile_service.fetch_profile(gateway, account_id, cache_key, cached_history_raw, calculator))
         _save_gateway(gateway)
-        duration = time.time() - start_time
-        logger.info(f'Historical data fetch took {duration:.2f}s')
-        total_grades = []
-        best_grade = 0
-        best_subject = '-'
-        semesters_data = []
-        calculator = CalculatorFactory.get_calculator(inst_type)
-        for sem, subjects in history.items():
-            sem_grades = []
-            for subj in subjects:
-                try:
-                    if subj.get('final_grade') is None:
-                        res = calculator.calculate(subj.get('grades', []))
-                        subj['final_grade'] = res.average
-                        subj['status_dict'] = res.to_dict()
-                    else:
-                        subj.pop('status_dict', None)
-                    logger.info(f"Final grade for '{subj.get('name')}': {subj.get('final_grade')} ({subj.get('status', '')})")
-                except Exception as e:
-                    logger.error(f"Failed to calculate history grades for {subj.get('name')}: {e}")
-                grade = subj.get('final_grade')
-                if grade is not None:
-                    sem_grades.append(grade)
-                    total_grades.append(grade)
-                    if grade > best_grade:
-                        best_grade = grade
-                        best_subject = subj.get('name')
-            sem_avg = sum(sem_grades) / len(sem_grades) if sem_grades else 0
-            if sem_grades:
-                semesters_data.append({'semester': sem, 'average': round(sem_avg, 2), 'count': len(sem_grades)})
-        general_avg = sum(total_grades) / len(total_grades) if total_grades else 0
-        if inst_data.get('general_average'):
-            general_avg = inst_data.get('general_average')
-            
-        final_data = {'general_average': round(general_avg, 4), 'best_subject': best_subject, 'best_grade': best_grade, 'semesters': semesters_data, 'history_raw': history}
-        if 'integration_percentage' in inst_data:
-            final_data['integration_percentage'] = inst_data['integration_percentage']
-        if 'error' in inst_data:
-            final_data['inst_error'] = inst_data['error']
-            final_data['inst_url'] = inst_data.get('url', '')
-            
-        if linked_account:
-            try:
-                cipher = get_cipher_suite()
-                json_str = json.dumps(final_data)
-                encrypted_data = cipher.encrypt(json_str.encode('utf-8')).decode('utf-8')
-                linked_account.history_json = encrypted_data
-                linked_account.history_updated_at = datetime.utcnow()
-                await g.db_session.commit()
-            except Exception as e:
-                logger.error(f'Cache encryption failed: {e}')
-        try:
-            cache_key = f"{session.get('user_id')}_{session.get('username')}_{session.get('sigaa_inst')}_profile"
-            await cache_set('profile', cache_key, final_data)
-            logger.info('Redis cache set for academic profile')
-        except Exception as e:
-            logger.error(f'Redis cache set failed: {e}')
+        if final_data is None:
+            return (jsonify({'error': 'No student bonds found'}), 404)
         return jsonify(final_data)
     except SigaaQuestionnaire as e:
         logger.warning(f'Profile error - questionnaire: {e}')
@@ -808,6 +783,14 @@ async def update_course(course_id):
         response_data = {'id': course_id, 'data': {'grades': raw_grades, 'status': course_result.to_dict()}}
         if freq_data:
             response_data['frequency'] = freq_data
+        turma_id = target.get('turma_id')
+        sync_user = session.get('username')
+        if turma_id and sync_user:
+            try:
+                previous = await course_sync.load_snapshot(gateway.institution, sync_user, target.get('registration'), turma_id)
+                await course_sync.record_snapshot(gateway.institution, sync_user, target.get('registration'), turma_id, raw_grades, freq_data, previous)
+            except Exception as e:
+                logger.warning(f'Falha ao atualizar o snapshot da disciplina: {e}')
         return Response(json.dumps(response_data), mimetype='application/json')
     except SigaaQuestionnaire as e:
         logger.warning(f'Single update error - questionnaire: {e}')
@@ -824,6 +807,7 @@ async def stream_grades():
     if not session.get('sigaa_state'):
         return Response(json.dumps({'error': 'Unauthorized', 'session_expired': True}) + '\n', status=401, mimetype='application/x-ndjson')
     has_profile = request.args.get('has_profile') == '1'
+    full_sync = request.args.get('full') == '1'
     skip_ids = [int(x) for x in request.args.get('skip', '').split(',') if x.strip().isdigit()]
     inst_type = _inst_type()
     student_name = session.get('sigaa_name')
@@ -839,6 +823,8 @@ async def stream_grades():
         return Response(json.dumps({'error': 'Muitas requisições. Aguarde alguns segundos.', 'retry_after': int(retry_after) + 1}) + '\n', status=429, mimetype='application/x-ndjson')
     if active_account_id and linked_account is None:
         logger.warning('active_account_id existe na sessão mas não no banco.')
+    if linked_account:
+        _fire_and_forget(record_activity(linked_account.id))
     cached_profile = None
     if linked_account and linked_account.history_json and (not has_profile):
         try:
@@ -847,6 +833,7 @@ async def stream_grades():
             cached_profile = json.loads(decrypted)
         except Exception as e:
             logger.warning(f'Failed to load cached history: {e}')
+    cached_portal = profile_service.load_portal(linked_account)
     credentials = None
     if linked_account:
         try:
@@ -892,7 +879,7 @@ async def stream_grades():
 
     async def _login_worker_gateway():
         try:
-            return await SigaaGateway.login(worker_url, sigaa_inst_val, worker_username, worker_password, credentials={'username': worker_username, 'password': worker_password}, keep_session=True)
+            return await SigaaGateway.lease_worker(worker_url, sigaa_inst_val, worker_username, worker_password, credentials={'username': worker_username, 'password': worker_password})
         except Exception as e:
             logger.error(f'SIGAA: pré-login de worker falhou no stream_grades: {e}')
             return None
@@ -902,12 +889,14 @@ async def stream_grades():
         first_data_logged = []
         supporters_task = asyncio.create_task(get_supporters_task())
         prewarmed = []
-        if worker_password:
+        if worker_password and (not gateway.batch_details):
             try:
                 expected = int(expected_count or 0) - len(skip_ids)
             except (TypeError, ValueError):
                 expected = 0
-            n_pre = min(10, expected) - 1 if expected > 1 else 0
+            await latency_controller().refresh(sigaa_inst_val)
+            warm = SigaaGateway.warm_workers(worker_url, sigaa_inst_val, worker_username, worker_password)
+            n_pre = latency_controller().plan_workers(sigaa_inst_val, expected, warm=warm) - 1 if expected > 1 else 0
             prewarmed.extend((asyncio.create_task(_login_worker_gateway()) for _ in range(n_pre)))
             if n_pre:
                 logger.info(f'SIGAA stream: pré-aquecendo {n_pre} workers em paralelo com a enumeração.')
@@ -915,6 +904,11 @@ async def stream_grades():
             injected_profile = await _inject_exigencia_medias(sigaa_inst_val, cached_profile)
             yield (json.dumps({'type': 'profile_data', 'data': injected_profile}) + '\n')
             logger.info('SIGAA: Emitted cached history_json for instant UI rendering.')
+        if cached_portal and cached_portal.get('courses') and (not skip_ids):
+            # Retrato provisório da última carga; os eventos ao vivo sobrescrevem o que mudou.
+            yield (json.dumps({'type': 'portal_snapshot', 'saved_at': cached_portal.get('saved_at'), 'courses': cached_portal['courses']}) + '\n')
+        portal_courses = {}
+        cached_by_turma = {c['turma_id']: c for c in (cached_portal or {}).get('courses') or [] if c.get('turma_id') and c.get('data')}
         try:
             async with gateway.scope():
                 all_bonds = await gateway.get_bonds()
@@ -932,6 +926,7 @@ async def stream_grades():
                     _fire_and_forget(cache_set('sync_meta', count_key, len(listing), ttl=_SYNC_META_TTL))
                     yield (json.dumps({'type': 'sync_start', 'total_courses': len(listing)}) + '\n')
                     for item in listing:
+                        portal_courses[item['id']] = {'id': item['id'], 'name': item['title'], 'obs': item['program'], 'turma_id': item.get('turma_id'), 'data': None, 'frequency': None}
                         yield (json.dumps({'type': 'course_start', 'id': item['id'], 'name': item['title'], 'obs': item['program']}) + '\n')
                     raw_password = worker_password
                     for bond in bonds_to_use:
@@ -943,6 +938,27 @@ async def stream_grades():
                                 yield (json.dumps({'type': 'course_skipped', 'id': item['id']}) + '\n')
                             else:
                                 pending.append((bond_id, item))
+                        snapshots = {}
+                        if pending and worker_username:
+                            loaded = await asyncio.gather(*(course_sync.load_snapshot(sigaa_inst_val, worker_username, item.get('registration'), item.get('turma_id')) for _, item in pending), return_exceptions=True)
+                            snapshots = {item['id']: snap for (_, item), snap in zip(pending, loaded) if isinstance(snap, dict)}
+                        if not full_sync and snapshots:
+                            now = time.time()
+                            still_pending = []
+                            for entry in pending:
+                                item = entry[1]
+                                snap = snapshots.get(item['id'])
+                                cached = cached_by_turma.get(item.get('turma_id'))
+                                # Só vale se o retrato salvo for o mesmo que gerou o hash.
+                                if snap is None or course_sync.is_due(snap, now) or not cached or not course_sync.matches(snap, (cached.get('data') or {}).get('grades'), cached.get('frequency')):
+                                    still_pending.append(entry)
+                                    continue
+                                portal_courses[item['id']].update(data=cached['data'], frequency=cached.get('frequency'))
+                                yield (json.dumps({'type': 'course_cached', 'id': item['id'], 'data': cached['data'], 'frequency': cached.get('frequency'), 'checked_at': snap.get('checked_at')}) + '\n')
+                                yield (json.dumps({'type': 'course_loading', 'id': item['id'], 'step': 'done'}) + '\n')
+                            if len(still_pending) != len(pending):
+                                logger.info(f'SIGAA stream: {len(pending) - len(still_pending)} disciplinas servidas do snapshot, {len(still_pending)} a atualizar.')
+                            pending = still_pending
                         if not pending:
                             continue
                         work_queue = asyncio.Queue()
@@ -950,24 +966,36 @@ async def stream_grades():
                             work_queue.put_nowait(entry)
                         out_queue = asyncio.Queue()
 
-                        async def process_item(gw, b_id, item, out_queue=out_queue):
+                        async def process_item(gw, b_id, item, out_queue=out_queue, snapshots=snapshots, details=None):
                             c_id = item['id']
-                            await out_queue.put({'type': 'course_loading', 'id': c_id, 'step': 'notas'})
+                            if details is None:
+                                await out_queue.put({'type': 'course_loading', 'id': c_id, 'step': 'notas'})
                             try:
                                 turma_id = item.get('turma_id')
                                 cached_prof = None
                                 if turma_id:
-                                    cached_prof = await cache_get('prof', f'{sigaa_inst_val}:{turma_id}')
-                                details = await gw.get_course_details(b_id, item['course_id'], skip_professor=bool(cached_prof))
+                                    cached_prof = await professor_directory.lookup(sigaa_inst_val, turma_id)
+                                if details is None:
+                                    fetch = lambda: gw.get_course_details(b_id, item['course_id'], skip_professor=bool(cached_prof))
+                                    if turma_id and worker_username:
+                                        # Duas abas abertas pedem a mesma turma: um scrape só.
+                                        details = await get_singleflight().do(SingleFlight.key(sigaa_inst_val, worker_username, f'course:{turma_id}:{int(bool(cached_prof))}'), fetch)
+                                    else:
+                                        details = await fetch()
+                                elif isinstance(details, Exception):
+                                    raise details
                                 raw_grades = details.get('grades') or []
                                 freq_data = details.get('frequency')
                                 course_result = calculator.calculate(raw_grades)
                                 prof = cached_prof or details.get('professor')
                                 if turma_id and (not cached_prof) and prof and (prof != 'Desconhecido'):
-                                    _fire_and_forget(cache_set('prof', f'{sigaa_inst_val}:{turma_id}', prof, ttl=_PROFESSOR_TTL))
+                                    _fire_and_forget(professor_directory.record(sigaa_inst_val, prof, turma_id))
                                 review_name = details.get('review_name') or item['title']
                                 exigencia = await _get_single_media(sigaa_inst_val, review_name, prof)
                                 result_data = {'grades': raw_grades, 'status': course_result.to_dict(), 'professor': prof, 'exigencia_media': exigencia, 'review_name': review_name, 'code': details.get('code'), 'turma_id': turma_id, 'schedule_code': item.get('schedule_code')}
+                                if turma_id and worker_username:
+                                    _fire_and_forget(course_sync.record_snapshot(sigaa_inst_val, worker_username, item.get('registration'), turma_id, raw_grades, freq_data, snapshots.get(c_id)))
+                                portal_courses[c_id].update(data=result_data, frequency=freq_data)
                                 await out_queue.put({'type': 'course_data', 'id': c_id, 'data': result_data})
                                 if not first_data_logged:
                                     first_data_logged.append(True)
@@ -990,13 +1018,27 @@ async def stream_grades():
                                     break
                                 await process_item(gw, b_id, item)
 
+                        async def consume_batch(gw, bond_id=bond_id, pending=pending, out_queue=out_queue):
+                            by_course = {item['course_id']: (b_id, item) for b_id, item in pending}
+                            for _, item in pending:
+                                await out_queue.put({'type': 'course_loading', 'id': item['id'], 'step': 'notas'})
+                            try:
+                                async for course_id, details in gw.iter_course_details(bond_id, list(by_course)):
+                                    entry = by_course.pop(course_id, None)
+                                    if entry is not None:
+                                        await process_item(gw, entry[0], entry[1], details=details)
+                            except Exception as e:
+                                logger.warning(f'SIGAA stream: lote de disciplinas interrompido ({e}); {len(by_course)} seguem uma a uma.')
+                            for b_id, item in by_course.values():
+                                await process_item(gw, b_id, item)
+
                         async def extra_worker():
                             w_gateway = None
                             try:
                                 if prewarmed:
                                     w_gateway = await prewarmed.pop(0)
                                 if w_gateway is None:
-                                    w_gateway = await SigaaGateway.login(worker_url, sigaa_inst_val, worker_username, raw_password, credentials={'username': worker_username, 'password': raw_password}, keep_session=True)
+                                    w_gateway = await SigaaGateway.lease_worker(worker_url, sigaa_inst_val, worker_username, raw_password, credentials={'username': worker_username, 'password': raw_password})
                                 async with w_gateway.scope():
                                     await consume(w_gateway)
                             except Exception as e:
@@ -1008,9 +1050,15 @@ async def stream_grades():
                                     except Exception:
                                         pass
                                     await w_gateway.close()
-                        n_extra = min(10, len(pending)) - 1 if raw_password and len(pending) > 1 else 0
-                        tasks = [asyncio.create_task(consume(gateway))]
-                        tasks.extend((asyncio.create_task(extra_worker()) for _ in range(n_extra)))
+                        if gateway.batch_details and len(pending) > 1:
+                            logger.info(f'SIGAA stream: {len(pending)} disciplinas em uma tarefa remota.')
+                            tasks = [asyncio.create_task(consume_batch(gateway))]
+                        else:
+                            warm = len(prewarmed) + SigaaGateway.warm_workers(worker_url, sigaa_inst_val, worker_username, raw_password)
+                            n_extra = latency_controller().plan_workers(sigaa_inst_val, len(pending), warm=warm) - 1 if raw_password and len(pending) > 1 else 0
+                            logger.info(f'SIGAA stream: {len(pending)} disciplinas, {n_extra} workers extras (latência {latency_controller().current(sigaa_inst_val)}).')
+                            tasks = [asyncio.create_task(consume(gateway))]
+                            tasks.extend((asyncio.create_task(extra_worker()) for _ in range(n_extra)))
 
                         async def waiter(tasks=tasks, out_queue=out_queue):
                             await asyncio.gather(*tasks, return_exceptions=True)
@@ -1021,6 +1069,8 @@ async def stream_grades():
                             if evt is None:
                                 break
                             yield (json.dumps(evt) + '\n')
+                    if linked_account:
+                        _fire_and_forget(profile_service.persist_portal(linked_account.id, list(portal_courses.values()), previous=cached_portal))
                 yield (json.dumps({'type': 'sync_end'}) + '\n')
         except SigaaQuestionnaire as e:
             logger.warning(f'Stream blocked by questionnaire: {e}')
@@ -1109,6 +1159,26 @@ async def admin():
         user_list.append({'id': u.id, 'name': u.name if u.name else 'Usuário Anônimo', 'accounts': accounts})
     return await render_template('admin.html', user=user, stats=stats, user_list=user_list, configs=configs)
 
+@bp.route('/admin/sigaa_budget')
+async def admin_sigaa_budget():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    user = await g.db_session.get(User, session['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Forbidden'}), 403
+    from .sigaa_budget import get_budget
+    return jsonify({'hosts': get_budget().stats()})
+
+@bp.route('/admin/cache_stats')
+async def admin_cache_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    user = await g.db_session.get(User, session['user_id'])
+    if not user or not user.is_admin:
+        return jsonify({'error': 'Forbidden'}), 403
+    from .cache import stats as cache_stats
+    return jsonify(cache_stats())
+
 @bp.route('/admin/avaliacoes')
 async def admin_avaliacoes():
     if 'user_id' not in session:
@@ -1272,6 +1342,7 @@ async def api_matricula_status():
             _save_gateway(gateway)
             levels = result.get('levels', [])
             institution = session.get('sigaa_inst') or 'UFAL'
+            professor_directory.record_enrollment(institution, levels)
             levels = await _inject_medias_into_levels(levels, institution)
             return jsonify({'is_dev': False, 'levels': levels, 'view_state': result.get('view_state'), 'status': 'success'})
         except SigaaSessionExpired:
@@ -1650,8 +1721,11 @@ async def delete_account():
         if not user:
             session.clear()
             return redirect(url_for('main.login'))
+        accounts = [(a.institution, a.username) for a in user.linked_accounts]
         await s.delete(user)
         await s.commit()
+    for institution, username in accounts:
+        await profile_service.forget_account(user_id, institution, username)
     session.clear()
     return redirect(url_for('main.login'))
 
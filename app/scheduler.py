@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from .sigaa_api.env import env_float
+logger = logging.getLogger(__name__)
+
+def _parse_window(raw: str):
+    """'1-6' -> (1, 6); '22-5' passa da meia-noite; vazio = qualquer hora."""
+    if not (raw or '').strip():
+        return None
+    try:
+        start, _, end = raw.partition('-')
+        return (int(start) % 24, int(end) % 24)
+    except ValueError:
+        logger.warning('SIGAA_REFRESH_WINDOW inválido (%r); usando 1-6.', raw)
+        return (1, 6)
+ENABLED = os.environ.get('SIGAA_REFRESH_ENABLED', '0') == '1'
+TICK_SECONDS = env_float('SIGAA_REFRESH_TICK', 600)
+WINDOW = _parse_window(os.environ.get('SIGAA_REFRESH_WINDOW', '1-6'))
+UTC_OFFSET = env_float('SIGAA_REFRESH_UTC_OFFSET', -3)
+REFRESH_AFTER = timedelta(hours=env_float('SIGAA_REFRESH_AFTER_HOURS', 48))
+ACTIVE_DAYS = env_float('SIGAA_REFRESH_ACTIVE_DAYS', 14)
+BATCH = int(env_float('SIGAA_REFRESH_BATCH', 20))
+PER_INSTITUTION = int(env_float('SIGAA_REFRESH_CONCURRENCY', 2))
+FAILURE_BACKOFF = 24 * 3600
+ACTIVITY_KEY = 'sigaa:refresh:activity'
+LEADER_KEY = 'sigaa:refresh:leader'
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+async def record_activity(account_id):
+    """Marca a conta como ativa agora; o agendador atualiza primeiro quem usou o painel há menos tempo."""
+    if not account_id:
+        return
+    from .cache import client
+    try:
+        await client.zadd(ACTIVITY_KEY, {str(account_id): time.time()})
+    except Exception as exc:
+        logger.debug(f'Agendador: falha ao registrar atividade da conta {account_id}: {exc}')
+
+class RefreshScheduler:
+
+    def __init__(self):
+        self._token = uuid.uuid4().hex
+        self._leader = False
+        self._task = None
+        self._gates: dict[str, asyncio.Semaphore] = {}
+        self._renew = None
+        self._release = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @staticmethod
+    def in_window(now: datetime=None) -> bool:
+        if WINDOW is None:
+            return True
+        hour = ((now or datetime.utcnow()) + timedelta(hours=UTC_OFFSET)).hour
+        start, end = WINDOW
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    async def _run(self):
+        await asyncio.sleep(random.uniform(0, min(TICK_SECONDS, 60)))
+        while True:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f'Agendador: rodada falhou: {exc}', exc_info=True)
+            await asyncio.sleep(TICK_SECONDS * random.uniform(0.9, 1.1))
+
+    async def _extend(self, ttl) -> bool:
+        from .cache import client
+        if self._renew is None:
+            self._renew = client.register_script(_RENEW_LUA)
+        return bool(await self._renew(keys=[LEADER_KEY], args=[self._token, ttl]))
+
+    async def _lead(self) -> bool:
+        from .cache import client
+        ttl = int(TICK_SECONDS * 3)
+        try:
+            if self._leader:
+                self._leader = await self._extend(ttl)
+            if not self._leader:
+                self._leader = bool(await client.set(LEADER_KEY, self._token, nx=True, ex=ttl))
+                if self._leader:
+                    logger.info('Agendador: este processo assumiu as atualizações em segundo plano.')
+        except Exception as exc:
+            logger.debug(f'Agendador: Redis indisponível ({exc}); rodada ignorada.')
+            self._leader = False
+        return self._leader
+
+    async def _hold(self):
+        # Uma rodada pode durar mais que o TTL do lock: renova enquanto ela corre
+        # e retorna assim que o lock deixa de ser nosso.
+        ttl = int(TICK_SECONDS * 3)
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if not await self._extend(ttl):
+                    self._leader = False
+                    return
+            except Exception as exc:
+                logger.debug(f'Agendador: falha ao renovar o lock ({exc}).')
+
+    async def _tick(self):
+        if not self.in_window() or not await self._lead():
+            return
+        due = await self._due_accounts()
+        if not due:
+            return
+        spread = TICK_SECONDS * 0.8
+        logger.info(f'Agendador: {len(due)} contas com histórico vencido; distribuindo ao longo de {spread:.0f}s.')
+        work = asyncio.ensure_future(asyncio.gather(*(self._refresh_later(account_id, institution, random.uniform(0, spread)) for account_id, institution in due)))
+        hold = asyncio.ensure_future(self._hold())
+        try:
+            await asyncio.wait({work, hold}, return_when=asyncio.FIRST_COMPLETED)
+            if work.done():
+                work.result()
+            else:
+                logger.warning('Agendador: lock perdido no meio da rodada; as contas restantes ficam para o próximo líder.')
+        finally:
+            work.cancel()
+            hold.cancel()
+            await asyncio.gather(work, hold, return_exceptions=True)
+
+    async def _due_accounts(self):
+        from sqlalchemy import select
+        from .cache import client
+        from .extensions import db_session
+        from .models import LinkedAccount
+        since = time.time() - ACTIVE_DAYS * 86400
+        await client.zremrangebyscore(ACTIVITY_KEY, '-inf', since)
+        ranked = [int(m) for m in await client.zrevrangebyscore(ACTIVITY_KEY, '+inf', since) if str(m).isdigit()]
+        if not ranked:
+            return []
+        failed = await client.mget([f'sigaa:refresh:failed:{account_id}' for account_id in ranked])
+        ranked = [account_id for account_id, flag in zip(ranked, failed) if not flag]
+        cutoff = datetime.utcnow() - REFRESH_AFTER
+        async with db_session() as db:
+            rows = (await db.execute(select(LinkedAccount.id, LinkedAccount.institution, LinkedAccount.history_updated_at).where(LinkedAccount.id.in_(ranked)))).all()
+        stale = {row.id: row.institution for row in rows if row.history_updated_at is None or row.history_updated_at < cutoff}
+        return [(account_id, stale[account_id]) for account_id in ranked if account_id in stale][:BATCH]
+
+    def _gate(self, institution: str) -> asyncio.Semaphore:
+        key = (institution or '').upper()
+        if key not in self._gates:
+            self._gates[key] = asyncio.Semaphore(max(1, PER_INSTITUTION))
+        return self._gates[key]
+
+    async def _refresh_later(self, account_id, institution, delay):
+        await asyncio.sleep(delay)
+        if not self.in_window():
+            return
+        async with self._gate(institution):
+            await self.refresh(account_id)
+
+    async def refresh(self, account_id):
+        from . import profile_service
+        from .cache import client
+        from .domain.factory import CalculatorFactory
+        from .extensions import db_session
+        from .models import LinkedAccount
+        from .sigaa_api.enums import InstitutionType
+        from .sigaa_gateway import SigaaGateway, SigaaLoginFailed, SigaaQuestionnaire, institution_url
+        from .singleflight import get_singleflight
+        async with db_session() as db:
+            account = await db.get(LinkedAccount, account_id)
+            if account is None or profile_service.is_fresh(account, REFRESH_AFTER):
+                return
+            institution = (account.institution or '').upper()
+            username = account.username
+            user_id = account.user_id
+            password = account.get_password()
+            cached = profile_service.load_profile(account) or {}
+        if not password:
+            return
+        try:
+            calculator = CalculatorFactory.get_calculator(InstitutionType[institution])
+        except KeyError:
+            calculator = CalculatorFactory.get_calculator(InstitutionType.IFAL)
+        gateway = None
+        started = time.monotonic()
+        try:
+            gateway = await SigaaGateway.login(institution_url(institution), institution, username, password, credentials={'username': username, 'password': password})
+            key = profile_service.cache_key(user_id, username, institution)
+            # Só o histórico: o retrato do semestre (portal_cache_json) custaria uma
+            # visita por disciplina e o stream refaz todas elas de qualquer forma.
+            await get_singleflight().do(profile_service.flight_key(institution, username, account_id), lambda: profile_service.fetch_profile(gateway, account_id, key, cached.get('history_raw'), calculator))
+            logger.info(f'Agendador: histórico da conta {account_id} atualizado em {time.monotonic() - started:.1f}s.')
+        except (SigaaLoginFailed, SigaaQuestionnaire) as exc:
+            logger.info(f'Agendador: conta {account_id} ignorada por {FAILURE_BACKOFF // 3600}h ({type(exc).__name__}).')
+            await self._mark_failed(client, account_id, FAILURE_BACKOFF)
+        except Exception as exc:
+            logger.warning(f'Agendador: falha ao atualizar a conta {account_id}: {exc}')
+            await self._mark_failed(client, account_id, int(TICK_SECONDS * 3))
+        finally:
+            if gateway is not None:
+                await gateway.logout()
+
+    @staticmethod
+    async def _mark_failed(client, account_id, ttl):
+        try:
+            await client.set(f'sigaa:refresh:failed:{account_id}', '1', ex=ttl)
+        except Exception:
+            pass
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+            self._task = None
+        if self._leader:
+            from .cache import client
+            try:
+                if self._release is None:
+                    self._release = client.register_script(_RELEASE_LUA)
+                await self._release(keys=[LEADER_KEY], args=[self._token])
+            except Exception:
+                pass
+            self._leader = False
+_scheduler = None
+
+def get_scheduler() -> RefreshScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RefreshScheduler()
+    return _scheduler
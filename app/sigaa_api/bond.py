@@ -1,8 +1,9 @@
 from urllib.parse import urljoin
-from .exceptions import SigaaConnectionError
+from .exceptions import SigaaConnectionError, SigaaSessionExpired, SigaaViewExpired
 from .course import Course
 import re
 import logging
+import time
 logger = logging.getLogger(__name__)
 
 class StudentBond:
@@ -78,10 +79,7 @@ class StudentBond:
     def _parse_courses(self, page):
         courses = []
         try:
-            tables = page.soup.find_all('table')
-            for table in tables:
-                headers = table.find_all('th')
-                header_texts = [h.get_text(strip=True) for h in headers]
+            for table, header_texts, _ in page.index.tables:
                 is_course_table = any(('Componente' in h or 'Disciplina' in h for h in header_texts))
                 title_idx = -1
                 for i, h in enumerate(header_texts):
@@ -154,19 +152,22 @@ class StudentBond:
     MAX_CONCURRENT_SESSIONS = 5
     MAX_BATCH_SIZE = 4
     LOGIN_COST = 7
+    LEASE_COST = 1
     SCRAPE_COST = 4
 
-    def _compute_optimal_strategy(self, n_classes):
+    def _compute_optimal_strategy(self, n_classes, login_cost=None, scrape_cost=None, max_sessions=None):
         import math
-        S = self.MAX_CONCURRENT_SESSIONS
+        S = max_sessions or self.MAX_CONCURRENT_SESSIONS
+        login_cost = self.LOGIN_COST if login_cost is None else login_cost
+        scrape_cost = self.SCRAPE_COST if scrape_cost is None else scrape_cost
         if n_classes <= S:
-            return (1, n_classes, 1, self.LOGIN_COST + self.SCRAPE_COST)
+            return (1, n_classes, 1, login_cost + scrape_cost)
         best_b = 1
         best_time = float('inf')
         for b in range(1, min(n_classes, self.MAX_BATCH_SIZE) + 1):
             n_batches = math.ceil(n_classes / b)
             n_waves = math.ceil(n_batches / S)
-            estimated = n_waves * (self.LOGIN_COST + b * self.SCRAPE_COST)
+            estimated = n_waves * (login_cost + b * scrape_cost)
             if estimated < best_time:
                 best_time = estimated
                 best_b = b
@@ -175,6 +176,7 @@ class StudentBond:
         return (best_b, n_batches, n_waves, best_time)
 
     async def get_history(self, cached_history=None, credentials=None):
+        import asyncio
         try:
             logger.info('SIGAA: Starting get_history combining Official History and Turmas Anteriores...')
             page = None
@@ -186,40 +188,29 @@ class StudentBond:
                 if page is None:
                     logger.info('SIGAA: Accessing discente.jsf to ensure session context.')
                     page = await self.session.get('/sigaa/portais/discente/discente.jsf')
-            official_history = {}
-            action_data = self._extract_jscook_action_by_jsf_method(page, 'portalDiscente.boletim')
-            if not action_data:
-                action_data = self._extract_jscook_action_by_jsf_method(page, 'relatorioNotasAluno.gerarRelatorio')
-            if not action_data:
-                action_data = self._extract_jscook_action(page, 'Boletim')
-            if not action_data:
-                action_data = self._extract_jscook_action(page, 'Consultar Minhas Notas')
-            if not action_data:
-                action_data = self._extract_jscook_action_by_jsf_method(page, 'portalDiscente.historico')
-            if not action_data:
-                action_data = self._extract_jscook_action(page, 'Consultar Histórico Escolar')
-            if not action_data:
-                action_data = self._extract_jscook_action(page, 'Emitir Histórico')
-            if action_data:
-                logger.info(f"SIGAA: Found Official History action: {action_data['action_url']}")
-                try:
-                    history_page = await self.session.post(action_data['action_url'], data=action_data['post_values'])
-                    official_history = self._parse_bulletin(history_page)
-                    logger.info(f'SIGAA: Parsed Official History with {len(official_history)} semesters.')
-                except Exception as e:
-                    logger.error(f'SIGAA: Failed to fetch Official History: {e}')
-            page = await self.session.get('/sigaa/portais/discente/discente.jsf')
+            # The bulletin POST and the turmas.jsf GET only depend on the portal
+            # page; with a warm pooled session they run side by side, each in
+            # its own JSF state.
+            if self._warm_session_available(credentials):
+                official_history, turmas_page = await asyncio.gather(self._fetch_official_history(page), self._fetch_pooled(credentials, '/sigaa/portais/discente/turmas.jsf'))
+            else:
+                official_history = await self._fetch_official_history(page)
+                turmas_page = None
+            if turmas_page is None:
+                turmas_page = await self.session.get('/sigaa/portais/discente/turmas.jsf')
             active_courses = self._parse_courses(page)
             active_course_titles = {c.title for c in active_courses}
             actual_current_semester = None
             if page and hasattr(page, 'body') and page.body:
-                import re
                 actual_semester_match = re.search('Semestre atual:\\s*<strong[^>]*>(\\d{4}\\.\\d)</strong>', page.body)
                 if actual_semester_match:
                     actual_current_semester = actual_semester_match.group(1)
-            turmas_page = await self.session.get('/sigaa/portais/discente/turmas.jsf')
             failed_official = not official_history
-            detailed_history = await self._parse_previous_classes(turmas_page, cached_history, credentials, active_course_titles, actual_current_semester, fetch_grades=failed_official)
+            scraped = set()
+            detailed_history = await self._parse_previous_classes(turmas_page, cached_history, credentials, active_course_titles, actual_current_semester, fetch_grades=failed_official, scraped=scraped)
+            # Only classes scraped in this run whose final status and grade the
+            # bulletin confirmed may go to the archive.
+            confirmed = {}
             for sem, subjects in detailed_history.items():
                 if sem in official_history:
                     for subj in subjects:
@@ -233,6 +224,8 @@ class StudentBond:
                                     subj['status'] = off_subj['status']
                                 if off_subj.get('absences') is not None:
                                     subj['absences'] = off_subj['absences']
+                                if id(subj) in scraped and off_subj.get('status') and off_subj.get('final_grade') is not None:
+                                    confirmed.setdefault(sem, []).append(subj)
                                 break
             final_history = detailed_history if detailed_history else official_history or {}
             overlap_sem = None
@@ -245,12 +238,74 @@ class StudentBond:
                         break
             if overlap_sem:
                 del final_history[overlap_sem]
+            archive = credentials.get('archive') if credentials else None
+            if archive is not None and confirmed:
+                try:
+                    archive.save(self.registration, confirmed, skip_semesters={overlap_sem, actual_current_semester})
+                except Exception as e:
+                    logger.warning(f'SIGAA: history archive save failed: {e}')
             return final_history
         except Exception as e:
             logger.error(f'Get history error: {e}', exc_info=True)
             return {}
 
-    async def _parse_previous_classes(self, page, cached_history=None, credentials=None, active_course_titles=None, actual_current_semester=None, fetch_grades=False):
+    async def _fetch_official_history(self, page):
+        action_data = self._extract_jscook_action_by_jsf_method(page, 'portalDiscente.boletim')
+        if not action_data:
+            action_data = self._extract_jscook_action_by_jsf_method(page, 'relatorioNotasAluno.gerarRelatorio')
+        if not action_data:
+            action_data = self._extract_jscook_action(page, 'Boletim')
+        if not action_data:
+            action_data = self._extract_jscook_action(page, 'Consultar Minhas Notas')
+        if not action_data:
+            action_data = self._extract_jscook_action_by_jsf_method(page, 'portalDiscente.historico')
+        if not action_data:
+            action_data = self._extract_jscook_action(page, 'Consultar Histórico Escolar')
+        if not action_data:
+            action_data = self._extract_jscook_action(page, 'Emitir Histórico')
+        if not action_data:
+            return {}
+        logger.info(f"SIGAA: Found Official History action: {action_data['action_url']}")
+        try:
+            history_page = await self.session.post(action_data['action_url'], data=action_data['post_values'])
+            official_history = self._parse_bulletin(history_page)
+            logger.info(f'SIGAA: Parsed Official History with {len(official_history)} semesters.')
+            return official_history
+        except Exception as e:
+            logger.error(f'SIGAA: Failed to fetch Official History: {e}')
+            return {}
+
+    def _warm_session_available(self, credentials):
+        if not credentials:
+            return False
+        from .session_pool import get_session_pool
+        return get_session_pool().idle_count(credentials['url'], credentials['inst_type'], credentials['username'], credentials['password'], bond_url=self.switch_url) > 0
+
+    async def _fetch_pooled(self, credentials, path):
+        """GETs ``path`` on a leased pooled session; None if that fails, so the
+        caller can fall back to its own session. The GET itself tells whether
+        the session is still alive, so the lease skips the pool's probe."""
+        from .session_pool import get_session_pool
+        pool = get_session_pool()
+        try:
+            lease = await pool.acquire(credentials['url'], credentials['inst_type'], credentials['username'], credentials['password'], bond_url=self.switch_url, probe=False)
+        except Exception as e:
+            logger.warning(f'SIGAA: Could not lease a pooled session for {path}: {e}')
+            return None
+        discard = False
+        try:
+            page = await lease.sigaa.session.get(path)
+            if page.is_login_page:
+                raise SigaaSessionExpired('SIGAA: Pooled session expired.')
+            return page
+        except Exception as e:
+            discard = True
+            logger.warning(f'SIGAA: Pooled GET of {path} failed: {e}')
+            return None
+        finally:
+            await pool.release(lease, discard=discard)
+
+    async def _parse_previous_classes(self, page, cached_history=None, credentials=None, active_course_titles=None, actual_current_semester=None, fetch_grades=False, scraped=None):
         history = {}
         classes_to_fetch = []
         try:
@@ -259,6 +314,10 @@ class StudentBond:
                 logger.info("SIGAA: No 'listagem' tables found, trying 'tabelaRelatorio'.")
                 tables = page.soup.find_all('table', class_='tabelaRelatorio')
             logger.info(f'SIGAA: Found {len(tables)} tables to parse for Turmas Anteriores.')
+            reusable = await self._load_archive(credentials)
+            for sem, subjects in (cached_history or {}).items():
+                for c_subj in subjects or []:
+                    reusable.setdefault((sem, c_subj.get('name')), c_subj)
             latest_semester = None
             for table_idx, table in enumerate(tables):
                 rows = table.find_all('tr')
@@ -308,32 +367,42 @@ class StudentBond:
                         continue
                     if row_status is None:
                         row_status = 'Concluído'
-                    can_reuse = False
-                    if cached_history and current_semester in cached_history:
-                        for c_subj in cached_history[current_semester]:
-                            if c_subj.get('name') == title:
-                                if row_status not in ['Matriculado', 'Cursando', 'Indefinido']:
-                                    if current_semester not in history:
-                                        history[current_semester] = []
-                                    history[current_semester].append(c_subj)
-                                    can_reuse = True
-                                    break
-                    if can_reuse:
+                    c_subj = reusable.get((current_semester, title))
+                    if c_subj is not None and row_status not in ['Matriculado', 'Cursando', 'Indefinido']:
+                        history.setdefault(current_semester, []).append(c_subj)
                         logger.info(f"SIGAA: Reusing cached details for '{title}' in {current_semester}.")
                         continue
-                    classes_to_fetch.append({'title': title, 'js_code': js_code, 'schedule_code': schedule_code, 'row_status': row_status, 'semester': current_semester})
+                    classes_to_fetch.append({'title': title, 'js_code': js_code, 'schedule_code': schedule_code, 'row_status': row_status, 'semester': current_semester, 'turma_id': (form_data.get('post_values') or {}).get('idTurma')})
+            directory = credentials.get('professors') if credentials else None
+            if classes_to_fetch and directory is not None and (not fetch_grades):
+                classes_to_fetch = await self._apply_known_professors(directory, classes_to_fetch, history)
             if classes_to_fetch:
                 if credentials:
                     import asyncio
+                    from .session_pool import get_session_pool
                     n = len(classes_to_fetch)
-                    batch_size, n_batches, n_waves, est_time = self._compute_optimal_strategy(n)
+                    max_sessions = credentials.get('max_sessions') or self.MAX_CONCURRENT_SESSIONS
+                    warm = get_session_pool().idle_count(credentials['url'], credentials['inst_type'], credentials['username'], credentials['password'], bond_url=self.switch_url)
+                    login_cost = self.LEASE_COST if warm >= min(n, max_sessions) else credentials.get('login_cost')
+                    batch_size, n_batches, n_waves, est_time = self._compute_optimal_strategy(n, login_cost=login_cost, scrape_cost=credentials.get('scrape_cost'), max_sessions=max_sessions)
                     batches = [classes_to_fetch[i:i + batch_size] for i in range(0, n, batch_size)]
-                    logger.info(f'SIGAA: Strategy computed → {n} classes, batch_size={batch_size}, batches={n_batches}, waves={n_waves}, est_time≈{est_time}s')
-                    semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_SESSIONS)
+                    logger.info(f'SIGAA: Strategy computed → {n} classes, batch_size={batch_size}, batches={n_batches}, waves={n_waves}, sessions={max_sessions}, est_time≈{est_time:.1f}s')
+                    semaphore = asyncio.Semaphore(max_sessions)
+                    progress = credentials.get('progress')
+                    outstanding = {}
+                    for c_info in classes_to_fetch:
+                        outstanding.setdefault(c_info['semester'], []).append(c_info)
+                    report = {'fetched': {}, 'sent': set()}
+                    if progress:
+                        self._report_progress(progress, history, outstanding, report, n)
 
                     async def bounded_fetch_batch(batch):
                         async with semaphore:
-                            return await self._fetch_batch_parallel(credentials, batch)
+                            result = await self._fetch_batch_parallel(credentials, batch)
+                        if progress:
+                            report['fetched'].update(((id(c_info), subj) for c_info, subj in result))
+                            self._report_progress(progress, history, outstanding, report, n)
+                        return result
                     tasks = [bounded_fetch_batch(b) for b in batches]
                     batch_results = await asyncio.gather(*tasks, return_exceptions=True)
                     for batch, result in zip(batches, batch_results):
@@ -343,7 +412,7 @@ class StudentBond:
                                 sem = c_info['semester']
                                 if sem not in history:
                                     history[sem] = []
-                                history[sem].append({'name': c_info['title'], 'final_grade': 0.0, 'absences': 0, 'status': c_info['row_status'], 'grades': [], 'professor': 'Desconhecido'})
+                                history[sem].append(self._placeholder_subject(c_info))
                         else:
                             for c_info, subj_result in result:
                                 sem = c_info['semester']
@@ -351,9 +420,11 @@ class StudentBond:
                                     history[sem] = []
                                 if isinstance(subj_result, Exception):
                                     logger.error(f"SIGAA: Parallel fetch failed for '{c_info['title']}': {subj_result}")
-                                    history[sem].append({'name': c_info['title'], 'final_grade': 0.0, 'absences': 0, 'status': c_info['row_status'], 'grades': [], 'professor': 'Desconhecido'})
+                                    history[sem].append(self._placeholder_subject(c_info))
                                 else:
                                     history[sem].append(subj_result)
+                                    if scraped is not None:
+                                        scraped.add(id(subj_result))
                 else:
                     logger.warning('SIGAA: No credentials provided, falling back to sequential fetch.')
                     for c_info in classes_to_fetch:
@@ -365,6 +436,8 @@ class StudentBond:
                             if sem not in history:
                                 history[sem] = []
                             history[sem].append(subj)
+                            if scraped is not None:
+                                scraped.add(id(subj))
                         except Exception as e:
                             logger.error(f"SIGAA: Sequential fetch failed for '{title}': {e}")
                         import asyncio
@@ -373,69 +446,163 @@ class StudentBond:
             logger.error(f'Parse previous classes error: {e}')
         return history
 
+    async def _load_archive(self, credentials):
+        """{(semester, title): subject} of finished classes archived for this
+        registration; they are reused like cached_history entries."""
+        archive = credentials.get('archive') if credentials else None
+        if archive is None:
+            return {}
+        try:
+            return await archive.load(self.registration)
+        except Exception as e:
+            logger.warning(f'SIGAA: history archive lookup failed: {e}')
+            return {}
+
+    async def _apply_known_professors(self, directory, classes, history):
+        """Fills in classes whose professor the directory already knows, so
+        their participants page is never opened; returns the rest."""
+        try:
+            names = await directory.lookup_many([(c['turma_id'], c['title'], c['semester']) for c in classes])
+        except Exception as e:
+            logger.warning(f'SIGAA: professor directory lookup failed: {e}')
+            return classes
+        remaining = []
+        for c_info, name in zip(classes, names):
+            if name:
+                history.setdefault(c_info['semester'], []).append({'name': c_info['title'], 'final_grade': None, 'absences': None, 'status': c_info['row_status'], 'grades': [], 'professor': name})
+            else:
+                remaining.append(c_info)
+        if len(remaining) != len(classes):
+            logger.info(f'SIGAA: {len(classes) - len(remaining)} professors served from the directory, {len(remaining)} classes to fetch.')
+        return remaining
+
+    @staticmethod
+    def _placeholder_subject(c_info):
+        return {'name': c_info['title'], 'final_grade': 0.0, 'absences': 0, 'status': c_info['row_status'], 'grades': [], 'professor': 'Desconhecido'}
+
+    def _report_progress(self, progress, history, outstanding, state, total):
+        """Emits ``partial`` for each semester whose classes are all in, then a
+        ``progress`` count. Until the batches are merged ``history`` holds only
+        the cache-reused subjects, so a partial is those plus the fetched ones."""
+        try:
+            for sem in dict.fromkeys(list(history) + list(outstanding)):
+                pending = outstanding.get(sem, [])
+                if sem in state['sent'] or any((id(c) not in state['fetched'] for c in pending)):
+                    continue
+                subjects = list(history.get(sem, []))
+                for c_info in pending:
+                    subj = state['fetched'][id(c_info)]
+                    subjects.append(self._placeholder_subject(c_info) if isinstance(subj, Exception) else subj)
+                state['sent'].add(sem)
+                progress('partial', {'semester': sem, 'subjects': subjects})
+            progress('progress', {'done': len(state['fetched']), 'total': total})
+        except Exception as e:
+            logger.debug(f'SIGAA: progress callback failed: {e}')
+
     async def _fetch_batch_parallel(self, credentials, batch, fetch_grades=False):
-        from .sigaa import Sigaa
+        from .session_pool import get_session_pool
         username = credentials['username']
         password = credentials['password']
         url = credentials['url']
         inst_type = credentials['inst_type']
         titles = [c['title'] for c in batch]
-        sigaa = Sigaa(url, inst_type)
+        pool = get_session_pool()
         results = []
+        observe = credentials.get('observe')
+        directory = credentials.get('professors')
+        logger.info(f'Worker: Leasing pooled session for batch {titles}...')
+        started = time.monotonic()
         try:
-            logger.info(f'Worker: Logging in for batch {titles}...')
-            await sigaa.login(username, password)
-            if self.switch_url:
-                await sigaa.session.get(self.switch_url)
-            for idx, class_info in enumerate(batch):
+            lease = await pool.acquire(url, inst_type, username, password, bond_url=self.switch_url)
+        except Exception:
+            if observe:
+                observe('login', None, False)
+            raise
+        if observe and (not lease.reused):
+            observe('login', time.monotonic() - started, True)
+        sigaa = lease.sigaa
+        discard = False
+        wanted = {(c['semester'], c['title']) for c in batch}
+        index = None
+        try:
+            for class_info in batch:
+                started = time.monotonic()
                 try:
-                    turmas_page = await sigaa.session.get('/sigaa/portais/discente/turmas.jsf')
-                    target_js_code = None
-                    tables = turmas_page.soup.find_all('table', class_=['listagem', 'tabelaRelatorio'])
-                    for table in tables:
-                        rows = table.find_all('tr')
-                        current_sem = 'Unknown'
-                        for row in rows:
-                            text = row.get_text(strip=True)
-                            sem_match = re.search('(\\d{4}\\.\\d)', text)
-                            if sem_match:
-                                current_sem = sem_match.group(1)
-                                continue
-                            if current_sem != class_info['semester']:
-                                continue
-                            cells = row.find_all('td')
-                            row_title = 'Desconhecido'
-                            for cell in cells:
-                                t = cell.get_text(strip=True)
-                                if '-' in t and len(t) > 5 and (not t.replace('.', '').isdigit()):
-                                    row_title = t
-                                    break
-                            if row_title == class_info['title']:
-                                avancar_img = row.find('img', src=re.compile('avancar\\.gif'))
-                                if avancar_img:
-                                    link = avancar_img.find_parent('a')
-                                    if link and link.get('onclick'):
-                                        target_js_code = link['onclick']
+                    key = (class_info['semester'], class_info['title'])
+                    reloaded = index is None
+                    if reloaded:
+                        index = await self._load_turmas_index(sigaa.session, wanted)
+                    while True:
+                        form_data = index.get(key)
+                        if form_data is None and reloaded:
+                            raise ValueError(f"Class '{class_info['title']}' not found in worker session.")
+                        if form_data is not None:
+                            try:
+                                subj = await self._process_course_sync(class_info['title'], form_data, class_info['schedule_code'], class_info['row_status'], sigaa_session=sigaa.session, fetch_grades=fetch_grades, require_ava=True)
                                 break
-                        if target_js_code:
-                            break
-                    if not target_js_code:
-                        raise ValueError(f"Class '{class_info['title']}' not found in worker session.")
-                    form_data = turmas_page.parse_jsfcljs(target_js_code)
-                    subj = await self._process_course_sync(class_info['title'], form_data, class_info['schedule_code'], class_info['row_status'], sigaa_session=sigaa.session, fetch_grades=fetch_grades)
+                            except SigaaViewExpired:
+                                if reloaded:
+                                    raise
+                        # The view state behind the index expired (the class
+                        # was not entered); reload turmas.jsf and retry once.
+                        logger.info(f"Worker: Reloading turmas.jsf for '{class_info['title']}'.")
+                        index = await self._load_turmas_index(sigaa.session, wanted)
+                        reloaded = True
                     results.append((class_info, subj))
-                    if idx < len(batch) - 1:
-                        logger.info(f'Worker: Re-navigating for next class in batch (done {idx + 1}/{len(batch)}).')
+                    if directory is not None:
+                        directory.record(subj.get('professor'), class_info.get('turma_id'), class_info['title'], class_info['semester'])
+                    if observe:
+                        observe('scrape', time.monotonic() - started, True)
                 except Exception as e:
                     logger.error(f"Worker: Failed to fetch '{class_info['title']}' in batch: {e}")
                     results.append((class_info, e))
+                    if observe:
+                        observe('scrape', None, False)
+                    # Whatever failed may have left the session mid-navigation.
+                    discard = True
+        except BaseException:
+            discard = True
+            raise
         finally:
-            await sigaa.close()
+            await pool.release(lease, discard=discard)
         return results
 
-    async def _process_course_sync(self, title, form_data, schedule_code, row_status, sigaa_session=None, fetch_grades=False):
+    @staticmethod
+    async def _load_turmas_index(session, wanted):
+        """Loads turmas.jsf once and maps (semester, title) to the jsfcljs
+        form data of each class in ``wanted``, instead of rescanning the page
+        for every class in a batch."""
+        turmas_page = await session.get('/sigaa/portais/discente/turmas.jsf')
+        index = {}
+        for table in turmas_page.soup.find_all('table', class_=['listagem', 'tabelaRelatorio']):
+            current_sem = 'Unknown'
+            for row in table.find_all('tr'):
+                text = row.get_text(strip=True)
+                sem_match = re.search('(\\d{4}\\.\\d)', text)
+                if sem_match:
+                    current_sem = sem_match.group(1)
+                    continue
+                row_title = 'Desconhecido'
+                for cell in row.find_all('td'):
+                    t = cell.get_text(strip=True)
+                    if '-' in t and len(t) > 5 and (not t.replace('.', '').isdigit()):
+                        row_title = t
+                        break
+                key = (current_sem, row_title)
+                if key not in wanted or key in index:
+                    continue
+                avancar_img = row.find('img', src=re.compile('avancar\\.gif'))
+                link = avancar_img.find_parent('a') if avancar_img else None
+                if link and link.get('onclick'):
+                    try:
+                        index[key] = turmas_page.parse_jsfcljs(link['onclick'])
+                    except Exception as e:
+                        logger.warning(f"Worker: Failed to parse jsfcljs for '{row_title}': {e}")
+        return index
+
+    async def _process_course_sync(self, title, form_data, schedule_code, row_status, sigaa_session=None, fetch_grades=False, require_ava=False):
         session = sigaa_session or self.session
-        course = Course(session, title, form_data, schedule_code)
+        course = Course(session, title, form_data, schedule_code, require_ava=require_ava)
         if not fetch_grades:
             grades, frequency, professor = await course.get_professor_only()
             logger.info(f"SIGAA: Fetched professor for '{title}'.")
@@ -477,7 +644,7 @@ class StudentBond:
 
     def _extract_jscook_action(self, page, label):
         try:
-            form = page.soup.find('form', id=re.compile('menu:form_menu_discente|menuForm'))
+            form = page.index.find_form('menu:form_menu_discente|menuForm')
             if not form:
                 form = page.soup.find('input', attrs={'name': 'jscook_action'})
                 if form:
@@ -507,7 +674,7 @@ class StudentBond:
     def _extract_jscook_action_by_jsf_method(self, page, jsf_method):
         import re
         try:
-            form = page.soup.find('form', id=re.compile('menu:form_menu_discente|menuForm'))
+            form = page.index.find_form('menu:form_menu_discente|menuForm')
             if not form:
                 form = page.soup.find('input', attrs={'name': 'jscook_action'})
                 if form:
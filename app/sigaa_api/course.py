@@ -1,14 +1,26 @@
-from .exceptions import SigaaConnectionError
+from .exceptions import SigaaConnectionError, SigaaViewExpired
 from .schedule_parser import parse_schedule_code
+import asyncio
+import os
 import re
 import logging
 import unicodedata
 logger = logging.getLogger(__name__)
+PARALLEL_VIEWS = os.environ.get('SIGAA_PARALLEL_COURSE_VIEWS', '0') == '1'
+_MENU_TERMS = {'participantes': ('participantes',), 'frequency': ('frequ', 'falta', 'assiduidade'), 'grades': ('ver notas',)}
+_AULAS_RE = re.compile('Aulas\\s*\\(Ministradas/Total\\)\\s*[:\\-]?\\s*(\\d+)\\s*/\\s*(\\d+)', re.IGNORECASE)
+_DIGITS_RE = re.compile('(\\d+)')
+_MAX_FALTAS_RE = re.compile('Máximo de Faltas Permitido:\\s*(\\d+)')
+_TOTAL_FALTAS_RE = re.compile('Total de Faltas:\\s*(\\d+)')
+_PRESENCAS_RE = re.compile('Presenças Registradas:\\s*(\\d+)')
+_AULAS_REG_RE = re.compile('Número de Aulas com Registro de Frequência:\\s*(\\d+)')
+_CH_RE = re.compile('Número de Aulas definidas pela CH do Componente:\\s*(\\d+)')
 
 class Course:
 
-    def __init__(self, session, title, form_data, schedule_code: str=''):
+    def __init__(self, session, title, form_data, schedule_code: str='', require_ava=False):
         self.session = session
+        self.require_ava = require_ava
         self.title = title
         self.form_data = form_data
         self.id = form_data['post_values'].get('idTurma')
@@ -69,22 +81,86 @@ class Course:
             fresh_page = await self.session.get('/sigaa/ava/index.jsf')
             return await navigate(fresh_page)
 
+    def _plan_views(self, course_page, views):
+        """Menu form posts for ``views``, read once from the course page.
+
+        Every post carries the course page's ``javax.faces.ViewState``, which
+        the server keeps alive while we visit the other views, so they can be
+        replayed without re-entering the course or going back to the menu."""
+        plan = {}
+        for view in views:
+            for js_code in course_page.index.actions(_MENU_TERMS[view]):
+                try:
+                    plan[view] = course_page.parse_jsfcljs(js_code)
+                except ValueError:
+                    continue
+                break
+        return plan
+
+    @staticmethod
+    def _landed(view, page):
+        # Judged by the view's own content: a rejected view state answers with
+        # an error page, or with the course menu but not the view.
+        if page.contains('viewExpired', 'ViewExpiredException'):
+            return False
+        if view == 'grades':
+            return page.soup.find('table', class_='tabelaRelatorio') is not None
+        if view == 'frequency':
+            text = page.index.text
+            return page.index.table_with_headers('data', 'situa') is not None or any((r.search(text) for r in (_AULAS_RE, _TOTAL_FALTAS_RE, _PRESENCAS_RE))) or 'ainda não foi lançada' in page.index.text_lower
+        return page.soup.find('table', class_='participantes') is not None or any(('DOCENTE' in l.get_text().upper() for l in page.soup.find_all('legend')))
+
+    async def _post_planned(self, form_data):
+        return await self.session.post(form_data['action'], data=form_data['post_values'])
+
+    async def _open_views(self, course_page, views):
+        """Page (or the exception raised) for each view. Planned posts go
+        first, concurrently with SIGAA_PARALLEL_COURSE_VIEWS=1; a view whose
+        post did not land falls back to menu navigation from the last page."""
+        navigators = {'participantes': self._navigate_to_participantes, 'frequency': self._navigate_to_frequency, 'grades': self._navigate_to_grades}
+        plan = self._plan_views(course_page, views)
+        pages = {}
+        tried = set()
+        if PARALLEL_VIEWS and len(plan) > 1:
+            planned = [view for view in views if view in plan]
+            replies = await asyncio.gather(*(self._post_planned(plan[view]) for view in planned), return_exceptions=True)
+            tried.update(planned)
+            for view, page in zip(planned, replies):
+                if not isinstance(page, BaseException) and self._landed(view, page):
+                    pages[view] = page
+        current_page = course_page
+        for view in views:
+            if view in pages:
+                current_page = pages[view]
+                continue
+            try:
+                page = None
+                if view in plan and view not in tried:
+                    page = await self._post_planned(plan[view])
+                    if not self._landed(view, page):
+                        logger.debug(f'Planned {view} post for {self.title} did not land; using the menu.')
+                        page = None
+                if page is None:
+                    page = await self._navigate_menu(current_page, navigators[view])
+                pages[view] = current_page = page
+            except Exception as e:
+                pages[view] = e
+        return pages
+
     async def get_all_details(self, skip_professor=False):
         course_page = await self._enter_course()
-        current_page = course_page
         self.code = self._parse_course_code(course_page)
+        views = ['frequency', 'grades'] if skip_professor else ['participantes', 'frequency', 'grades']
+        pages = await self._open_views(course_page, views)
         if skip_professor:
             self.professor_name = None
         else:
-            try:
-                participantes_page = await self._navigate_menu(current_page, self._navigate_to_participantes)
-                current_page = participantes_page
-                self.professor_name = self._parse_professor(participantes_page)
-            except Exception:
-                self.professor_name = 'Desconhecido'
+            participantes_page = pages['participantes']
+            self.professor_name = 'Desconhecido' if isinstance(participantes_page, Exception) else self._parse_professor(participantes_page)
         try:
-            freq_page = await self._navigate_menu(current_page, self._navigate_to_frequency)
-            current_page = freq_page
+            freq_page = pages['frequency']
+            if isinstance(freq_page, Exception):
+                raise freq_page
             self.frequency = self._parse_frequency(freq_page)
         except ValueError:
             self.frequency = None
@@ -92,7 +168,9 @@ class Course:
             logger.warning(f'Could not parse frequency for {self.title}: {e}')
             self.frequency = None
         try:
-            grades_page = await self._navigate_menu(current_page, self._navigate_to_grades)
+            grades_page = pages['grades']
+            if isinstance(grades_page, Exception):
+                raise grades_page
             self.grades = self._parse_grades(grades_page)
         except ValueError:
             self.grades = []
@@ -114,17 +192,9 @@ class Course:
         return (self.grades, self.frequency, self.professor_name)
 
     async def _navigate_to_participantes(self, current_page):
-        menu_items = current_page.soup.find_all(string=re.compile('Participantes', re.I))
-        for item in menu_items:
-            parent = item.parent
-            while parent:
-                if parent.name in ['td', 'div', 'a', 'tr', 'li', 'span'] and parent.get('onclick'):
-                    js_code = parent['onclick']
-                    form_data = current_page.parse_jsfcljs(js_code)
-                    return await self.session.post(form_data['action'], data=form_data['post_values'])
-                parent = parent.parent
-                if not parent or parent.name == 'body':
-                    break
+        for js_code in current_page.index.actions(_MENU_TERMS['participantes']):
+            form_data = current_page.parse_jsfcljs(js_code)
+            return await self.session.post(form_data['action'], data=form_data['post_values'])
         raise ValueError('Participantes menu not found.')
 
     def _parse_professor(self, participantes_page):
@@ -165,83 +235,55 @@ class Course:
 
     async def _enter_course(self):
         page = await self.session.post(self.form_data['action'], data=self.form_data['post_values'])
+        # A dropped view state answers with a ViewExpired error. Callers that
+        # replay form data from an older page may also land outside the AVA.
+        if page.contains('viewExpired', 'ViewExpiredException') or (self.require_ava and '/ava/' not in str(page.url)):
+            raise SigaaViewExpired(f'SIGAA: Could not enter course {self.title}.')
         return page
 
     async def _navigate_to_grades(self, course_page):
-        texts = course_page.soup.find_all(string=lambda text: text and 'ver notas' in text.lower())
-        attrs = course_page.soup.find_all(lambda tag: tag.has_attr('title') and 'ver notas' in tag['title'].lower() or (tag.has_attr('alt') and 'ver notas' in tag['alt'].lower()) or (tag.has_attr('value') and 'ver notas' in tag['value'].lower()))
-        for item in list(texts) + attrs:
-            parent = item if hasattr(item, 'name') and item.name else item.parent
-            while parent and parent.name != 'body':
-                if parent.name in ['td', 'div', 'a', 'tr', 'li', 'span', 'button']:
-                    js_code = None
-                    if parent.get('onclick'):
-                        js_code = parent['onclick']
-                    elif parent.get('href') and 'jsfcljs' in parent.get('href'):
-                        js_code = parent['href']
-                    if js_code:
-                        form_data = course_page.parse_jsfcljs(js_code)
-                        return await self.session.post(form_data['action'], data=form_data['post_values'])
-                parent = parent.parent
+        for js_code in course_page.index.actions(_MENU_TERMS['grades']):
+            form_data = course_page.parse_jsfcljs(js_code)
+            return await self.session.post(form_data['action'], data=form_data['post_values'])
         raise ValueError("Could not find 'Ver Notas' menu item.")
 
     async def _navigate_to_frequency(self, course_page):
-        terms = ['frequ', 'falta', 'assiduidade']
-        texts = course_page.soup.find_all(string=lambda text: text and any((t in text.lower() for t in terms)))
-        attrs = course_page.soup.find_all(lambda tag: tag.has_attr('title') and any((t in tag['title'].lower() for t in terms)) or (tag.has_attr('alt') and any((t in tag['alt'].lower() for t in terms))) or (tag.has_attr('value') and any((t in tag['value'].lower() for t in terms))))
-        for item in list(texts) + attrs:
-            parent = item if hasattr(item, 'name') and item.name else item.parent
-            while parent and parent.name != 'body':
-                if parent.name in ['td', 'div', 'a', 'tr', 'li', 'span', 'button']:
-                    js_code = None
-                    if parent.get('onclick'):
-                        js_code = parent['onclick']
-                    elif parent.get('href') and 'jsfcljs' in parent.get('href'):
-                        js_code = parent['href']
-                    if js_code:
-                        form_data = course_page.parse_jsfcljs(js_code)
-                        return await self.session.post(form_data['action'], data=form_data['post_values'])
-                parent = parent.parent
+        for js_code in course_page.index.actions(_MENU_TERMS['frequency']):
+            form_data = course_page.parse_jsfcljs(js_code)
+            return await self.session.post(form_data['action'], data=form_data['post_values'])
         raise ValueError("Could not find 'Frequência' menu item.")
 
     def _parse_frequency(self, page):
         aulas_per_session = parse_schedule_code(self.schedule_code)
-        text_full = page.soup.get_text()
-        min_total_match = re.search('Aulas\\s*\\(Ministradas/Total\\)\\s*[:\\-]?\\s*(\\d+)\\s*/\\s*(\\d+)', text_full, re.IGNORECASE)
+        text_full = page.index.text
+        min_total_match = _AULAS_RE.search(text_full)
         aulas_ministradas = int(min_total_match.group(1)) if min_total_match else None
         aulas_total = int(min_total_match.group(2)) if min_total_match else None
         inferred_aulas_per_session = None
-        for tbl in page.soup.find_all('table'):
-            headers = [th.get_text(strip=True).lower() for th in tbl.find_all('th')]
-            if any(('data' in h for h in headers)) and any(('situa' in h for h in headers)):
-                num_data_rows = 0
-                for row in tbl.find_all('tr'):
-                    cells = row.find_all('td')
-                    if len(cells) < 2:
-                        continue
-                    num_data_rows += 1
-                    status_text = cells[-1].get_text(strip=True).lower()
-                    if 'falta' in status_text:
-                        falta_num = re.search('(\\d+)', status_text)
-                        if falta_num:
-                            inferred_aulas_per_session = int(falta_num.group(1))
-                if not inferred_aulas_per_session and aulas_ministradas and (num_data_rows > 0):
-                    val = round(aulas_ministradas / num_data_rows)
-                    if val > 0:
-                        inferred_aulas_per_session = val
-                break
+        freq_table = page.index.table_with_headers('data', 'situa')
+        if freq_table:
+            num_data_rows = 0
+            for row in freq_table.find_all('tr'):
+                cells = row.find_all('td')
+                if len(cells) < 2:
+                    continue
+                num_data_rows += 1
+                status_text = cells[-1].get_text(strip=True).lower()
+                if 'falta' in status_text:
+                    falta_num = _DIGITS_RE.search(status_text)
+                    if falta_num:
+                        inferred_aulas_per_session = int(falta_num.group(1))
+            if not inferred_aulas_per_session and aulas_ministradas and (num_data_rows > 0):
+                val = round(aulas_ministradas / num_data_rows)
+                if val > 0:
+                    inferred_aulas_per_session = val
         if inferred_aulas_per_session:
             aulas_per_session = inferred_aulas_per_session
-        if 'frequência ainda não foi lançada' in text_full.lower() or 'frequencia ainda nao foi lancada' in text_full.lower():
+        text_lower = page.index.text_lower
+        if 'frequência ainda não foi lançada' in text_lower or 'frequencia ainda nao foi lancada' in text_lower:
             max_faltas = int(aulas_total * 0.25) if aulas_total else 0
             return {'nao_lancada': True, 'aulas_total': aulas_total, 'aulas_ministradas': aulas_ministradas, 'max_faltas': max_faltas}
         data = {'total_faltas': 0, 'max_faltas': 0, 'percent': 0.0, 'presencas': 0, 'ausencias': 0, 'nao_registradas': 0, 'aulas_ministradas': aulas_ministradas, 'aulas_total': aulas_total, 'logs': [], 'aulas_per_session': aulas_per_session}
-        freq_table = None
-        for tbl in page.soup.find_all('table'):
-            headers = [th.get_text(strip=True).lower() for th in tbl.find_all('th')]
-            if any(('data' in h for h in headers)) and any(('situa' in h for h in headers)):
-                freq_table = tbl
-                break
         if freq_table:
             rows = freq_table.find_all('tr')
             presencas_count = 0
@@ -259,7 +301,7 @@ class Course:
                     presencas_count += 1
                     logs.append({'date': date_text, 'status': 'Presente', 'value': aulas_per_session})
                 elif 'falta' in status_text:
-                    falta_num = re.search('(\\d+)', status_text)
+                    falta_num = _DIGITS_RE.search(status_text)
                     val = int(falta_num.group(1)) if falta_num else aulas_per_session
                     ausencias_aulas += val
                     logs.append({'date': date_text, 'status': 'Ausente', 'value': val})
@@ -273,7 +315,7 @@ class Course:
             data['logs'] = logs
             total_ref = data['aulas_total'] or 0
             if total_ref == 0:
-                max_m = re.search('Máximo de Faltas Permitido:\\s*(\\d+)', text_full)
+                max_m = _MAX_FALTAS_RE.search(text_full)
                 if max_m:
                     data['max_faltas'] = int(max_m.group(1))
                     total_ref = data['max_faltas'] * 4
@@ -284,11 +326,11 @@ class Course:
             if total_ref > 0:
                 data['percent'] = data['total_faltas'] / total_ref * 100.0
             return data
-        total_match = re.search('Total de Faltas:\\s*(\\d+)', text_full)
+        total_match = _TOTAL_FALTAS_RE.search(text_full)
         if total_match:
             data['total_faltas'] = int(total_match.group(1))
             data['ausencias'] = data['total_faltas']
-            max_m = re.search('Máximo de Faltas Permitido:\\s*(\\d+)', text_full)
+            max_m = _MAX_FALTAS_RE.search(text_full)
             if max_m:
                 data['max_faltas'] = int(max_m.group(1))
                 total_classes = data['max_faltas'] * 4
@@ -296,9 +338,9 @@ class Course:
                 if total_classes > 0:
                     data['percent'] = data['total_faltas'] / total_classes * 100
             return data
-        presencas_m = re.search('Presenças Registradas:\\s*(\\d+)', text_full)
-        aulas_reg_m = re.search('Número de Aulas com Registro de Frequência:\\s*(\\d+)', text_full)
-        ch_m = re.search('Número de Aulas definidas pela CH do Componente:\\s*(\\d+)', text_full)
+        presencas_m = _PRESENCAS_RE.search(text_full)
+        aulas_reg_m = _AULAS_REG_RE.search(text_full)
+        ch_m = _CH_RE.search(text_full)
         if presencas_m and aulas_reg_m and ch_m:
             presencas = int(presencas_m.group(1))
             aulas_reg = int(aulas_reg_m.group(1))
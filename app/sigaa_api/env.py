@@ -0,0 +1,17 @@
+import logging
+import os
+logger = logging.getLogger(__name__)
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning('%s is invalid; using %s.', name, default)
+        return default
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning('%s is invalid; using %s.', name, default)
+        return default
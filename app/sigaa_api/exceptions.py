@@ -4,6 +4,9 @@ class SigaaException(Exception):
 class SigaaSessionExpired(SigaaException):
     pass
 
+class SigaaViewExpired(SigaaException):
+    pass
+
 class SigaaInvalidCredentials(SigaaException):
     pass
 
@@ -1,6 +1,11 @@
 import re
+from functools import lru_cache
+from itertools import product
 from selectolax.lexbor import LexborHTMLParser
 _RE_TYPE = type(re.compile(''))
+_CSS_TAG_RE = re.compile('^[a-z][a-z0-9]*$')
+_CSS_ATTR_RE = re.compile('^[A-Za-z_][A-Za-z0-9_-]*$')
+_MAX_SELECTOR_BRANCHES = 16
 
 class NavigableText(str):
 
@@ -73,6 +78,8 @@ class Tag:
         return key in self._node.attributes
 
     def get_text(self, separator='', strip=False):
+        if not separator:
+            return self._node.text(deep=True, separator='', strip=strip) or ''
         pieces = []
         for n in self._iter_text_descendants():
             text = n.text_content or ''
@@ -135,8 +142,10 @@ class Tag:
             return results
         name_matcher = _make_name_matcher(name)
         attr_matchers = {k: _make_attr_matcher(k, v) for k, v in filters.items()}
+        selector = _plan_selector(name, filters)
+        candidates = self._css_candidates(selector, first_only) if selector else self._iter_descendants()
         results = []
-        for n in self._iter_descendants():
+        for n in candidates:
             if not n.is_element_node:
                 continue
             tag = Tag(n)
@@ -161,6 +170,23 @@ class Tag:
                 break
         return results
 
+    def _css_candidates(self, selector, first_only):
+        node = self._node
+        # A selector list yields a node once per branch it matches; lexbor
+        # still walks the tree in document order, so dropping repeats is enough.
+        seen = {node.mem_id}
+        if first_only:
+            first = node.css_first(selector)
+            if first is None:
+                return
+            if first.mem_id not in seen:
+                seen.add(first.mem_id)
+                yield first
+        for n in node.css(selector):
+            if n.mem_id not in seen:
+                seen.add(n.mem_id)
+                yield n
+
     def find_parent(self, name=None):
         p = self.parent
         name_matcher = _make_name_matcher(name)
@@ -199,6 +225,62 @@ class Tag:
     def decompose(self):
         self._node.decompose()
 
+def _css_string(value):
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\a ').replace('\r', '\\d ')
+    return f'"{escaped}"'
+
+def _filter_signature(key, want):
+    if want is True:
+        return (key, 'present')
+    if isinstance(want, str):
+        return (key, 'eq', want)
+    if isinstance(want, _RE_TYPE):
+        return (key, 'present')
+    if isinstance(want, (list, tuple, set)) and want and all((isinstance(w, str) for w in want)):
+        return (key, 'in', tuple(sorted(want)))
+    return None
+
+def _attr_branches(key, kind, values):
+    is_class = key == 'class'
+    if kind == 'present':
+        return [f'[{key}]']
+    branches = []
+    for want in values:
+        if is_class and want and (not any((ch.isspace() for ch in want))):
+            branches.append(f'[class~={_css_string(want)}]')
+        else:
+            branches.append(f'[{key}={_css_string(want)}]')
+    return branches
+
+@lru_cache(maxsize=512)
+def _compile_selector(name, signature):
+    parts = [[name or '']]
+    for entry in signature:
+        key, kind = (entry[0], entry[1])
+        if not _CSS_ATTR_RE.match(key):
+            return None
+        values = entry[2] if kind == 'in' else (entry[2],) if kind == 'eq' else ()
+        parts.append(_attr_branches(key, kind, values))
+    branches = [''.join(combo) for combo in product(*parts)]
+    if len(branches) > _MAX_SELECTOR_BRANCHES:
+        return None
+    if branches == ['']:
+        return '*'
+    return ', '.join(branches)
+
+def _plan_selector(name, filters):
+    if name is not None and (not (isinstance(name, str) and _CSS_TAG_RE.match(name))):
+        return None
+    signature = []
+    for key, want in filters.items():
+        entry = _filter_signature(key, want)
+        if entry is None:
+            return None
+        signature.append(entry)
+    if name is None and (not signature):
+        return None
+    return _compile_selector(name, tuple(signature))
+
 def _make_name_matcher(name):
     if name is None:
         return lambda tag: True
@@ -2,6 +2,8 @@ from urllib.parse import urljoin
 from .exceptions import SigaaInvalidCredentials
 
 def parse_continue_form(page):
+    if not page.contains('Continuar'):
+        return None
     btn_continuar = page.soup.find('input', attrs={'value': lambda v: v and 'Continuar' in v and ('>>' in v)})
     if not btn_continuar:
         return None
@@ -72,11 +74,11 @@ class SigaaLoginImpl(SigaaLogin):
                 max_skips -= 1
                 continue
             break
-        if 'Questionários de Avaliação' in page.soup.text or '/sigaa/questionarios.jsf' in str(page.url):
+        if page.is_questionnaire:
             from .exceptions import SigaaQuestionnaireError
             raise SigaaQuestionnaireError('Acesso bloqueado por Questionário de Avaliação obrigatório no SIGAA.')
-        if 'Entrar no Sistema' in page.body or 'Usuário e/ou senha inválidos' in page.body:
-            if 'Usuário e/ou senha inválidos' in page.body:
+        if page.contains('Entrar no Sistema', 'Usuário e/ou senha inválidos'):
+            if page.contains('Usuário e/ou senha inválidos'):
                 raise SigaaInvalidCredentials('SIGAA: Invalid credentials.')
             raise ValueError('SIGAA: Invalid response after login attempt (Check credentials or system status).')
         self.login_status = True
@@ -2,28 +2,89 @@ import json
 import re
 from urllib.parse import urljoin
 from .lexsoup import LexSoup
+from .page_index import PageIndex
 from .enums import HTTPMethod
 from .exceptions import SigaaSessionExpired
+QUESTIONNAIRE_BUTTON_ID = 'btnNaoResponderContinuarSigaa'
+_QUESTIONNAIRE_ENTITY = 'Question&#225;rios de Avalia&#231;&#227;o'
+_NATIVE_ENCODINGS = frozenset(('utf-8', 'ascii'))
 
 class SigaaPage:
 
-    def __init__(self, url, body, headers, method, status_code, request_headers=None):
+    def __init__(self, url, body, headers, method, status_code, request_headers=None, encoding=None):
         self.url = url
-        self.body = body
+        if isinstance(body, (bytes, bytearray)):
+            self._raw = body
+            self._body = None
+            self.encoding = encoding or 'utf-8'
+        else:
+            self._raw = None
+            self._body = body
+            self.encoding = encoding
         self.headers = headers
         self.method = method
         self.status_code = status_code
         self.request_headers = request_headers or {}
         self._soup = None
+        self._index = None
         self._view_state = None
+        self._markers = {}
         self.check_session_expired()
 
+    @property
+    def body(self):
+        if self._body is None and self._raw is not None:
+            self._body = self._raw.decode(self.encoding, errors='replace')
+        return self._body
+
     @property
     def soup(self):
         if self._soup is None:
-            self._soup = LexSoup(self.body)
+            # lexbor reads bytes as UTF-8, so UTF-8 pages skip the str round-trip.
+            if self._raw is not None and self._body is None and self.encoding in _NATIVE_ENCODINGS:
+                self._soup = LexSoup(self._raw)
+            else:
+                self._soup = LexSoup(self.body)
         return self._soup
 
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = PageIndex(self.soup)
+        return self._index
+
+    def contains(self, *needles):
+        if self._body is None and self._raw is not None:
+            try:
+                return any((n.encode(self.encoding) in self._raw for n in needles))
+            except (UnicodeEncodeError, LookupError):
+                pass
+        body = self.body or ''
+        return any((n in body for n in needles))
+
+    def _marker(self, name, probe):
+        if name not in self._markers:
+            self._markers[name] = probe()
+        return self._markers[name]
+
+    @property
+    def has_questionnaire_button(self):
+        # Substring pre-scan first: most responses never mention the button, so
+        # the DOM is only parsed to confirm the rare positive.
+        return self._marker('questionnaire_button', lambda: self.contains(QUESTIONNAIRE_BUTTON_ID) and self.soup.find(id=QUESTIONNAIRE_BUTTON_ID) is not None)
+
+    @property
+    def is_questionnaire(self):
+        def probe():
+            if '/sigaa/questionarios.jsf' in str(self.url) or self.contains(_QUESTIONNAIRE_ENTITY):
+                return True
+            return self.contains('Question') and 'Questionários de Avaliação' in self.index.text
+        return self._marker('questionnaire', probe)
+
+    @property
+    def is_login_page(self):
+        return self._marker('login_page', lambda: 'verTelaLogin' in str(self.url) or self.contains('Entrar no Sistema'))
+
     @property
     def view_state(self):
         if self._view_state is None:
@@ -47,7 +108,7 @@ class SigaaPage:
         if not form_query:
             raise ValueError('SIGAA: Form without id in JS code.')
         form_id = form_query.group(1)
-        form_el = self.soup.find(id=form_id)
+        form_el = self.index.form(form_id) or self.soup.find(id=form_id)
         if not form_el:
             raise ValueError(f'SIGAA: Form with id {form_id} not found in page.')
         form_action = form_el.get('action')
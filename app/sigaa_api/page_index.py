@@ -0,0 +1,147 @@
+import re
+_LABEL_ATTRS = ('title', 'alt', 'value')
+_ACTION_TAGS = frozenset(('td', 'div', 'a', 'tr', 'li', 'span', 'button'))
+
+class PageIndex:
+    """Lazily built lookups over a parsed SIGAA page.
+
+    Each view (text, tables, forms, actions) is computed on first access and
+    reused by every parser that touches the same page."""
+
+    def __init__(self, soup):
+        self._soup = soup
+        self._text = None
+        self._text_lower = None
+        self._tables = None
+        self._by_signature = None
+        self._forms = None
+        self._text_actions = None
+        self._attr_actions = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._soup.get_text()
+        return self._text
+
+    @property
+    def text_lower(self):
+        if self._text_lower is None:
+            self._text_lower = self.text.lower()
+        return self._text_lower
+
+    def search(self, pattern, flags=0):
+        return re.search(pattern, self.text, flags)
+
+    def _build_structure(self):
+        tables = []
+        forms = {}
+        for tag in self._soup.select('table, form[id]'):
+            if tag.name == 'form':
+                forms.setdefault(tag.get('id'), tag)
+                continue
+            headers = tuple((th.get_text(strip=True) for th in tag.find_all('th')))
+            tables.append((tag, headers, tuple((h.lower() for h in headers))))
+        self._tables = tables
+        self._forms = forms
+
+    @property
+    def tables(self):
+        """(table, header texts, lowercased header texts) in document order."""
+        if self._tables is None:
+            self._build_structure()
+        return self._tables
+
+    @property
+    def tables_by_signature(self):
+        if self._by_signature is None:
+            grouped = {}
+            for table, _, signature in self.tables:
+                grouped.setdefault(signature, []).append(table)
+            self._by_signature = grouped
+        return self._by_signature
+
+    def tables_with_headers(self, *terms):
+        matched = {sig for sig in self.tables_by_signature if all((any((t in h for h in sig)) for t in terms))}
+        return [table for table, _, sig in self.tables if sig in matched]
+
+    def table_with_headers(self, *terms):
+        for table, _, signature in self.tables:
+            if all((any((t in h for h in signature)) for t in terms)):
+                return table
+        return None
+
+    @property
+    def forms(self):
+        if self._forms is None:
+            self._build_structure()
+        return self._forms
+
+    def form(self, form_id):
+        return self.forms.get(form_id)
+
+    def find_form(self, pattern):
+        for form_id, form in self.forms.items():
+            if re.search(pattern, form_id):
+                return form
+        return None
+
+    def _build_actions(self):
+        nearest = {}
+
+        def action_for(node):
+            chain = []
+            js_code = None
+            while node is not None and node.is_element_node and node.tag != 'body':
+                cached = nearest.get(node.mem_id, False)
+                if cached is not False:
+                    js_code = cached
+                    break
+                chain.append(node.mem_id)
+                if node.tag in _ACTION_TAGS:
+                    attrs = node.attributes
+                    if attrs.get('onclick'):
+                        js_code = attrs['onclick']
+                        break
+                    href = attrs.get('href')
+                    if href and 'jsfcljs' in href:
+                        js_code = href
+                        break
+                node = node.parent
+            for mem_id in chain:
+                nearest[mem_id] = js_code
+            return js_code
+        text_actions = []
+        attr_actions = []
+        for node in self._soup._node.traverse(include_text=True):
+            if node.is_text_node:
+                label = node.text_content
+                if label and label.strip():
+                    js_code = action_for(node.parent)
+                    if js_code:
+                        text_actions.append((label.lower(), js_code))
+            elif node.is_element_node:
+                attrs = node.attributes
+                labels = [attrs[a] for a in _LABEL_ATTRS if attrs.get(a) is not None]
+                if labels:
+                    js_code = action_for(node)
+                    if js_code:
+                        attr_actions.append((tuple((l.lower() for l in labels)), js_code))
+        self._text_actions = text_actions
+        self._attr_actions = attr_actions
+
+    def actions(self, terms):
+        """onclick/jsfcljs targets whose visible text or title/alt/value label
+        contains any of ``terms``, nearest clickable ancestor first, text
+        labels before attribute labels."""
+        if self._text_actions is None:
+            self._build_actions()
+        terms = [t.lower() for t in terms]
+        found = []
+        for label, js_code in self._text_actions:
+            if any((t in label for t in terms)) and js_code not in found:
+                found.append(js_code)
+        for labels, js_code in self._attr_actions:
+            if any((t in l for l in labels for t in terms)) and js_code not in found:
+                found.append(js_code)
+        return found
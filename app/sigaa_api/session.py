@@ -1,10 +1,42 @@
+import codecs
 import os
+import re
 import aiohttp
 import asyncio
 from .enums import HTTPMethod
-from .page import SigaaPage
+from .page import SigaaPage, QUESTIONNAIRE_BUTTON_ID
 from .exceptions import SigaaConnectionError, SigaaQuestionnaireError
+from contextlib import asynccontextmanager
 from urllib.parse import urljoin, urlparse
+from .env import env_int
+
+# The connector is shared by every session in the process, so it must not
+# be the throttle: the per-institution budget (SIGAA_CONCURRENCY_DEFAULT) is.
+POOL_LIMIT_PER_HOST = env_int('SIGAA_POOL_LIMIT_PER_HOST', max(100, env_int('SIGAA_CONCURRENCY_DEFAULT', 40)))
+POOL_LIMIT = max(env_int('SIGAA_POOL_LIMIT', 100), POOL_LIMIT_PER_HOST)
+REQUEST_TIMEOUT = env_int('SIGAA_REQUEST_TIMEOUT', 30)
+POOL_WAIT_TIMEOUT = env_int('SIGAA_POOL_WAIT_TIMEOUT', 10)
+CONNECT_TIMEOUT = env_int('SIGAA_CONNECT_TIMEOUT', 10)
+POOL_KEEPALIVE = env_int('SIGAA_POOL_KEEPALIVE', 30)
+POOL_DNS_TTL = env_int('SIGAA_POOL_DNS_TTL', 300)
+MAX_BODY_BYTES = env_int('SIGAA_MAX_BODY_BYTES', 8 * 1024 * 1024)
+RAW_BODY = os.environ.get('SIGAA_RAW_BODY', '1') != '0'
+_READ_CHUNK = 64 * 1024
+_META_CHARSET_RE = re.compile(b'<meta[^>]+charset\\s*=\\s*["\']?([A-Za-z0-9_\\-]+)', re.IGNORECASE)
+_connectors = {}
+_request_gate = None
+
+def set_request_gate(gate):
+    """Installs an object whose ``slot(base_url, owner)`` async context manager
+    wraps every HTTP request to SIGAA, redirects included (e.g. a global
+    concurrency budget). The context yields an ``extend()`` coroutine called
+    before each redirect hop, or None."""
+    global _request_gate
+    _request_gate = gate
+
+@asynccontextmanager
+async def _no_gate():
+    yield None
 
 def _origin(url) -> tuple:
     parsed = urlparse(str(url))
@@ -18,8 +50,58 @@ def _same_origin(url, base_origin: tuple) -> bool:
         return False
     return True
 
+def get_connector(url):
+    loop = asyncio.get_running_loop()
+    origin = _origin(url)
+    entry = _connectors.get(origin)
+    if entry is not None:
+        connector, owner_loop = entry
+        if not connector.closed and owner_loop is loop:
+            return connector
+    connector = aiohttp.TCPConnector(limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST, keepalive_timeout=POOL_KEEPALIVE, ttl_dns_cache=POOL_DNS_TTL, use_dns_cache=True)
+    _connectors[origin] = (connector, loop)
+    return connector
+
+async def close_connectors():
+    entries = list(_connectors.values())
+    _connectors.clear()
+    for connector, owner_loop in entries:
+        if owner_loop is asyncio.get_running_loop() and (not connector.closed):
+            await connector.close()
+
+async def _read_body(response):
+    declared = response.content_length
+    if MAX_BODY_BYTES and declared and declared > MAX_BODY_BYTES:
+        raise SigaaConnectionError(f'Response too large ({declared} bytes).')
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(_READ_CHUNK):
+        size += len(chunk)
+        if MAX_BODY_BYTES and size > MAX_BODY_BYTES:
+            raise SigaaConnectionError(f'Response exceeded {MAX_BODY_BYTES} bytes.')
+        chunks.append(chunk)
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+def _sniff_charset(response, raw):
+    charset = response.charset
+    if not charset:
+        match = _META_CHARSET_RE.search(raw[:2048])
+        charset = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return 'utf-8'
+
+async def _build_page(response, method):
+    raw = await _read_body(response)
+    encoding = _sniff_charset(response, raw)
+    body = raw if RAW_BODY else raw.decode(encoding, errors='replace')
+    return SigaaPage(url=response.url, body=body, headers=response.headers, method=method, status_code=response.status, request_headers=response.request_info.headers, encoding=encoding)
+
 def parse_questionnaire_form(page):
-    skip_button = page.soup.find(id='btnNaoResponderContinuarSigaa')
+    if not page.has_questionnaire_button:
+        return None
+    skip_button = page.soup.find(id=QUESTIONNAIRE_BUTTON_ID)
     if not skip_button:
         return None
     form = skip_button.find_parent('form')
@@ -29,7 +111,7 @@ def parse_questionnaire_form(page):
     form_id = form.get('id')
     if not action or not form_id:
         return None
-    post_values = {form_id: form_id, 'btnNaoResponderContinuarSigaa': 'btnNaoResponderContinuarSigaa'}
+    post_values = {form_id: form_id, QUESTIONNAIRE_BUTTON_ID: QUESTIONNAIRE_BUTTON_ID}
     view_state = page.view_state
     if view_state:
         post_values['javax.faces.ViewState'] = view_state
@@ -43,16 +125,24 @@ class SigaaSession:
         self.headers = {'User-Agent': 'SIGAA-Api/1.0', 'Accept-Encoding': 'br, gzip, deflate', 'Accept': '*/*', 'Cache-Control': 'max-age=0', 'DNT': '1'}
         self._initial_cookies = cookies
         self.last_url = None
+        self.owner = None
 
     async def _get_session(self):
         if self._session is None:
             cookie_jar = aiohttp.CookieJar()
             if self._initial_cookies:
                 cookie_jar.update_cookies(self._initial_cookies)
-            timeout = aiohttp.ClientTimeout(total=30)
-            self._session = aiohttp.ClientSession(headers=self.headers, cookie_jar=cookie_jar, timeout=timeout)
+            # The whole exchange keeps the 30s bound; waiting for a pooled socket
+            # and connecting get their own, shorter cap inside it.
+            timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=min(POOL_WAIT_TIMEOUT + CONNECT_TIMEOUT, REQUEST_TIMEOUT), sock_connect=CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(headers=self.headers, cookie_jar=cookie_jar, timeout=timeout, connector=get_connector(self.base_url), connector_owner=False)
         return self._session
 
+    def _slot(self):
+        if _request_gate is None:
+            return _no_gate()
+        return _request_gate.slot(self.base_url, self.owner)
+
     async def close(self):
         if self._session:
             await self._session.close()
@@ -64,18 +154,35 @@ class SigaaSession:
         proxy_url = os.environ.get('SIGAA_PROXY')
         if proxy_url:
             kwargs['proxy'] = proxy_url
+        try:
+            # One budget slot covers the whole redirect chain of this request.
+            async with self._slot() as extend:
+                page, answer_questionnaire = await self._exchange(session, method, path, data, json, retry_count, redirect_count, kwargs, extend)
+        except aiohttp.ServerDisconnectedError as e:
+            if retry_count >= 3:
+                raise SigaaConnectionError(f'Connection error: {e}')
+            # Retries run after the budget slot above has been released.
+            await asyncio.sleep(1.5)
+            return await self.request(method, path, data=data, json=json, retry_count=retry_count + 1, redirect_count=redirect_count, **kwargs)
+        except aiohttp.ClientError as e:
+            raise SigaaConnectionError(f'Connection error: {e}')
+        if answer_questionnaire:
+            await self._handle_questionnaire(page)
+            return await self.request(method, path, data=data, json=json, retry_count=retry_count + 1, **kwargs)
+        return page
+
+    async def _exchange(self, session, method, path, data, json, retry_count, redirect_count, kwargs, extend):
         current_method = method
         current_path = path
         current_data = data
         current_json = json
         current_redirect_count = redirect_count
+        base_origin = _origin(self.base_url)
         while True:
             if current_path.startswith('http'):
                 url = current_path
             else:
                 url = urljoin(self.base_url, current_path)
-            base_origin = _origin(self.base_url)
-            base_netloc = base_origin[1]
             if not _same_origin(url, base_origin):
                 req_netloc = urlparse(url).netloc
                 raise ValueError(f'Security Alert: Potential SSRF attempt blocked. Request to {req_netloc} not allowed.')
@@ -86,50 +193,37 @@ class SigaaSession:
                 req_headers.update(kwargs['headers'])
             request_kwargs = kwargs.copy()
             request_kwargs['headers'] = req_headers
-            try:
-                async with session.request(current_method, url, data=current_data, json=current_json, **request_kwargs) as response:
-                    if response.status in (301, 302, 303, 307, 308):
-                        if current_redirect_count >= 10:
-                            raise SigaaConnectionError('Too many redirects')
-                        location = response.headers.get('Location')
-                        if not location:
-                            body = await response.text()
-                            self.last_url = str(response.url)
-                            page = SigaaPage(url=response.url, body=body, headers=dict(response.headers), method=current_method, status_code=response.status, request_headers=dict(response.request_info.headers))
-                            break
-                        new_url = urljoin(str(response.url), location)
-                        if not _same_origin(new_url, base_origin):
-                            new_netloc = urlparse(new_url).netloc
-                            raise ValueError(f'Security Alert: External redirect blocked. Redirect to {new_netloc} not allowed.')
-                        next_method = current_method
-                        if response.status in (301, 302, 303):
-                            next_method = HTTPMethod.GET.value
-                            current_data = None
-                            current_json = None
+            if extend is not None and current_redirect_count > redirect_count:
+                await extend()
+            async with session.request(current_method, url, data=current_data, json=current_json, **request_kwargs) as response:
+                if response.status in (301, 302, 303, 307, 308):
+                    if current_redirect_count >= 10:
+                        raise SigaaConnectionError('Too many redirects')
+                    location = response.headers.get('Location')
+                    if not location:
+                        await _build_page(response, current_method)
                         self.last_url = str(response.url)
-                        current_method = next_method
-                        current_path = new_url
-                        current_redirect_count += 1
-                        continue
-                    if not _same_origin(response.url, base_origin):
-                        final_netloc = urlparse(str(response.url)).netloc
-                        raise ValueError(f'Security Alert: External redirect blocked. Redirect to {final_netloc} not allowed.')
-                    body = await response.text()
+                        return (None, False)
+                    new_url = urljoin(str(response.url), location)
+                    if not _same_origin(new_url, base_origin):
+                        new_netloc = urlparse(new_url).netloc
+                        raise ValueError(f'Security Alert: External redirect blocked. Redirect to {new_netloc} not allowed.')
+                    next_method = current_method
+                    if response.status in (301, 302, 303):
+                        next_method = HTTPMethod.GET.value
+                        current_data = None
+                        current_json = None
                     self.last_url = str(response.url)
-                    page = SigaaPage(url=response.url, body=body, headers=dict(response.headers), method=current_method, status_code=response.status, request_headers=dict(response.request_info.headers))
-                    if page.soup.find(id='btnNaoResponderContinuarSigaa'):
-                        if retry_count >= 3:
-                            return page
-                        await self._handle_questionnaire(page)
-                        return await self.request(method, path, data=data, json=json, retry_count=retry_count + 1, **kwargs)
-                    return page
-            except aiohttp.ServerDisconnectedError as e:
-                if retry_count < 3:
-                    await asyncio.sleep(1.5)
-                    return await self.request(method, path, data=data, json=json, retry_count=retry_count + 1, redirect_count=redirect_count, **kwargs)
-                raise SigaaConnectionError(f'Connection error: {e}')
-            except aiohttp.ClientError as e:
-                raise SigaaConnectionError(f'Connection error: {e}')
+                    current_method = next_method
+                    current_path = new_url
+                    current_redirect_count += 1
+                    continue
+                if not _same_origin(response.url, base_origin):
+                    final_netloc = urlparse(str(response.url)).netloc
+                    raise ValueError(f'Security Alert: External redirect blocked. Redirect to {final_netloc} not allowed.')
+                page = await _build_page(response, current_method)
+                self.last_url = str(response.url)
+                return (page, page.has_questionnaire_button and retry_count < 3)
 
     async def _handle_questionnaire(self, page):
         parsed = parse_questionnaire_form(page)
@@ -140,8 +234,9 @@ class SigaaSession:
         if not _same_origin(action_url, _origin(self.base_url)):
             return
         session = await self._get_session()
-        async with session.post(action_url, data=post_values, allow_redirects=False) as resp:
-            await resp.text()
+        async with self._slot():
+            async with session.post(action_url, data=post_values, allow_redirects=False) as resp:
+                await _read_body(resp)
 
     async def get(self, path, **kwargs):
         return await self.request(HTTPMethod.GET.value, path, **kwargs)
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import logging
+import time
+from .exceptions import SigaaException
+from .env import env_float
+logger = logging.getLogger(__name__)
+
+IDLE_TTL = env_float('SIGAA_SESSION_POOL_IDLE_TTL', 600)
+MAX_PER_USER = int(env_float('SIGAA_SESSION_POOL_MAX_PER_USER', 10))
+PROBE_AFTER_IDLE = env_float('SIGAA_SESSION_POOL_PROBE_AFTER_IDLE', 120)
+HEALTH_CHECK_PATH = '/sigaa/portais/discente/discente.jsf'
+_EVICT_INTERVAL = 30
+
+class PooledSession:
+    __slots__ = ('user_key', 'bond_url', 'sigaa', 'account', 'created_at', 'last_used', 'reused')
+
+    def __init__(self, user_key, bond_url, sigaa, account):
+        self.user_key = user_key
+        self.bond_url = bond_url
+        self.sigaa = sigaa
+        self.account = account
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+    @property
+    def session(self):
+        return self.sigaa.session
+
+    @property
+    def key(self):
+        return (self.user_key, self.bond_url)
+
+    def __repr__(self):
+        return f"<PooledSession user='{self.user_key[2]}' bond_url={self.bond_url!r}>"
+
+class SigaaSessionPool:
+
+    def __init__(self, idle_ttl=IDLE_TTL, max_per_user=MAX_PER_USER, probe_after_idle=PROBE_AFTER_IDLE):
+        self.idle_ttl = idle_ttl
+        self.probe_after_idle = probe_after_idle
+        self.max_per_user = max(1, max_per_user)
+        self._idle = {}
+        self._active = {}
+        self._conds = {}
+        self._last_evict = 0.0
+
+    @staticmethod
+    def _user_key(url, inst_type, username, password):
+        digest = hashlib.sha256(f'{username}\x00{password}'.encode('utf-8')).hexdigest()
+        return (str(url).rstrip('/').lower(), getattr(inst_type, 'value', inst_type), username, digest)
+
+    def _count(self, user_key):
+        idle = sum((len(entries) for (uk, _), entries in self._idle.items() if uk == user_key))
+        return self._active.get(user_key, 0) + idle
+
+    def _pop_idle_other_context(self, user_key):
+        for (uk, bond_url), entries in self._idle.items():
+            if uk == user_key and entries:
+                return entries.pop(0)
+        return None
+
+    def idle_count(self, url, inst_type, username, password, bond_url=None):
+        return len(self._idle.get((self._user_key(url, inst_type, username, password), bond_url), ()))
+
+    async def acquire(self, url, inst_type, username, password, bond_url=None, probe=True):
+        user_key = self._user_key(url, inst_type, username, password)
+        await self._evict_expired()
+        cond = self._conds.setdefault(user_key, asyncio.Condition())
+        stale = None
+        async with cond:
+            while True:
+                idle = self._idle.get((user_key, bond_url))
+                if idle:
+                    entry = idle.pop()
+                    break
+                if self._count(user_key) < self.max_per_user:
+                    entry = None
+                    break
+                stale = self._pop_idle_other_context(user_key)
+                if stale is not None:
+                    entry = None
+                    break
+                await cond.wait()
+            self._active[user_key] = self._active.get(user_key, 0) + 1
+        try:
+            if stale is not None:
+                await self._close(stale)
+            if entry is not None:
+                if not (probe and self._needs_probe(entry)) or await self._healthy(entry):
+                    entry.last_used = time.monotonic()
+                    entry.reused = True
+                    return entry
+                await self._close(entry)
+            return await self._open(user_key, url, inst_type, username, password, bond_url)
+        except BaseException:
+            await self._release_slot(user_key)
+            raise
+
+    async def release(self, entry, discard=False):
+        if discard:
+            await self._close(entry)
+        cond = self._conds.setdefault(entry.user_key, asyncio.Condition())
+        async with cond:
+            if not discard:
+                entry.last_used = time.monotonic()
+                self._idle.setdefault(entry.key, []).append(entry)
+            self._active[entry.user_key] = max(0, self._active.get(entry.user_key, 0) - 1)
+            cond.notify()
+
+    async def _release_slot(self, user_key):
+        cond = self._conds.setdefault(user_key, asyncio.Condition())
+        async with cond:
+            self._active[user_key] = max(0, self._active.get(user_key, 0) - 1)
+            cond.notify()
+
+    async def _open(self, user_key, url, inst_type, username, password, bond_url):
+        from .sigaa import Sigaa
+        sigaa = Sigaa(url, inst_type)
+        try:
+            account = await sigaa.login(username, password)
+            if bond_url:
+                await sigaa.session.get(bond_url)
+        except BaseException:
+            await sigaa.close()
+            raise
+        logger.info(f'SIGAA pool: opened new session for {username} (bond_url={bond_url!r}).')
+        return PooledSession(user_key, bond_url, sigaa, account)
+
+    def _needs_probe(self, entry):
+        # A recently used session is handed out as is: if SIGAA expired it
+        # anyway, the first real request fails and the holder discards it.
+        return time.monotonic() - entry.last_used >= self.probe_after_idle
+
+    async def _healthy(self, entry):
+        try:
+            page = await entry.session.get(HEALTH_CHECK_PATH)
+        except SigaaException:
+            return False
+        except Exception as e:
+            logger.info(f'SIGAA pool: health check failed for {entry!r}: {e}')
+            return False
+        return not page.is_login_page
+
+    async def _close(self, entry):
+        try:
+            await entry.sigaa.close()
+        except Exception:
+            logger.debug('SIGAA pool: failed to close session.', exc_info=True)
+
+    async def _evict_expired(self):
+        now = time.monotonic()
+        if now - self._last_evict < _EVICT_INTERVAL:
+            return
+        self._last_evict = now
+        expired = []
+        for key, entries in list(self._idle.items()):
+            keep = [e for e in entries if now - e.last_used < self.idle_ttl]
+            expired.extend((e for e in entries if now - e.last_used >= self.idle_ttl))
+            if keep:
+                self._idle[key] = keep
+            else:
+                self._idle.pop(key, None)
+        for user_key in [uk for uk in self._conds if self._count(uk) == 0]:
+            self._conds.pop(user_key, None)
+            self._active.pop(user_key, None)
+        for entry in expired:
+            await self._close(entry)
+
+    async def close_all(self):
+        entries = [e for group in self._idle.values() for e in group]
+        self._idle.clear()
+        for entry in entries:
+            await self._close(entry)
+_pool = None
+
+def get_session_pool():
+    global _pool
+    if _pool is None:
+        _pool = SigaaSessionPool()
+    return _pool
+
+async def close_session_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close_all()
+        _pool = None
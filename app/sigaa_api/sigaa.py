@@ -15,6 +15,7 @@ class Sigaa:
             raise NotImplementedError(f'Institution {institution} not implemented yet.')
 
     async def login(self, username, password):
+        self.session.owner = username
         page = await self.login_controller.login(username, password)
         return Account(self.session, page)
 
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from .sigaa_api.exceptions import SigaaConnectionError
+from .sigaa_api.env import env_float, env_int
+from .sigaa_api.session import REQUEST_TIMEOUT
+logger = logging.getLogger(__name__)
+
+def _parse_limits(raw: str) -> dict[str, int]:
+    limits = {}
+    for part in (raw or '').split(','):
+        name, _, value = part.partition('=')
+        try:
+            limits[name.strip().upper()] = max(1, int(value))
+        except ValueError:
+            if part.strip():
+                logger.warning('SIGAA_CONCURRENCY_LIMITS: entrada inválida %r ignorada.', part)
+    return limits
+DEFAULT_LIMIT = env_int('SIGAA_CONCURRENCY_DEFAULT', 40)
+LIMITS = _parse_limits(os.environ.get('SIGAA_CONCURRENCY_LIMITS', ''))
+MAX_WAIT = env_float('SIGAA_BUDGET_MAX_WAIT', 30)
+# A lease must outlive the longest exchange the session allows; slot() renews
+# it before a redirect hop that could otherwise run past it.
+LEASE_MARGIN = 15
+LEASE_TTL = max(env_float('SIGAA_BUDGET_LEASE_TTL', REQUEST_TIMEOUT + LEASE_MARGIN), REQUEST_TIMEOUT + LEASE_MARGIN)
+SLOW_WAIT = 1.0
+_REDIS_BACKOFF = 10
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+  redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+  redis.call('EXPIRE', KEYS[1], ARGV[5])
+  return 1
+end
+return 0
+"""
+
+class BudgetExhausted(SigaaConnectionError):
+    pass
+
+class _FairGate:
+    """Semáforo local que atende os usuários em round-robin: quem tem muitas
+    requisições na fila não passa na frente de quem tem uma só."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._queues: OrderedDict = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum((len(q) for q in self._queues.values()))
+
+    async def acquire(self, owner):
+        if self.active < self.limit and (not self._queues):
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append(fut)
+        try:
+            await fut
+        except BaseException:
+            if fut.done() and (not fut.cancelled()):
+                self.release()
+            else:
+                queue = self._queues.get(owner)
+                if queue is not None and fut in queue:
+                    queue.remove(fut)
+                    if not queue:
+                        del self._queues[owner]
+            raise
+
+    def release(self):
+        while self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+class ConcurrencyBudget:
+    """Teto de requisições simultâneas por host do SIGAA, somado entre processos pelo Redis."""
+
+    def __init__(self, default_limit: int=DEFAULT_LIMIT, limits: dict=None, max_wait: float=MAX_WAIT):
+        self.default_limit = default_limit
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.max_wait = max_wait
+        self._gates: dict[str, _FairGate] = {}
+        self._hosts: dict[str, str] = {}
+        self._script = None
+        self._stats: dict[str, dict] = {}
+        self._redis_retry_at = 0.0
+
+    def _institution(self, host: str) -> str:
+        if host not in self._hosts:
+            from .sigaa_gateway import INSTITUTION_URLS
+            name = host
+            for inst, url in INSTITUTION_URLS.items():
+                if urlparse(url).netloc.lower() == host:
+                    name = inst
+                    break
+            self._hosts[host] = name
+        return self._hosts[host]
+
+    def limit_for(self, host: str) -> int:
+        return self.limits.get(self._institution(host).upper(), self.default_limit)
+
+    def _gate(self, host: str) -> _FairGate:
+        gate = self._gates.get(host)
+        if gate is None:
+            gate = self._gates[host] = _FairGate(self.limit_for(host))
+        return gate
+
+    @asynccontextmanager
+    async def slot(self, base_url, owner=None):
+        host = urlparse(str(base_url)).netloc.lower()
+        gate = self._gate(host)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(gate.acquire(owner), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._record(host, time.monotonic() - started, timed_out=True)
+            raise BudgetExhausted(f'SIGAA {host}: fila local cheia há {self.max_wait:.0f}s.')
+        token = None
+        try:
+            token = await self._acquire_remote(host, started)
+            self._record(host, time.monotonic() - started)
+            renewed = time.monotonic()
+
+            async def extend():
+                nonlocal renewed
+                if token is None or time.monotonic() - renewed < LEASE_TTL - REQUEST_TIMEOUT:
+                    return
+                renewed = time.monotonic()
+                await self._renew_remote(host, token)
+            yield extend
+        finally:
+            gate.release()
+            if token is not None:
+                await self._release_remote(host, token)
+
+    async def _acquire_remote(self, host: str, started: float):
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        from .cache import client
+        key = f'sigaa:budget:{host}'
+        token = uuid.uuid4().hex
+        delay = 0.05
+        while True:
+            now = time.time()
+            try:
+                if self._script is None:
+                    self._script = client.register_script(_ACQUIRE_LUA)
+                granted = await self._script(keys=[key], args=[now - LEASE_TTL, now, self.limit_for(host), token, int(LEASE_TTL * 2)])
+            except Exception as exc:
+                logger.warning('Budget do SIGAA sem Redis (%s); usando só o limite local por %ss.', exc, _REDIS_BACKOFF)
+                self._redis_retry_at = time.monotonic() + _REDIS_BACKOFF
+                return None
+            if granted:
+                return token
+            if time.monotonic() - started >= self.max_wait:
+                self._record(host, time.monotonic() - started, timed_out=True)
+                raise BudgetExhausted(f'SIGAA {host}: limite global de {self.limit_for(host)} requisições atingido.')
+            await asyncio.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, 0.5)
+
+    async def _renew_remote(self, host: str, token: str):
+        from .cache import client
+        try:
+            await client.zadd(f'sigaa:budget:{host}', {token: time.time()}, xx=True)
+        except Exception as exc:
+            logger.debug('Falha ao renovar vaga do budget no Redis: %s', exc)
+
+    async def _release_remote(self, host: str, token: str):
+        from .cache import client
+        try:
+            await client.zrem(f'sigaa:budget:{host}', token)
+        except Exception as exc:
+            logger.debug('Falha ao liberar vaga do budget no Redis: %s', exc)
+
+    def _record(self, host: str, waited: float, timed_out: bool=False):
+        stats = self._stats.setdefault(host, {'acquired': 0, 'timeouts': 0, 'wait_total': 0.0, 'wait_max': 0.0})
+        if timed_out:
+            stats['timeouts'] += 1
+        else:
+            stats['acquired'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+        if waited >= SLOW_WAIT:
+            gate = self._gates.get(host)
+            logger.info(f'Budget SIGAA {host}: esperou {waited:.2f}s por uma vaga (ativas={gate.active if gate else "?"}, na fila={gate.waiting if gate else "?"}).')
+
+    def stats(self) -> dict:
+        out = {}
+        for host, stats in self._stats.items():
+            gate = self._gates.get(host)
+            served = stats['acquired'] + stats['timeouts']
+            out[host] = dict(stats, limit=self.limit_for(host), active=gate.active if gate else 0, waiting=gate.waiting if gate else 0, wait_avg=stats['wait_total'] / served if served else 0.0)
+        return out
+_budget = None
+
+def get_budget() -> ConcurrencyBudget:
+    global _budget
+    if _budget is None:
+        _budget = ConcurrencyBudget()
+    return _budget
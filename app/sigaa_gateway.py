@@ -1,9 +1,13 @@
+import asyncio
 import logging
 import os
 import time
 import uuid
 from contextlib import asynccontextmanager
+from functools import partial
 from urllib.parse import urlparse
+from .latency import get_controller as latency_controller
+from .sigaa_remote.client import BATCH_DETAILS
 from .sigaa_remote import RemoteApiError, RemoteQuestionnaireError, RemoteSessionExpired, RemoteUnavailable, get_client, is_configured
 logger = logging.getLogger(__name__)
 SIGAA_URL = 'https://sigaa.ifal.edu.br'
@@ -48,6 +52,16 @@ def resolve_sigaa_url(institution: str, submitted_url: str=None) -> str:
 
 def _backend_preference() -> str:
     return os.environ.get('SIGAA_BACKEND', 'auto').strip().lower()
+
+def _use_remote() -> bool:
+    """Decide o backend sem I/O: no modo auto, workers que o monitor já viu
+    fora do ar mandam direto para o scraper local."""
+    preference = _backend_preference()
+    if preference == LOCAL or not is_configured():
+        return False
+    if preference == REMOTE:
+        return True
+    return get_client().cached_healthy() is not False
 _local_enrollment: dict[str, dict] = {}
 _LOCAL_ENROLLMENT_TTL = 900
 
@@ -58,6 +72,7 @@ def _prune_local_enrollment():
 
 class _RemoteBackend:
     name = REMOTE
+    batch_details = BATCH_DETAILS
 
     def __init__(self, session_id, url, institution):
         self.session_id = session_id
@@ -74,6 +89,9 @@ class _RemoteBackend:
     def translate(exc):
         return None
 
+    def invalidate(self):
+        pass
+
     async def get_bonds(self):
         data = await get_client().list_bonds(self.session_id)
         return data.get('bonds', [])
@@ -85,10 +103,17 @@ class _RemoteBackend:
     async def get_course_details(self, bond_id, course_id, skip_professor=False):
         return await get_client().course_details(self.session_id, bond_id, course_id)
 
+    def iter_course_details(self, bond_id, course_ids, skip_professor=False):
+        return get_client().course_details_many(self.session_id, bond_id, course_ids)
+
     async def get_history(self, bond_id, cached_history=None):
         data = await get_client().history(self.session_id, bond_id, cached_history=cached_history)
         return data.get('history', {})
 
+    async def iter_history(self, bond_id, cached_history=None):
+        async for kind, data in get_client().history_stream(self.session_id, bond_id, cached_history=cached_history):
+            yield (kind, data)
+
     async def get_institutional_data(self, bond_id):
         return {}
 
@@ -112,6 +137,7 @@ class _RemoteBackend:
 
 class _LocalBackend:
     name = LOCAL
+    batch_details = False
 
     def __init__(self, cookies, url, institution, enrollment_token=None):
         self.cookies = cookies
@@ -122,6 +148,8 @@ class _LocalBackend:
         self._sigaa = None
         self._account = None
         self._courses = {}
+        self._lease = None
+        self._lease_broken = False
 
     def _institution_type(self):
         from .sigaa_api.enums import InstitutionType
@@ -137,6 +165,7 @@ class _LocalBackend:
         if self._sigaa is not None and self._account is not None:
             return self
         self._sigaa = Sigaa(self.url, self._institution_type(), cookies=self.cookies)
+        self._sigaa.session.owner = (self.credentials or {}).get('username')
         try:
             response = await self._sigaa.session.get('/sigaa/portais/discente/discente.jsf')
             if 'login' in str(getattr(response.url, 'path', response.url)):
@@ -166,7 +195,24 @@ class _LocalBackend:
             return SigaaError(str(exc))
         return None
 
+    def attach_lease(self, lease):
+        self._lease = lease
+        self._lease_broken = False
+        self._sigaa = lease.sigaa
+        self._account = lease.account
+
+    def invalidate(self):
+        self._lease_broken = True
+
     async def close_scope(self):
+        if self._lease is not None:
+            from .sigaa_api.session_pool import get_session_pool
+            lease, self._lease = (self._lease, None)
+            self._sigaa = None
+            self._account = None
+            self._courses = {}
+            await get_session_pool().release(lease, discard=self._lease_broken)
+            return
         if self._sigaa is not None:
             try:
                 await self._sigaa.close()
@@ -231,9 +277,31 @@ class _LocalBackend:
 
     async def get_history(self, bond_id, cached_history=None):
         bond = self._find_bond(bond_id)
+        await latency_controller().refresh(self.institution)
         credentials = self._parallel_credentials()
         return await bond.get_history(cached_history=cached_history, credentials=credentials)
 
+    async def iter_history(self, bond_id, cached_history=None):
+        bond = self._find_bond(bond_id)
+        await latency_controller().refresh(self.institution)
+        events = asyncio.Queue()
+        credentials = self._parallel_credentials()
+        if credentials:
+            credentials['progress'] = lambda kind, data: events.put_nowait((kind, data))
+        task = asyncio.ensure_future(bond.get_history(cached_history=cached_history, credentials=credentials))
+        try:
+            while not task.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            yield ('result', task.result())
+        finally:
+            if not task.done():
+                task.cancel()
+
     async def get_institutional_data(self, bond_id):
         bond = self._find_bond(bond_id)
         if hasattr(bond, 'get_institutional_data'):
@@ -244,7 +312,12 @@ class _LocalBackend:
         creds = getattr(self, 'credentials', None)
         if not creds:
             return None
-        return {'username': creds['username'], 'password': creds['password'], 'url': self.url, 'inst_type': self._institution_type()}
+        controller = latency_controller()
+        from .history_archive import HistoryArchive
+        from .professor_directory import BondDirectory
+        parallel = {'username': creds['username'], 'password': creds['password'], 'url': self.url, 'inst_type': self._institution_type(), 'observe': partial(controller.observe, self.institution), 'professors': BondDirectory(self.institution), 'archive': HistoryArchive(self.institution, creds['username'])}
+        parallel.update(controller.history_costs(self.institution))
+        return parallel
 
     async def get_enrollment(self, bond_id):
         bond = self._find_bond(bond_id)
@@ -296,11 +369,30 @@ class SigaaGateway:
     def backend_name(self):
         return self._backend.name
 
+    @property
+    def batch_details(self):
+        return self._backend.batch_details
+
     @classmethod
     async def login(cls, url, institution, username, password, credentials=None, keep_session=False):
         institution = (institution or 'UFAL').upper()
+        started = time.monotonic()
+        try:
+            gateway = await cls._login(url, institution, username, password, credentials, keep_session)
+        except (SigaaLoginFailed, SigaaQuestionnaire):
+            raise
+        except SigaaError:
+            latency_controller().observe(institution, 'login', ok=False)
+            raise
+        latency_controller().observe(institution, 'login', time.monotonic() - started)
+        return gateway
+
+    @classmethod
+    async def _login(cls, url, institution, username, password, credentials=None, keep_session=False):
         preference = _backend_preference()
-        if preference != LOCAL and is_configured():
+        if preference == REMOTE and is_configured() and get_client().cached_healthy() is False:
+            raise SigaaError('API do SIGAA indisponível: nenhum worker ativo.')
+        if _use_remote():
             try:
                 data = await get_client().create_session(url, institution, username, password)
                 backend = _RemoteBackend(data['session_id'], url, institution)
@@ -360,6 +452,48 @@ class SigaaGateway:
         gateway.login_info = {'name': name, 'bonds': bonds}
         return gateway
 
+    @classmethod
+    def warm_workers(cls, url, institution, username, password):
+        if not password or _use_remote():
+            return 0
+        from .sigaa_api.session_pool import get_session_pool
+        from .sigaa_api.enums import InstitutionType
+        try:
+            inst_type = InstitutionType[(institution or 'UFAL').upper()]
+        except KeyError:
+            inst_type = InstitutionType.IFAL
+        return get_session_pool().idle_count(url, inst_type, username, password)
+
+    @classmethod
+    async def lease_worker(cls, url, institution, username, password, credentials=None):
+        institution = (institution or 'UFAL').upper()
+        if _use_remote():
+            return await cls.login(url, institution, username, password, credentials=credentials, keep_session=True)
+        from .sigaa_api.session_pool import get_session_pool
+        from .sigaa_api.enums import InstitutionType
+        from .sigaa_api.exceptions import SigaaException, SigaaInvalidCredentials, SigaaQuestionnaireError
+        try:
+            inst_type = InstitutionType[institution]
+        except KeyError:
+            inst_type = InstitutionType.IFAL
+        started = time.monotonic()
+        try:
+            lease = await get_session_pool().acquire(url, inst_type, username, password)
+        except SigaaQuestionnaireError as e:
+            raise SigaaQuestionnaire(str(e))
+        except SigaaInvalidCredentials as e:
+            raise SigaaLoginFailed(str(e))
+        except SigaaException as e:
+            latency_controller().observe(institution, 'login', ok=False)
+            raise SigaaError(str(e))
+        if not lease.reused:
+            latency_controller().observe(institution, 'login', time.monotonic() - started)
+        backend = _LocalBackend(None, url, institution)
+        backend.attach_lease(lease)
+        gateway = cls(backend, url, institution, credentials)
+        gateway.login_info = None
+        return gateway
+
     @classmethod
     def from_state(cls, state, credentials=None):
         if not state:
@@ -384,6 +518,13 @@ class SigaaGateway:
         await self._enter_scope()
         try:
             yield self
+        except GeneratorExit:
+            raise
+        except BaseException:
+            # A scrape that blew up mid-navigation leaves the JSF view in an
+            # unknown state; the pooled session must not be handed out again.
+            self._backend.invalidate()
+            raise
         finally:
             await self._exit_scope()
 
@@ -403,6 +544,11 @@ class SigaaGateway:
         await self._enter_scope()
         try:
             yield
+        except GeneratorExit:
+            raise
+        except BaseException:
+            self._backend.invalidate()
+            raise
         finally:
             await self._exit_scope()
 
@@ -451,6 +597,7 @@ class SigaaGateway:
             return False
         depth, self._scope_depth = (self._scope_depth, 0)
         try:
+            self._backend.invalidate()
             await self._backend.close_scope()
         except Exception:
             logger.debug('Falha ao fechar o backend antigo no re-login.', exc_info=True)
@@ -469,11 +616,90 @@ class SigaaGateway:
         return await self._call('get_courses', bond_id)
 
     async def get_course_details(self, bond_id, course_id, skip_professor=False):
-        return await self._call('get_course_details', bond_id, course_id, skip_professor=skip_professor)
+        started = time.monotonic()
+        try:
+            details = await self._call('get_course_details', bond_id, course_id, skip_professor=skip_professor)
+        except (SigaaSessionExpired, SigaaQuestionnaire):
+            raise
+        except Exception:
+            latency_controller().observe(self.institution, 'scrape', ok=False)
+            raise
+        latency_controller().observe(self.institution, 'scrape', time.monotonic() - started)
+        return details
+
+    async def iter_course_details(self, bond_id, course_ids, skip_professor=False):
+        """Gera ``(course_id, details)`` para várias disciplinas. No backend
+        remoto vai tudo numa tarefa só; disciplina que falhou vem com a
+        exceção no lugar dos detalhes."""
+        pending = list(course_ids)
+        relogged = False
+        while pending:
+            if not self.batch_details:
+                for course_id in pending:
+                    try:
+                        yield (course_id, await self.get_course_details(bond_id, course_id, skip_professor=skip_professor))
+                    except (SigaaSessionExpired, SigaaQuestionnaire):
+                        raise
+                    except Exception as e:
+                        yield (course_id, e)
+                return
+            try:
+                async with self._auto_scope():
+                    last = time.monotonic()
+                    async for course_id, details in self._backend.iter_course_details(bond_id, pending, skip_professor=skip_professor):
+                        pending.remove(course_id)
+                        now = time.monotonic()
+                        if isinstance(details, Exception):
+                            latency_controller().observe(self.institution, 'scrape', ok=False)
+                            details = SigaaError(str(details))
+                        else:
+                            latency_controller().observe(self.institution, 'scrape', now - last)
+                        last = now
+                        yield (course_id, details)
+                return
+            except RemoteSessionExpired:
+                if relogged or not await self._relogin():
+                    raise SigaaSessionExpired('Sessão do SIGAA expirada.')
+                relogged = True
+            except RemoteQuestionnaireError as e:
+                raise SigaaQuestionnaire(str(e))
+            except RemoteUnavailable as e:
+                raise SigaaError(f'API do SIGAA indisponível: {e}')
+            except RemoteApiError as e:
+                raise SigaaError(str(e))
 
     async def get_history(self, bond_id, cached_history=None):
         return await self._call('get_history', bond_id, cached_history=cached_history)
 
+    async def iter_history(self, bond_id, cached_history=None):
+        """Gera ``('progress'|'partial', data)`` enquanto o histórico é montado
+        e termina com ``('result', history)``."""
+        relogged = False
+        while True:
+            started = False
+            try:
+                async with self._auto_scope():
+                    async for event in self._backend.iter_history(bond_id, cached_history=cached_history):
+                        started = True
+                        yield event
+                return
+            except Exception as e:
+                exc = self._backend.translate(e) or e
+                if isinstance(exc, (RemoteSessionExpired, SigaaSessionExpired)):
+                    if started or relogged or not await self._relogin():
+                        raise SigaaSessionExpired('Sessão do SIGAA expirada.') from e
+                    relogged = True
+                    continue
+                if isinstance(exc, RemoteQuestionnaireError):
+                    raise SigaaQuestionnaire(str(exc)) from e
+                if isinstance(exc, RemoteUnavailable):
+                    raise SigaaError(f'API do SIGAA indisponível: {exc}') from e
+                if isinstance(exc, RemoteApiError):
+                    raise SigaaError(str(exc)) from e
+                if exc is e:
+                    raise
+                raise exc from e
+
     async def get_institutional_data(self, bond_id):
         return await self._call('get_institutional_data', bond_id)
 
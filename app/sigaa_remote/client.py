@@ -1,21 +1,142 @@
+import asyncio
 import json
 import logging
 import os
+import random
+import socket
 import time
 import uuid
 from .errors import RemoteApiError, RemoteInvalidCredentials, RemoteQuestionnaireError, RemoteSessionExpired, RemoteUnavailable
+from ..sigaa_api.env import env_float
 logger = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 45
 HISTORY_TIMEOUT = 240
 DETAILS_TIMEOUT = 90
+HISTORY_IDLE_TIMEOUT = 120
+BATCH_DETAILS = os.environ.get('SIGAA_REMOTE_BATCH', '1') != '0'
+_UNSUPPORTED = ('unknown_action', 'invalid_action')
+REPLY_MODE = os.environ.get('SIGAA_REMOTE_REPLY', 'dispatch').strip().lower()
+_POLL_SECONDS = 1
+_SWEEP_INTERVAL = 1.0
+WORKERS_CACHE_SECONDS = 2
+WORKERS_KEY = 'sigaa:workers'
+
+HEARTBEAT_STALE_SECONDS = env_float('SIGAA_WORKER_HEARTBEAT_TTL', 30)
+MONITOR_INTERVAL = env_float('SIGAA_WORKER_MONITOR_INTERVAL', 2)
+LEGACY_SCAN_INTERVAL = env_float('SIGAA_WORKER_LEGACY_SCAN_INTERVAL', 60)
+LIVENESS_CHECK_SECONDS = 5
 
 def is_configured() -> bool:
     return bool(os.environ.get('SIGAA_REDIS_WORKERS'))
 
+class _ReplyDispatcher:
+    """Uma lista de respostas por processo (``sigaa:reply:<id>``) lida por uma
+    única corrotina, que entrega cada mensagem à fila do seu ``task_id``.
+
+    Assim as chamadas remotas em andamento não seguram uma conexão do pool
+    cada uma em BLPOP. No modo ``compat`` a corrotina também recolhe, a cada
+    segundo, ``sigaa:result:<task_id>`` das tarefas que ainda não responderam
+    pela lista do processo, para workers que ignoram ``reply_to``."""
+
+    def __init__(self, redis, sweep_legacy: bool=True):
+        self.redis = redis
+        self.reply_to = f'sigaa:reply:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.sweep_legacy = sweep_legacy
+        self._waiters: dict[str, asyncio.Queue] = {}
+        self._replied: set = set()
+        # Até algum worker responder pela lista do processo, cada tarefa faz
+        # BLPOP na própria chave legada (sem esperar a varredura).
+        self.reply_seen = False
+        self._task = None
+        self._swept_at = 0.0
+
+    def register(self, task_id: str):
+        self._waiters[task_id] = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def forget(self, task_id: str):
+        self._waiters.pop(task_id, None)
+        self._replied.discard(task_id)
+
+    async def get(self, task_id: str, timeout: float):
+        try:
+            return await asyncio.wait_for(self._waiters[task_id].get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_nowait(self, task_id: str):
+        queue = self._waiters.get(task_id)
+        if queue is None or queue.empty():
+            return None
+        return queue.get_nowait()
+
+    def _put(self, task_id, raw):
+        queue = self._waiters.get(task_id)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(json.loads(raw))
+        except ValueError:
+            logger.warning('Resposta inválida do worker SIGAA para a tarefa %s.', task_id)
+
+    async def _run(self):
+        while self._waiters:
+            try:
+                item = await self.redis.blpop(self.reply_to, timeout=_POLL_SECONDS)
+                if item is not None:
+                    raw = item[1]
+                    try:
+                        task_id = json.loads(raw).get('task_id')
+                    except (ValueError, AttributeError):
+                        task_id = None
+                    if task_id in self._waiters:
+                        self.reply_seen = True
+                        self._replied.add(task_id)
+                        self._put(task_id, raw)
+                if self.sweep_legacy and time.monotonic() - self._swept_at >= _SWEEP_INTERVAL:
+                    self._swept_at = time.monotonic()
+                    await self._sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('Leitura das respostas dos workers SIGAA falhou: %s', e)
+                await asyncio.sleep(_POLL_SECONDS)
+
+    async def _sweep(self):
+        task_ids = [t for t in self._waiters if t not in self._replied]
+        if not task_ids:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        for task_id in task_ids:
+            pipe.lrange(f'sigaa:result:{task_id}', 0, -1)
+            pipe.delete(f'sigaa:result:{task_id}')
+        results = await pipe.execute()
+        for task_id, items in zip(task_ids, results[::2]):
+            for raw in items or ():
+                self._put(task_id, raw)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+            self._task = None
+
 class SigaaRemoteClient:
 
     def __init__(self):
         self._redis = None
+        self._dispatcher = None
+        self._workers = None
+        self._workers_at = 0.0
+        self._task_workers: dict[str, tuple] = {}
+        self._monitor = None
+        self._legacy_registry_logged = False
+        self._legacy_ids = []
+        self._legacy_scanned_at = None
 
     def _get_redis(self):
         if self._redis is None:
@@ -23,58 +144,250 @@ class SigaaRemoteClient:
             self._redis = redis_client
         return self._redis
 
-    async def _request(self, action: str, payload: dict=None, timeout: float=None, session_id: str=None):
-        redis = self._get_redis()
-        task_id = uuid.uuid4().hex
-        task = {'task_id': task_id, 'action': action, 'payload': payload or {}, 'timestamp': int(time.time())}
-        queue = 'sigaa:tasks'
+    async def _route(self, session_id: str=None, worker_id: str=None):
+        """(fila, worker, sessão presa?) para a próxima tarefa. Sessão presa a
+        um worker sem heartbeat falha na hora: a sessão morreu com ele."""
+        if worker_id:
+            return (f'sigaa:worker:{worker_id}:tasks', worker_id, False)
         if session_id:
-            worker_id = await redis.get(f'sigaa:session:{session_id}:worker')
+            pinned = f'sigaa:session:{session_id}:worker'
+            worker_id = await self._get_redis().get(pinned)
             if worker_id:
-                queue = f'sigaa:worker:{worker_id}:tasks'
-        await redis.lpush(queue, json.dumps(task))
-        result_key = f'sigaa:result:{task_id}'
-        timeout_seconds = int(timeout or DEFAULT_TIMEOUT)
-        result = await redis.blpop(result_key, timeout=timeout_seconds)
-        if result is None:
-            raise RemoteUnavailable('Nenhum worker SIGAA respondeu a tempo.')
-        _, raw_response = result
-        response = json.loads(raw_response)
+                # O pino não é apagado: se o heartbeat voltar, a sessão segue valendo até o TTL dela.
+                if await self._worker_alive(worker_id) is False:
+                    raise RemoteSessionExpired(503, 'worker_lost', f'Worker SIGAA {worker_id} parou de responder.')
+                return (f'sigaa:worker:{worker_id}:tasks', worker_id, True)
+        return ('sigaa:tasks', None, False)
+
+    def _get_dispatcher(self):
+        if REPLY_MODE == 'blpop':
+            return None
+        if self._dispatcher is None:
+            self._dispatcher = _ReplyDispatcher(self._get_redis(), sweep_legacy=REPLY_MODE != 'dispatch')
+        return self._dispatcher
+
+    async def _enqueue(self, tasks: list, session_id: str=None, worker_id: str=None) -> list:
+        """Enfileira os pares ``(action, payload)`` num único LPUSH e devolve
+        os task_ids na mesma ordem. Quem enfileira chama ``_forget`` no fim."""
+        now = int(time.time())
+        dispatcher = self._get_dispatcher()
+        entries = [{'task_id': uuid.uuid4().hex, 'action': action, 'payload': payload or {}, 'timestamp': now} for action, payload in tasks]
+        if dispatcher is not None:
+            for task in entries:
+                task['reply_to'] = dispatcher.reply_to
+                dispatcher.register(task['task_id'])
+        task_ids = [task['task_id'] for task in entries]
+        try:
+            queue, target, pinned = await self._route(session_id, worker_id)
+            await self._get_redis().lpush(queue, *(json.dumps(task) for task in entries))
+        except BaseException:
+            self._forget(task_ids)
+            raise
+        for task_id in task_ids:
+            self._task_workers[task_id] = (target, pinned)
+        return task_ids
+
+    async def _wait_once(self, task_id: str, timeout: float):
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            if not dispatcher.sweep_legacy or dispatcher.reply_seen:
+                return await dispatcher.get(task_id, timeout)
+            # compat sem worker novo confirmado: BLPOP curto na chave legada,
+            # olhando a fila do dispatcher entre uma espera e outra.
+            ready = dispatcher.get_nowait(task_id)
+            if ready is not None:
+                return ready
+            timeout = min(timeout, _POLL_SECONDS)
+        result = await self._get_redis().blpop(f'sigaa:result:{task_id}', timeout=max(1, int(timeout)))
+        return json.loads(result[1]) if result is not None else None
+
+    async def _receive(self, task_id: str, timeout: float=None) -> dict:
+        """Espera a próxima mensagem da tarefa, conferindo a cada
+        ``LIVENESS_CHECK_SECONDS`` se ainda há worker vivo para respondê-la."""
+        deadline = time.monotonic() + (timeout or DEFAULT_TIMEOUT)
+        target, pinned = self._task_workers.get(task_id, (None, False))
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RemoteUnavailable('Nenhum worker SIGAA respondeu a tempo.')
+            response = await self._wait_once(task_id, min(LIVENESS_CHECK_SECONDS, remaining))
+            if response is not None:
+                return response
+            if target is not None:
+                if await self._worker_alive(target) is False:
+                    if pinned:
+                        raise RemoteSessionExpired(503, 'worker_lost', f'Worker SIGAA {target} parou de responder.')
+                    raise RemoteUnavailable(f'Worker SIGAA {target} parou de responder.')
+                continue
+            workers = await self._live_workers()
+            if workers is not None and (not workers):
+                raise RemoteUnavailable('Nenhum worker SIGAA ativo.')
+
+    def _forget(self, task_ids):
+        for task_id in task_ids:
+            self._task_workers.pop(task_id, None)
+            if self._dispatcher is not None:
+                self._dispatcher.forget(task_id)
+
+    async def _discard(self, task_id: str):
+        """Abandona uma tarefa que ainda pode mandar mensagens."""
+        self._forget([task_id])
+        if self._dispatcher is None or self._dispatcher.sweep_legacy:
+            try:
+                await self._get_redis().delete(f'sigaa:result:{task_id}')
+            except Exception:
+                pass
+
+    async def _request(self, action: str, payload: dict=None, timeout: float=None, session_id: str=None, worker_id: str=None):
+        task_id, = await self._enqueue([(action, payload)], session_id=session_id, worker_id=worker_id)
+        try:
+            response = await self._receive(task_id, timeout)
+        finally:
+            self._forget([task_id])
         if not response.get('success'):
-            error = response.get('error', {})
-            self._raise_for_error(error)
+            self._raise_for_error(response.get('error', {}))
         return response.get('data', {})
 
     @staticmethod
-    def _raise_for_error(error: dict):
+    def _error(error: dict) -> RemoteApiError:
         code = error.get('code')
         detail = error.get('detail')
         status_code = error.get('status_code', 500)
         if code in ('session_not_found', 'sigaa_session_expired'):
-            raise RemoteSessionExpired(status_code, code, detail)
+            return RemoteSessionExpired(status_code, code, detail)
         if code == 'questionnaire':
-            raise RemoteQuestionnaireError(status_code, code, detail)
+            return RemoteQuestionnaireError(status_code, code, detail)
         if code == 'invalid_credentials':
-            raise RemoteInvalidCredentials(status_code, code, detail)
-        raise RemoteApiError(status_code, code, detail)
+            return RemoteInvalidCredentials(status_code, code, detail)
+        return RemoteApiError(status_code, code, detail)
+
+    @classmethod
+    def _raise_for_error(cls, error: dict):
+        raise cls._error(error)
+
+    @staticmethod
+    def _parse_heartbeat(raw, depth: int=0) -> dict:
+        """Heartbeat em JSON (``load``, ``capacity``, ``queue_depth``); o
+        formato antigo, sem carga, conta como worker ocioso de capacidade 1."""
+        try:
+            info = json.loads(raw) if raw else {}
+        except (TypeError, ValueError):
+            info = {}
+        if not isinstance(info, dict):
+            info = {}
+        try:
+            load = max(0.0, float(info.get('load') or 0))
+            capacity = max(1, int(info.get('capacity') or 1))
+            queue_depth = max(int(info.get('queue_depth') or 0), depth)
+        except (TypeError, ValueError):
+            load, capacity, queue_depth = (0.0, 1, depth)
+        return {'load': load, 'capacity': capacity, 'queue_depth': queue_depth, 'score': (load + queue_depth) / capacity}
+
+    async def _registered_ids(self, redis):
+        ids = await redis.zrangebyscore(WORKERS_KEY, time.time() - HEARTBEAT_STALE_SECONDS, '+inf')
+        if ids or await redis.exists(WORKERS_KEY):
+            return (ids, False)
+        # Workers antigos só gravam a chave de heartbeat; o SCAN fica restrito
+        # a esse caso e ao monitor em segundo plano.
+        # O SCAN roda no máximo a cada LEGACY_SCAN_INTERVAL; entre uma varredura
+        # e outra, workers() confere os ids já achados com um MGET dos heartbeats.
+        now = time.monotonic()
+        if self._legacy_scanned_at is not None and now - self._legacy_scanned_at < LEGACY_SCAN_INTERVAL:
+            return (self._legacy_ids, True)
+        if not self._legacy_registry_logged:
+            self._legacy_registry_logged = True
+            logger.warning('Registro %s vazio; procurando heartbeats por SCAN a cada %ss (workers sem ZADD).', WORKERS_KEY, LEGACY_SCAN_INTERVAL)
+        keys = []
+        cursor = 0
+        while True:
+            cursor, batch = await redis.scan(cursor, match='sigaa:worker:*:heartbeat', count=1000)
+            keys.extend(batch)
+            if cursor == 0:
+                break
+        self._legacy_ids = [key.split(':')[2] for key in keys]
+        self._legacy_scanned_at = now
+        return (self._legacy_ids, True)
+
+    async def workers(self, force: bool=False) -> dict:
+        """Workers vivos segundo o registro ``sigaa:workers`` (ZSET com o
+        horário do último heartbeat) e a carga de cada um, em cache por
+        ``WORKERS_CACHE_SECONDS``."""
+        now = time.monotonic()
+        if not force and self._workers is not None and now - self._workers_at < WORKERS_CACHE_SECONDS:
+            return self._workers
+        redis = self._get_redis()
+        ids, legacy = await self._registered_ids(redis)
+        workers = {}
+        if ids:
+            pipe = redis.pipeline(transaction=False)
+            pipe.mget([f'sigaa:worker:{worker_id}:heartbeat' for worker_id in ids])
+            for worker_id in ids:
+                pipe.llen(f'sigaa:worker:{worker_id}:tasks')
+            results = await pipe.execute()
+            for worker_id, raw, depth in zip(ids, results[0], results[1:]):
+                if raw is not None or not legacy:
+                    workers[worker_id] = self._parse_heartbeat(raw, depth or 0)
+        self._workers = workers
+        self._workers_at = time.monotonic()
+        return workers
+
+    def cached_healthy(self):
+        """Saúde pela última leitura do monitor, sem ir ao Redis: True/False,
+        ou None se a leitura estiver velha demais para decidir."""
+        if self._workers is None or time.monotonic() - self._workers_at > max(3 * MONITOR_INTERVAL, WORKERS_CACHE_SECONDS):
+            return None
+        return bool(self._workers)
+
+    def start_monitor(self):
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.get_running_loop().create_task(self._run_monitor())
+
+    async def _run_monitor(self):
+        was_healthy = None
+        while True:
+            try:
+                healthy = bool(await self.workers(force=True))
+                await self._get_redis().zremrangebyscore(WORKERS_KEY, '-inf', time.time() - 10 * HEARTBEAT_STALE_SECONDS)
+                if was_healthy is not None and healthy != was_healthy:
+                    logger.warning('Workers SIGAA %s.', 'disponíveis novamente' if healthy else 'indisponíveis')
+                was_healthy = healthy
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug('Monitor dos workers SIGAA falhou: %s', e)
+            await asyncio.sleep(MONITOR_INTERVAL)
+
+    async def _worker_alive(self, worker_id: str):
+        """EXISTS na chave de heartbeat do worker; None se o Redis falhar."""
+        try:
+            return bool(await self._get_redis().exists(f'sigaa:worker:{worker_id}:heartbeat'))
+        except Exception as e:
+            logger.debug('Heartbeat do worker SIGAA %s indisponível: %s', worker_id, e)
+            return None
+
+    async def _live_workers(self):
+        try:
+            return await self.workers()
+        except Exception as e:
+            logger.debug('Lista de workers SIGAA indisponível: %s', e)
+            return None
+
+    async def least_loaded_worker(self):
+        workers = await self._live_workers()
+        if not workers:
+            return None
+        best = min((w['score'] for w in workers.values()))
+        return random.choice([worker_id for worker_id, w in workers.items() if w['score'] == best])
 
     async def healthy(self, force: bool=False) -> bool:
         try:
-            redis = self._get_redis()
-            cursor = 0
-            while True:
-                cursor, keys = await redis.scan(cursor, match='sigaa:worker:*:heartbeat', count=10)
-                if keys:
-                    return True
-                if cursor == 0:
-                    break
-            return False
+            return bool(await self.workers(force=force))
         except Exception as e:
             logger.warning('Health check dos workers SIGAA falhou: %s', e)
             return False
 
     async def create_session(self, url, institution, username, password):
-        return await self._request('create_session', {'url': url, 'institution': institution, 'username': username, 'password': password})
+        return await self._request('create_session', {'url': url, 'institution': institution, 'username': username, 'password': password}, worker_id=await self.least_loaded_worker())
 
     async def list_bonds(self, session_id):
         return await self._request('list_bonds', {'session_id': session_id}, session_id=session_id)
@@ -85,9 +398,114 @@ class SigaaRemoteClient:
     async def course_details(self, session_id, bond_id, course_id):
         return await self._request('course_details', {'session_id': session_id, 'bond_id': bond_id, 'course_id': course_id}, timeout=DETAILS_TIMEOUT, session_id=session_id)
 
+    async def course_details_many(self, session_id, bond_id, course_ids):
+        """Gera ``(course_id, details)`` conforme o worker termina cada disciplina.
+
+        Sai uma única tarefa ``course_details_many``; o worker empurra uma
+        mensagem por disciplina na mesma lista de resultado e fecha com
+        ``{"done": true}``. Disciplina que falhou vem com a exceção no lugar
+        dos detalhes; sessão expirada ou questionário abortam o lote. Worker
+        que não conhece a ação recebe tarefas ``course_details`` avulsas,
+        enfileiradas num só LPUSH."""
+        course_ids = list(course_ids)
+        if not course_ids:
+            return
+        by_key = {str(c): c for c in course_ids}
+        task_id, = await self._enqueue([('course_details_many', {'session_id': session_id, 'bond_id': bond_id, 'course_ids': course_ids})], session_id=session_id)
+        done = False
+        try:
+            while True:
+                if by_key:
+                    response = await self._receive(task_id, DETAILS_TIMEOUT)
+                else:
+                    # Tudo entregue; só falta o {"done": true}. Se ele atrasar,
+                    # o finally apaga a lista de resultado.
+                    response = await self._wait_once(task_id, LIVENESS_CHECK_SECONDS)
+                    if response is None:
+                        break
+                if response.get('done'):
+                    done = True
+                    break
+                course_id = by_key.pop(str(response.get('course_id')), None)
+                if response.get('success'):
+                    if course_id is not None:
+                        yield (course_id, response.get('data', {}))
+                    continue
+                error = self._error(response.get('error', {}))
+                if course_id is None:
+                    if error.code in _UNSUPPORTED:
+                        done = True
+                        logger.info('Worker SIGAA sem course_details_many; enviando as disciplinas em tarefas separadas.')
+                        async for entry in self._course_details_each(session_id, bond_id, course_ids):
+                            yield entry
+                        return
+                    raise error
+                if isinstance(error, (RemoteSessionExpired, RemoteQuestionnaireError)):
+                    raise error
+                yield (course_id, error)
+        finally:
+            if done:
+                self._forget([task_id])
+            else:
+                await self._discard(task_id)
+
+    async def _course_details_each(self, session_id, bond_id, course_ids):
+        task_ids = await self._enqueue([('course_details', {'session_id': session_id, 'bond_id': bond_id, 'course_id': c}) for c in course_ids], session_id=session_id)
+        # A sessão fica presa a um worker que atende em ordem; ler em sequência
+        # não atrasa nada e, sem o dispatcher, segura uma conexão do pool por vez.
+        received = 0
+        try:
+            for course_id, task_id in zip(course_ids, task_ids):
+                response = await self._receive(task_id, DETAILS_TIMEOUT)
+                received += 1
+                self._forget([task_id])
+                if response.get('success'):
+                    yield (course_id, response.get('data', {}))
+                    continue
+                error = self._error(response.get('error', {}))
+                if isinstance(error, (RemoteSessionExpired, RemoteQuestionnaireError)):
+                    raise error
+                yield (course_id, error)
+        finally:
+            for task_id in task_ids[received:]:
+                await self._discard(task_id)
+
     async def history(self, session_id, bond_id, cached_history=None, parallel=True):
         return await self._request('history', {'session_id': session_id, 'bond_id': bond_id, 'cached_history': cached_history, 'parallel': parallel}, timeout=HISTORY_TIMEOUT, session_id=session_id)
 
+    async def history_stream(self, session_id, bond_id, cached_history=None, parallel=True):
+        """Gera ``(kind, data)`` enquanto o worker monta o histórico.
+
+        Com ``stream`` no payload o worker pode empurrar, antes da resposta
+        final, mensagens ``{"success": true, "type": "progress"|"partial",
+        "data": ...}`` na mesma lista de resultado; ``partial`` traz um
+        semestre pronto (``{"semester", "subjects"}``). A resposta final é a
+        de sempre e sai como ``("result", history)``. Worker antigo ignora a
+        flag e manda só a final."""
+        task_id, = await self._enqueue([('history', {'session_id': session_id, 'bond_id': bond_id, 'cached_history': cached_history, 'parallel': parallel, 'stream': True})], session_id=session_id)
+        finished = False
+        timeout = HISTORY_TIMEOUT
+        try:
+            while True:
+                response = await self._receive(task_id, timeout)
+                if not response.get('success'):
+                    finished = True
+                    self._raise_for_error(response.get('error', {}))
+                kind = response.get('type')
+                if kind in ('progress', 'partial'):
+                    # Worker que manda progresso está vivo: o teto entre mensagens pode cair.
+                    timeout = HISTORY_IDLE_TIMEOUT
+                    yield (kind, response.get('data') or {})
+                    continue
+                finished = True
+                yield ('result', (response.get('data') or {}).get('history', {}))
+                return
+        finally:
+            if finished:
+                self._forget([task_id])
+            else:
+                await self._discard(task_id)
+
     async def enrollment_disciplines(self, session_id, bond_id):
         return await self._request('enrollment', {'session_id': session_id, 'bond_id': bond_id}, timeout=DETAILS_TIMEOUT, session_id=session_id)
 
@@ -101,7 +519,16 @@ class SigaaRemoteClient:
         return await self._request('close_session', {'session_id': session_id}, session_id=session_id)
 
     async def aclose(self):
-        pass
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except BaseException:
+                pass
+            self._monitor = None
+        if self._dispatcher is not None:
+            await self._dispatcher.aclose()
+            self._dispatcher = None
 _client = None
 
 def get_client():
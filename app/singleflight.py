@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from .sigaa_api.env import env_int
+logger = logging.getLogger(__name__)
+
+LOCK_TTL = env_int('SINGLEFLIGHT_LOCK_TTL', 300)
+RESULT_TTL = env_int('SINGLEFLIGHT_RESULT_TTL', 30)
+POLL_SECONDS = 1.0
+_CHANNEL = 'singleflight:done'
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """Junta chamadas concorrentes à mesma operação num único scrape; o resultado precisa ser JSON."""
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._events: dict[str, asyncio.Event] = {}
+        self._listener = None
+        self._release = None
+
+    @staticmethod
+    def key(institution: str, username: str, operation: str) -> str:
+        return f'{(institution or "").upper()}:{username}:{operation}'
+
+    async def do(self, key: str, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        else:
+            logger.info(f'Single-flight: {key} já está em andamento neste processo; aguardando o resultado.')
+        # shield: se quem iniciou desistir (aba fechada), os outros ainda recebem o resultado.
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def _run(self, key: str, fn):
+        from .cache import client
+        token = uuid.uuid4().hex
+        for _ in range(2):
+            try:
+                acquired = await client.set(f'singleflight:lock:{key}', token, nx=True, ex=LOCK_TTL)
+            except Exception as exc:
+                logger.warning(f'Single-flight sem Redis ({exc}); coalescendo só neste processo.')
+                return await fn()
+            if acquired:
+                return await self._lead(key, fn, token)
+            logger.info(f'Single-flight: {key} em andamento em outro processo; aguardando o resultado.')
+            outcome = await self._follow(key)
+            if outcome is not None and outcome.get('ok'):
+                return outcome.get('value')
+        return await fn()
+
+    async def _lead(self, key: str, fn, token: str):
+        from .cache import client
+        try:
+            value = await fn()
+        except BaseException:
+            await self._publish(key, {'ok': False})
+            raise
+        finally:
+            try:
+                if self._release is None:
+                    self._release = client.register_script(_RELEASE_LUA)
+                await self._release(keys=[f'singleflight:lock:{key}'], args=[token])
+            except Exception as exc:
+                logger.debug(f'Single-flight: falha ao liberar o lock de {key}: {exc}')
+        await self._publish(key, {'ok': True, 'value': value})
+        return value
+
+    async def _publish(self, key: str, outcome: dict):
+        from .cache import client
+        try:
+            payload = json.dumps(outcome)
+        except (TypeError, ValueError) as exc:
+            logger.warning(f'Single-flight: resultado de {key} não serializável ({exc}); os outros processos refazem a consulta.')
+            payload = json.dumps({'ok': False})
+        try:
+            await client.set(f'singleflight:result:{key}', payload, ex=RESULT_TTL)
+            await client.publish(_CHANNEL, key)
+        except Exception as exc:
+            logger.debug(f'Single-flight: falha ao publicar o resultado de {key}: {exc}')
+
+    async def _read_result(self, key: str):
+        from .cache import client
+        raw = await client.get(f'singleflight:result:{key}')
+        try:
+            return json.loads(raw) if raw else None
+        except ValueError:
+            return None
+
+    async def _follow(self, key: str):
+        from .cache import client
+        event = self._events.setdefault(key, asyncio.Event())
+        self._ensure_listener()
+        deadline = time.monotonic() + LOCK_TTL
+        try:
+            while time.monotonic() < deadline:
+                outcome = await self._read_result(key)
+                if outcome is not None:
+                    return outcome
+                if not await client.exists(f'singleflight:lock:{key}'):
+                    return await self._read_result(key)
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except Exception as exc:
+            logger.warning(f'Single-flight: espera por {key} falhou ({exc}).')
+        finally:
+            self._events.pop(key, None)
+        return None
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        from .cache import client
+        delay = 1
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(_CHANNEL)
+                delay = 1
+                async for message in pubsub.listen():
+                    event = self._events.get(str(message.get('data') or ''))
+                    if event is not None:
+                        event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.debug(f'Single-flight: listener caiu ({exc}); a espera segue por polling.')
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def aclose(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except BaseException:
+                pass
+            self._listener = None
+_singleflight = None
+
+def get_singleflight() -> SingleFlight:
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight()
+    return _singleflight
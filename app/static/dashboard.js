@@ -980,7 +980,21 @@ let data = [];
           }
           if (!isHistoryMode) { data = liveData; mRenderGroupedList(); }
         }
+      } else if (msg.type === 'portal_snapshot') {
+        // Retrato da última carga: aparece na hora; os eventos ao vivo sobrescrevem o que mudou.
+        (msg.courses || []).forEach(c => {
+          if (c.id === undefined || liveData.some(d => String(d.id) === String(c.id))) return;
+          liveData.push({ ...(c.data || {}), id: String(c.id), name: c.name, obs: c.obs, frequency: c.frequency, isLoading: false, isRefreshing: true, provisional: true });
+        });
+        if (liveData.length) document.getElementById('empty-list-msg').style.display = 'none';
+        if (!isHistoryMode) {
+          data = liveData; mRenderGroupedList(); updateHeader();
+          if (document.getElementById('view-frequency').classList.contains('active')) renderFrequency();
+        }
       } else if (msg.type === 'course_start') {
+        const prev = liveData.find(d => String(d.id) === String(msg.id));
+        // A lista de disciplinas mudou desde o retrato: descarta o provisório com o mesmo id.
+        if (prev && prev.provisional && prev.name !== msg.name) liveData = liveData.filter(d => d !== prev);
         addOrUpdateCourse({ id: String(msg.id), name: msg.name, obs: msg.obs, isRefreshing: true });
         document.getElementById('empty-list-msg').style.display = 'none';
         if (!isHistoryMode) {
@@ -1004,7 +1018,7 @@ let data = [];
           logCourseCode(liveData[idx].name, msg.data);
           const current = liveData[idx];
           const isNew = current.grades && current.grades.length > 0 ? !deepEqual(current.grades, msg.data.grades) : false;
-          liveData[idx] = { ...liveData[idx], ...msg.data, id: String(msg.data.id || msg.id), isLoading: false, isNew: isNew, sync_time: Date.now() };
+          liveData[idx] = { ...liveData[idx], ...msg.data, id: String(msg.data.id || msg.id), isLoading: false, isNew: isNew, provisional: false, sync_time: Date.now() };
           if (!isHistoryMode) {
             data = liveData; mRenderGroupedList(); updateHeader();
             if (isNew) {
@@ -1015,6 +1029,16 @@ let data = [];
             }
           }
         }
+      } else if (msg.type === 'course_cached') {
+        // Dados da última consulta ao SIGAA (ainda dentro do intervalo de reconsulta): provisórios até a próxima.
+        const idx = liveData.findIndex(d => String(d.id) === String(msg.id));
+        if (idx !== -1) {
+          const checkedAt = msg.checked_at ? msg.checked_at * 1000 : Date.now();
+          const patch = { ...(msg.data || {}), id: String(msg.id), isLoading: false, isRefreshing: false, provisional: true, checkedAt: checkedAt, sync_time: checkedAt };
+          if (msg.frequency) patch.frequency = msg.frequency;
+          liveData[idx] = { ...liveData[idx], ...patch };
+          if (!isHistoryMode) { data = liveData; mRenderGroupedList(); updateHeader(); }
+        }
       } else if (msg.type === 'sync_end') {
           if (!profileData || !profileData.history_raw || Object.keys(profileData.history_raw).length === 0) {
               loadAcademicProfile(true, true); // silent background fetch, forced to bypass empty cache
@@ -1219,6 +1243,9 @@ let data = [];
           if (item.professor && item.professor !== "Desconhecido") {
               subInfo += ` • Prof. ${escapeHtml(formatProfName(item.professor))}`;
           }
+          if (item.provisional && item.checkedAt) {
+              subInfo += ` • verificado há ${Math.max(1, Math.round((Date.now() - item.checkedAt) / 60000))} min`;
+          }
           let detailBadges = '';
           if (st.details) {
             const styling = st.details.styling || {};
@@ -1558,16 +1585,34 @@ let data = [];
       const content = document.getElementById('academic-profile-content');
       if (profileData && Object.keys(profileData.history_raw || {}).length > 0 && !force) { renderAcademicProfileData(); content.style.display = 'block'; loading.style.display = 'none'; return; }
       const isDemo = window.location.pathname === '/demo';
-      if (!profileData) { loading.style.display = 'block'; content.style.display = 'none'; }
+      if (!profileData) { loading.textContent = 'Carregando histórico completo...'; loading.style.display = 'block'; content.style.display = 'none'; }
       else { const btn = document.getElementById('btn-force-update'); if (btn) { btn.disabled = true; btn.textContent = 'Atualizando...'; } }
       try {
         if (isDemo) {
           await new Promise(r => setTimeout(r, 800));
           profileData = { general_average: 8.7, best_grade: 10.0, best_subject: "Programação Web", semesters: [{ semester: "2023.1", average: 7.5, count: 5 }, { semester: "2023.2", average: 8.2, count: 5 }, { semester: "2024.1", average: 8.5, count: 6 }], history_raw: {} };
         } else {
-          const resp = await fetch(force ? '/api/academic_profile?force=true' : '/api/academic_profile');
+          const resp = await fetch(force ? '/api/academic_profile?stream=1&force=true' : '/api/academic_profile?stream=1');
+          let errData = null;
           if (!resp.ok) {
-            const errData = await resp.json().catch(() => ({}));
+            errData = await resp.json().catch(() => ({}));
+          } else if ((resp.headers.get('content-type') || '').includes('ndjson')) {
+            // Semestres chegam conforme o worker termina; o perfil final substitui o provisório.
+            const hadProfile = profileData && Object.keys(profileData.history_raw || {}).length > 0;
+            const result = await readProfileStream(resp, (msg) => {
+              if (!hadProfile) loading.textContent = `Carregando histórico completo... (${msg.done}/${msg.total} disciplinas)`;
+            }, (partial) => {
+              if (hadProfile) return;
+              profileData = partial;
+              renderAcademicProfileData();
+              content.style.display = 'block';
+            });
+            if (result.error) errData = result;
+            else profileData = result;
+          } else {
+            profileData = await resp.json();
+          }
+          if (errData) {
             if (errData.is_questionnaire) {
               const strip = document.getElementById('m-alert-strip');
               if (strip) {
@@ -1581,7 +1626,6 @@ let data = [];
             }
             throw new Error(errData.error || "Failed");
           }
-          profileData = await resp.json();
         }
 
         if (profileData && profileData.history_raw) {
@@ -1640,6 +1684,32 @@ let data = [];
       }
     }
 
+    async function readProfileStream(resp, onProgress, onPartial) {
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let result = null;
+      const handle = (line) => {
+        if (!line.trim()) return;
+        let msg;
+        try { msg = JSON.parse(line); } catch (e) { return; }
+        if (msg.error) result = msg;
+        else if (msg.type === 'history_progress') onProgress(msg);
+        else if (msg.type === 'profile_partial') onPartial(msg.data);
+        else if (msg.type === 'profile_data') result = msg.data;
+      };
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handle);
+      }
+      handle(buffer);
+      return result || { error: 'Histórico incompleto.' };
+    }
+
     function renderAcademicProfileData() {
       if (!profileData) return;
       document.getElementById('prof-general-avg').textContent = profileData.general_average;
@@ -0,0 +1,173 @@
+"""Benchmark dos parsers do SIGAA sobre páginas gravadas e anonimizadas.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.parsers                 # compara com benchmarks/baseline.json
+    python -m benchmarks.parsers --save          # regrava o baseline
+    python -m benchmarks.parsers --only bulletin --iterations 500
+
+Cada caso reconstrói a SigaaPage a cada chamada, então a latência inclui o
+parse do DOM, como acontece em produção.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.sigaa_api.account import Account
+from app.sigaa_api.bond import StudentBond
+from app.sigaa_api.course import Course
+from app.sigaa_api.enrollment_parser import parse_enrollment_page
+from app.sigaa_api.page import SigaaPage
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BASE_URL = 'https://sigaa.example.edu.br'
+REGRESSION_THRESHOLD = 1.25
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+def _page(body, path):
+    # Bytes + encoding, como SigaaSession entrega as páginas.
+    return SigaaPage(f'{BASE_URL}{path}', body, {}, 'GET', 200, encoding='utf-8')
+
+def _course():
+    form_data = {'action': f'{BASE_URL}/sigaa/portais/discente/discente.jsf', 'post_values': {'idTurma': '50000'}}
+    return Course(None, 'MAT100 - CÁLCULO DIFERENCIAL E INTEGRAL', form_data, schedule_code='24M12')
+
+def build_cases():
+    portal = _fixture('portal.html')
+    turmas = _fixture('turmas.html')
+    grades = _fixture('grades.html')
+    frequency = _fixture('frequency.html')
+    bulletin = _fixture('bulletin.html')
+    enrollment = _fixture('enrollment.html').decode('utf-8')
+    bonds = _fixture('bonds.html')
+    with open(os.path.join(FIXTURES, 'turmas_cached_history.json'), encoding='utf-8') as f:
+        cached_history = json.load(f)
+    bond = StudentBond(None, '2021000001', 'CIÊNCIA DA COMPUTAÇÃO')
+    loop = asyncio.new_event_loop()
+
+    def previous_classes():
+        page = _page(turmas, '/sigaa/portais/discente/turmas.jsf')
+        return loop.run_until_complete(bond._parse_previous_classes(page, cached_history=cached_history))
+    cases = {
+        'parse_courses': lambda: bond._parse_courses(_page(portal, '/sigaa/portais/discente/discente.jsf')),
+        'parse_bulletin': lambda: bond._parse_bulletin(_page(bulletin, '/sigaa/portais/discente/discente.jsf')),
+        'parse_previous_classes': previous_classes,
+        'parse_grades': lambda: _course()._parse_grades(_page(grades, '/sigaa/ava/index.jsf')),
+        'parse_frequency': lambda: _course()._parse_frequency(_page(frequency, '/sigaa/ava/index.jsf')),
+        'parse_enrollment_page': lambda: parse_enrollment_page(enrollment),
+        'parse_bond_page': lambda: Account(None, _page(bonds, '/sigaa/vinculos.jsf')).active_bonds,
+    }
+    return cases, loop
+
+def _check(name, result):
+    # Um parser que passa a devolver vazio fica "rápido" — isso não é ganho.
+    if not result:
+        raise SystemExit(f'{name}: parser devolveu resultado vazio para a fixture; benchmark inválido.')
+
+def measure(name, func, iterations, warmup):
+    _check(name, func())
+    for _ in range(warmup):
+        func()
+    gc.collect()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - start)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start_current, _ = tracemalloc.get_traced_memory()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    alloc_blocks = sum(s.count_diff for s in after.compare_to(before, 'lineno') if s.count_diff > 0)
+    samples.sort()
+    to_ms = lambda ns: round(ns / 1000000.0, 4)
+    return {
+        'iterations': iterations,
+        'mean_ms': to_ms(statistics.fmean(samples)),
+        'median_ms': to_ms(statistics.median(samples)),
+        'p95_ms': to_ms(samples[min(len(samples) - 1, int(len(samples) * 0.95))]),
+        'min_ms': to_ms(samples[0]),
+        'alloc_peak_bytes': max(0, peak - start_current),
+        'retained_bytes': max(0, current - start_current),
+        'retained_blocks': alloc_blocks,
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+
+def _peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reporta bytes, Linux reporta KiB.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def compare(results, baseline):
+    regressions = []
+    base_cases = baseline.get('cases', {})
+    print(f"{'caso':<26}{'mediana ms':>12}{'baseline':>12}{'razão':>9}{'pico alloc KiB':>16}")
+    for name, res in results.items():
+        base = base_cases.get(name)
+        ratio = ''
+        base_ms = ''
+        if base and base.get('median_ms'):
+            r = res['median_ms'] / base['median_ms']
+            ratio = f'{r:.2f}x'
+            base_ms = f"{base['median_ms']:.3f}"
+            if r > REGRESSION_THRESHOLD:
+                regressions.append((name, r))
+        print(f"{name:<26}{res['median_ms']:>12.3f}{base_ms:>12}{ratio:>9}{res['alloc_peak_bytes'] / 1024:>16.1f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dos parsers do SIGAA.')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', action='append', help='Roda apenas o caso indicado (pode repetir).')
+    parser.add_argument('--save', action='store_true', help='Grava os resultados como novo baseline.')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--output', help='Grava os resultados desta execução neste arquivo JSON.')
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    cases, loop = build_cases()
+    try:
+        selected = {k: v for k, v in cases.items() if not args.only or k in args.only}
+        results = {name: measure(name, func, args.iterations, args.warmup) for name, func in selected.items()}
+    finally:
+        loop.close()
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'cases': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f'Baseline gravado em {args.baseline}')
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline)
+    if regressions and not args.save:
+        for name, r in regressions:
+            print(f'REGRESSÃO: {name} está {r:.2f}x mais lento que o baseline.')
+        return 1
+    return 0
+if __name__ == '__main__':
+    sys.exit(main())
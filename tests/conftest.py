@@ -0,0 +1,10 @@
+import pytest
+from app import extensions
+
+@pytest.fixture
+async def db(tmp_path):
+    extensions.init_db(f'sqlite:///{tmp_path}/test.db')
+    import app.models
+    await extensions.create_tables()
+    yield extensions.db_session
+    await extensions.close_db()
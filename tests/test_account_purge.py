@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select
+from app import cache, extensions
+from app.history_archive import HistoryArchive
+from app.models import HistoricoTurma, LinkedAccount, User
+
+class FakeRedis:
+
+    def __init__(self):
+        self.deleted = []
+
+    async def delete(self, key):
+        self.deleted.append(key)
+
+    async def publish(self, channel, message):
+        pass
+
+def _subject(name):
+    return {'name': name, 'final_grade': 8.0, 'absences': 0, 'status': 'Aprovado', 'grades': [], 'professor': 'FULANO'}
+
+@pytest.fixture
+async def client(db, tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path}/test.db')
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    from app import create_app, routes
+    app = create_app()
+    monkeypatch.setattr(routes, 'db_session', extensions.db_session)
+    monkeypatch.setattr(cache, 'client', FakeRedis())
+    return app.test_client()
+
+async def _seed(db):
+    async with db() as s:
+        user = User(google_id='g1', email='ana@example.com')
+        s.add(user)
+        await s.flush()
+        for username in ('ana', 'ana2'):
+            account = LinkedAccount(user_id=user.id, institution='UFAL', username=username)
+            account.set_password('secret')
+            s.add(account)
+        await s.commit()
+        await s.refresh(user)
+        ids = (user.id, [a.id for a in user.linked_accounts])
+    HistoryArchive('UFAL', 'ana').save('2020001', {'2022.2': [_subject('MAT100 - CÁLCULO')]})
+    HistoryArchive('UFAL', 'ana2').save('2020002', {'2022.2': [_subject('FIS100 - FÍSICA')]})
+    HistoryArchive('UFAL', 'bia').save('2020003', {'2022.2': [_subject('QUI100 - QUÍMICA')]})
+    await asyncio.gather(*list(extensions._background_tasks))
+    return ids
+
+async def _archived(db):
+    async with db() as s:
+        return await s.scalar(select(func.count()).select_from(HistoricoTurma))
+
+async def _post(client, path, user_id):
+    async with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['_csrf_token'] = 'token'
+    return await client.post(path, form={'csrf_token': 'token'})
+
+async def test_deleting_the_account_leaves_no_archived_classes(db, client):
+    user_id, _ = await _seed(db)
+    assert await _archived(db) == 3
+    response = await _post(client, '/delete_account', user_id)
+    assert response.status_code == 302
+    assert await _archived(db) == 1
+    assert await HistoryArchive('UFAL').load('2020003')
+    assert cache.client.deleted == [f'profile:{user_id}_ana_UFAL_profile', f'profile:{user_id}_ana2_UFAL_profile']
+
+async def test_unlinking_purges_only_that_account(db, client):
+    user_id, (first, second) = await _seed(db)
+    await _post(client, f'/unlink_account/{first}', user_id)
+    assert await HistoryArchive('UFAL').load('2020001') == {}
+    assert await HistoryArchive('UFAL').load('2020002')
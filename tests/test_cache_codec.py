@@ -0,0 +1,84 @@
+import json
+import pytest
+from app import cache
+PROFILE = {'name': 'Ana', 'history': {'2023.1': [{'name': 'MAT100 - CÁLCULO', 'final_grade': 8.5, 'grades': [{'name': 'AV1', 'value': 7.0}]}]}, 'ok': True, 'none': None}
+LARGE = {'subjects': [{'name': f'DISCIPLINA {i}', 'final_grade': i / 10} for i in range(200)]}
+
+class FakeRedis:
+
+    def __init__(self):
+        self.store = {}
+        self.published = []
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+@pytest.fixture
+def redis(monkeypatch):
+    text, binary = (FakeRedis(), FakeRedis())
+    monkeypatch.setattr(cache, 'client', text)
+    monkeypatch.setattr(cache, 'binary_client', binary)
+    monkeypatch.setitem(cache._listener, 'ready', False)
+    cache._l1.clear()
+    yield (text, binary)
+    cache._l1.clear()
+
+def test_small_value_is_stored_uncompressed():
+    raw = cache.encode(PROFILE)
+    assert raw[0] == cache._CODEC_JSON
+    assert cache._decode(raw) == PROFILE
+
+def test_large_value_round_trips_compressed():
+    raw = cache.encode(LARGE)
+    assert raw[0] in (cache._CODEC_JSON_ZLIB, cache._CODEC_JSON_ZSTD)
+    assert len(raw) < len(json.dumps(LARGE))
+    assert cache._decode(raw) == LARGE
+
+def test_zlib_fallback_without_zstandard(monkeypatch):
+    monkeypatch.setattr(cache, 'zstandard', None)
+    raw = cache.encode(LARGE)
+    assert raw[0] == cache._CODEC_JSON_ZLIB
+    assert cache._decode(raw) == LARGE
+
+@pytest.mark.parametrize('legacy', [json.dumps(PROFILE), json.dumps(PROFILE).encode('utf-8')])
+def test_legacy_json_entries_still_decode(legacy):
+    assert cache._decode(legacy) == PROFILE
+    assert json.loads(cache.json_bytes(legacy)) == PROFILE
+
+def test_garbage_decodes_to_none():
+    assert cache._decode(bytes((cache._CODEC_JSON_ZLIB,)) + b'not zlib') is None
+
+async def test_binary_namespace_round_trip(redis):
+    text, binary = redis
+    await cache.set('profile', '1_ana_UFAL_profile', PROFILE)
+    assert isinstance(binary.store['profile:1_ana_UFAL_profile'], bytes)
+    assert await cache.get('profile', '1_ana_UFAL_profile') == PROFILE
+    assert json.loads(await cache.get_json('profile', '1_ana_UFAL_profile')) == PROFILE
+
+async def test_binary_namespace_reads_legacy_text(redis):
+    text, binary = redis
+    binary.store['profile:old'] = json.dumps(PROFILE).encode('utf-8')
+    assert await cache.get('profile', 'old') == PROFILE
+    assert json.loads(await cache.get_json('profile', 'old')) == PROFILE
+
+async def test_text_namespace_stays_json(redis):
+    text, binary = redis
+    await cache.set('prof', 'UFAL:1', 'FULANO')
+    assert text.store['prof:UFAL:1'] == '"FULANO"'
+    assert await cache.get('prof', 'UFAL:1') == 'FULANO'
+
+async def test_l1_hands_out_fresh_copies(redis, monkeypatch):
+    text, binary = redis
+    monkeypatch.setitem(cache._listener, 'ready', True)
+    await cache.set('profile', 'k', PROFILE)
+    first = await cache.get('profile', 'k')
+    first['name'] = 'mutated'
+    binary.store.clear()
+    assert await cache.get('profile', 'k') == PROFILE
+    assert text.published
@@ -0,0 +1,67 @@
+import json
+import pytest
+from app import cache, course_sync
+GRADES = [{'name': 'AV1', 'value': 7.5}]
+FREQUENCY = {'total_faltas': 2, 'max_faltas': 18}
+
+class FakeRedis:
+
+    def __init__(self):
+        self.store = {}
+        self.ttl = {}
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.ttl[key] = ex
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def publish(self, channel, message):
+        pass
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(cache, 'client', fake)
+    monkeypatch.setitem(cache._listener, 'ready', False)
+    cache._l1.clear()
+    return fake
+
+async def _record(previous=None, grades=GRADES, frequency=FREQUENCY):
+    changed = await course_sync.record_snapshot('ufal', 'ana', '2020001', '11', grades, frequency, previous)
+    return (changed, await course_sync.load_snapshot('UFAL', 'ana', '2020001', '11'))
+
+def test_is_due():
+    assert course_sync.is_due(None)
+    assert course_sync.is_due({'next_check_at': 100}, now=100)
+    assert not course_sync.is_due({'next_check_at': 100}, now=99)
+    assert course_sync.is_due({'next_check_at': 'garbage'}, now=0)
+
+def test_fingerprint_ignores_key_order():
+    assert course_sync.fingerprint([{'value': 7.5, 'name': 'AV1'}], {'max_faltas': 18, 'total_faltas': 2}) == course_sync.fingerprint(GRADES, FREQUENCY)
+    assert course_sync.fingerprint(None, None) == course_sync.fingerprint([], None)
+    assert course_sync.fingerprint([{'name': 'AV1', 'value': 8.0}], FREQUENCY) != course_sync.fingerprint(GRADES, FREQUENCY)
+
+async def test_interval_doubles_while_unchanged_and_resets_on_change(redis):
+    changed, snap = await _record()
+    assert changed and snap['interval'] == course_sync.MIN_RECHECK_INTERVAL
+    intervals = []
+    for _ in range(5):
+        changed, snap = await _record(snap)
+        assert not changed
+        intervals.append(snap['interval'])
+    assert intervals == sorted(intervals) and intervals[-1] == course_sync.MAX_RECHECK_INTERVAL
+    assert intervals[0] == min(course_sync.MAX_RECHECK_INTERVAL, course_sync.MIN_RECHECK_INTERVAL * 2)
+    changed, snap = await _record(snap, grades=[{'name': 'AV1', 'value': 9.0}])
+    assert changed and snap['interval'] == course_sync.MIN_RECHECK_INTERVAL
+
+async def test_snapshot_keeps_only_the_hash(redis):
+    _, snap = await _record()
+    assert set(snap) == {'fp', 'checked_at', 'interval', 'next_check_at'}
+    [(key, raw)] = redis.store.items()
+    assert '7.5' not in raw and 'faltas' not in raw
+    assert redis.ttl[key] == course_sync._FP_TTL
+    assert course_sync.matches(snap, json.loads(json.dumps(GRADES)), dict(FREQUENCY))
+    assert not course_sync.matches(snap, GRADES, {'total_faltas': 3, 'max_faltas': 18})
+    assert not course_sync.matches(None, GRADES, FREQUENCY)
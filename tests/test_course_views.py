@@ -0,0 +1,48 @@
+import pytest
+from app.sigaa_api.course import Course
+from app.sigaa_api.enums import HTTPMethod
+from app.sigaa_api.page import SigaaPage
+BASE = 'https://sigaa.example.br'
+MENU = '''
+<form id="formMenu" action="/sigaa/ava/index.jsf" method="post"><input type="hidden" name="javax.faces.ViewState" value="j_id9"></form>
+<div onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:participantes':'formMenu:participantes'},'');">Participantes</div>
+<div onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:frequencia':'formMenu:frequencia'},'');">Frequência</div>
+<div onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:notas':'formMenu:notas'},'');">Ver Notas</div>
+'''
+VIEWS = {
+    'participantes': MENU + '<fieldset><legend>Docentes</legend><table><tr><td><strong>FULANO DE TAL</strong></td></tr></table></fieldset>',
+    'frequency': MENU + '<table><tr><th>Data</th><th>Situação</th></tr><tr><td>01/03/2023</td><td>Presente</td></tr></table>',
+    'grades': MENU + '<table class="tabelaRelatorio"><thead><tr><th>Nome</th><th>AV1</th></tr></thead><tbody><tr><td>ANA</td><td>8,0</td></tr></tbody></table>',
+}
+
+def _page(body):
+    return SigaaPage(BASE + '/sigaa/ava/index.jsf', body, {}, HTTPMethod.POST, 200)
+
+class FakeSession:
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.posts = []
+
+    async def post(self, action, data=None):
+        view = next((v for v in ('participantes', 'frequencia', 'notas') if f'formMenu:{v}' in data))
+        self.posts.append(view)
+        return self.replies[view].pop(0)
+
+@pytest.mark.parametrize('view', sorted(VIEWS))
+def test_each_view_is_recognised_by_its_own_content(view):
+    assert Course._landed(view, _page(VIEWS[view]))
+    assert not Course._landed(view, _page(MENU))
+    other = next((v for v in VIEWS if v != view))
+    assert not Course._landed(view, _page(VIEWS[other]))
+
+def test_view_expired_page_never_lands():
+    assert not Course._landed('grades', _page(VIEWS['grades'] + 'javax.faces.application.ViewExpiredException'))
+
+async def test_planned_post_that_misses_the_view_falls_back_to_the_menu():
+    session = FakeSession({'participantes': [_page(VIEWS['participantes'])], 'frequencia': [_page(VIEWS['frequency'])], 'notas': [_page(MENU), _page(VIEWS['grades'])]})
+    course = Course(session, 'MAT100 - CÁLCULO 1', {'action': '', 'post_values': {'idTurma': '11'}})
+    pages = await course._open_views(_page(MENU), ['participantes', 'frequency', 'grades'])
+    assert session.posts == ['participantes', 'frequencia', 'notas', 'notas']
+    assert course._parse_professor(pages['participantes']) == 'FULANO DE TAL'
+    assert Course._landed('grades', pages['grades'])
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import hmac
+from types import SimpleNamespace
+import pytest
+from app import extensions
+from app.history_archive import HistoryArchive, is_final
+from app.models import compute_history_key, get_vote_hash_key
+from app.sigaa_api.bond import StudentBond
+
+def _subject(name, status='Aprovado', grade=8.0, professor='FULANO'):
+    return {'name': name, 'final_grade': grade, 'absences': 0, 'status': status, 'grades': [], 'professor': professor}
+
+class RecordingArchive:
+
+    def __init__(self):
+        self.saved = None
+
+    async def load(self, registration):
+        return {}
+
+    def save(self, registration, history, skip_semesters=()):
+        self.saved = history
+
+async def _history(official, detailed, scraped_names):
+
+    class Session:
+
+        async def get(self, path):
+            return SimpleNamespace(body='')
+    bond = StudentBond(Session(), '2020001', 'CC', homepage=SimpleNamespace(body=''))
+    bond._warm_session_available = lambda credentials: False
+    bond._parse_courses = lambda page: []
+
+    async def fetch_official(page):
+        return official
+
+    async def parse_previous(page, cached, credentials, titles, semester, fetch_grades=False, scraped=None):
+        scraped.update((id(s) for subjects in detailed.values() for s in subjects if s['name'] in scraped_names))
+        return detailed
+    bond._fetch_official_history = fetch_official
+    bond._parse_previous_classes = parse_previous
+    archive = RecordingArchive()
+    await bond.get_history(credentials={'archive': archive})
+    return archive.saved
+
+def test_is_final_needs_status_grade_and_professor():
+    assert is_final(_subject('A'))
+    assert not is_final(_subject('A', status='Matriculado'))
+    assert not is_final(_subject('A', grade=None))
+    assert not is_final(_subject('A', professor='Desconhecido'))
+
+def test_history_key_does_not_reuse_the_vote_key():
+    key = compute_history_key('UFAL', '2020001', '2023.1', 'MAT100')
+    assert key == compute_history_key('UFAL', '2020001', '2023.1', 'MAT100')
+    assert key != hmac.new(get_vote_hash_key(), b'UFAL:2020001:2023.1:MAT100', hashlib.sha256).hexdigest()
+    assert key != hmac.new(get_vote_hash_key(), b'history:UFAL:2020001:2023.1:MAT100', hashlib.sha256).hexdigest()
+
+async def test_only_bulletin_confirmed_scraped_classes_are_archived():
+    official = {'2023.1': [{'name': 'MAT100 - CÁLCULO', 'status': 'APROVADO', 'final_grade': 8.0, 'absences': 2}, {'name': 'FIS100 - FÍSICA', 'status': 'APROVADO', 'final_grade': 7.0}, {'name': 'QUI100 - QUÍMICA', 'status': 'APROVADO', 'final_grade': None}]}
+    detailed = {'2023.1': [_subject('MAT100 - CÁLCULO', status='Concluído', grade=None), _subject('FIS100 - FÍSICA', status='Concluído', grade=None), _subject('QUI100 - QUÍMICA', status='Concluído', grade=None), _subject('BIO100 - BIOLOGIA', status='Concluído', grade=None)]}
+    # FIS100 got its professor from the directory, so it was not scraped.
+    saved = await _history(official, detailed, {'MAT100 - CÁLCULO', 'QUI100 - QUÍMICA', 'BIO100 - BIOLOGIA'})
+    assert [(s['name'], s['status'], s['final_grade']) for s in saved['2023.1']] == [('MAT100 - CÁLCULO', 'APROVADO', 8.0)]
+
+async def test_nothing_is_archived_when_the_bulletin_fails():
+    detailed = {'2023.1': [_subject('MAT100 - CÁLCULO', status='Concluído')]}
+    assert await _history({}, detailed, {'MAT100 - CÁLCULO'}) is None
+
+async def _settle():
+    await asyncio.gather(*list(extensions._background_tasks))
+
+async def test_archive_round_trip(db):
+    archive = HistoryArchive('ufal')
+    history = {'2022.2': [_subject('MAT100 - CÁLCULO'), _subject('FIS100 - FÍSICA', grade=None)], '2023.1': [_subject('QUI100 - QUÍMICA')]}
+    archive.save('2020001', history, skip_semesters={'2023.1'})
+    await _settle()
+    index = await HistoryArchive('UFAL').load('2020001')
+    assert list(index) == [('2022.2', 'MAT100 - CÁLCULO')]
+    assert index['2022.2', 'MAT100 - CÁLCULO']['final_grade'] == 8.0
+    assert await HistoryArchive('UFAL').load('2020002') == {}
+
+async def test_archived_records_are_immutable(db):
+    archive = HistoryArchive('UFAL')
+    archive.save('2020001', {'2022.2': [_subject('MAT100 - CÁLCULO')]})
+    await _settle()
+    other = HistoryArchive('UFAL')
+    other.save('2020001', {'2022.2': [_subject('MAT100 - CÁLCULO', grade=3.0)]})
+    await _settle()
+    index = await HistoryArchive('UFAL').load('2020001')
+    assert index['2022.2', 'MAT100 - CÁLCULO']['final_grade'] == 8.0
@@ -0,0 +1,59 @@
+import re
+import pytest
+from app.sigaa_api import lexsoup
+from app.sigaa_api.lexsoup import LexSoup
+HTML = '''
+<div>
+  <table id="1" class="listagem"><tr><td>a</td></tr></table>
+  <table id="2" class="tabelaRelatorio"><tr><td>b</td></tr></table>
+  <table id="3" class="listagem tabelaRelatorio"><tr><td>c</td></tr></table>
+  <table id="4" class="outra"><tr><td>d</td></tr></table>
+  <input id="5" name="a" type="hidden" value="x">
+  <input id="6" name="b" type="submit" value="y">
+  <input id="7" name="c" type="hidden">
+  <a id="8" href="/x" title="Docente">Prof</a>
+</div>
+'''
+CASES = [
+    (('table',), {'class_': ['listagem', 'tabelaRelatorio']}),
+    (('table',), {'class_': ('tabelaRelatorio', 'listagem')}),
+    (('table',), {'class_': 'listagem'}),
+    ((None,), {'class_': ['listagem', 'outra', 'tabelaRelatorio']}),
+    (('input',), {'attrs': {'type': ['hidden', 'submit']}}),
+    (('input',), {'attrs': {'type': ['hidden', 'submit'], 'name': ['a', 'c']}}),
+    (('input',), {'attrs': {'value': True}}),
+    (('a',), {'title': re.compile('docente', re.I)}),
+    (('td',), {}),
+]
+
+def _ids(tags):
+    return [t.get('id') or t.get_text() for t in tags]
+
+def _reference(monkeypatch, soup, args, kwargs, method):
+    # Without a selector plan the engine walks every descendant, as before the lexbor selectors.
+    with monkeypatch.context() as m:
+        m.setattr(lexsoup, '_plan_selector', lambda name, filters: None)
+        return getattr(soup, method)(*args, **kwargs)
+
+@pytest.mark.parametrize('args,kwargs', CASES)
+def test_find_all_matches_traversal(monkeypatch, args, kwargs):
+    soup = LexSoup(HTML)
+    assert _ids(soup.find_all(*args, **kwargs)) == _ids(_reference(monkeypatch, soup, args, kwargs, 'find_all'))
+
+@pytest.mark.parametrize('args,kwargs', CASES)
+def test_find_matches_traversal(monkeypatch, args, kwargs):
+    soup = LexSoup(HTML)
+    found = soup.find(*args, **kwargs)
+    expected = _reference(monkeypatch, soup, args, kwargs, 'find')
+    assert (found is None) == (expected is None)
+    if found is not None:
+        assert found == expected
+
+def test_multi_class_table_returned_once():
+    soup = LexSoup('<table class="listagem tabelaRelatorio"><tr><td>x</td></tr></table>')
+    assert len(soup.find_all('table', class_=['listagem', 'tabelaRelatorio'])) == 1
+
+def test_scoped_find_all_excludes_self():
+    soup = LexSoup(HTML)
+    table = soup.find('table', class_='tabelaRelatorio')
+    assert _ids(table.find_all('table', class_=['listagem', 'tabelaRelatorio'])) == []
@@ -0,0 +1,97 @@
+import re
+import pytest
+from app.sigaa_api.lexsoup import LexSoup
+from app.sigaa_api.page_index import PageIndex
+COURSE = '''
+<html><body>
+<form id="formMenu" action="/sigaa/ava/index.jsf"><input type="hidden" name="javax.faces.ViewState" value="j_id3"></form>
+<form id="menu:form_menu_discente" action="/sigaa/portais/discente/discente.jsf"></form>
+<div id="menu">
+  <div class="itemMenu" onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:participantes':'formMenu:participantes'},'');">
+    <span><img src="/img/p.png" alt="Participantes"> Participantes</span>
+  </div>
+  <li><a href="javascript:jsfcljs(document.getElementById('formMenu'),{'formMenu:notas':'formMenu:notas'},'');">Ver Notas</a></li>
+  <td><button onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:freq':'formMenu:freq'},'');"><img src="/img/f.png" title="Frequência"></button></td>
+  <div onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:faltas':'formMenu:faltas'},'');">Faltas justificadas</div>
+  <p>Ver notas anteriores, sem ação</p>
+</div>
+<table id="resumo"><tr><th>Componente</th><th>Situação</th></tr><tr><td>MAT100</td><td>Aprovado</td></tr></table>
+<table id="freq"><thead><tr><th>Data</th><th>Situação</th></tr></thead><tr><td>01/03</td><td>Presente</td></tr></table>
+<table id="freq2"><tr><th>Data da aula</th><th>Situação</th></tr></table>
+</body></html>
+'''
+_ACTION_TAGS = ['td', 'div', 'a', 'tr', 'li', 'span', 'button']
+
+def _old_tags_labelled(soup, terms):
+    found = []
+    for tag in soup.select('[title], [alt], [value]'):
+        for attr in ('title', 'alt', 'value'):
+            value = tag.get(attr)
+            if value is not None and any((t in value.lower() for t in terms)):
+                found.append(tag)
+                break
+    return found
+
+def _old_menu_action(soup, terms):
+    """The walk Course._navigate_to_grades/_navigate_to_frequency did before PageIndex."""
+    texts = soup.find_all(string=lambda text: text and any((t in text.lower() for t in terms)))
+    for item in list(texts) + _old_tags_labelled(soup, terms):
+        parent = item if hasattr(item, 'name') and item.name else item.parent
+        while parent and parent.name != 'body':
+            if parent.name in _ACTION_TAGS:
+                if parent.get('onclick'):
+                    return parent['onclick']
+                if parent.get('href') and 'jsfcljs' in parent.get('href'):
+                    return parent['href']
+            parent = parent.parent
+    return None
+
+def _old_participantes_action(soup):
+    for item in soup.find_all(string=re.compile('Participantes', re.I)):
+        parent = item.parent
+        while parent:
+            if parent.name in ['td', 'div', 'a', 'tr', 'li', 'span'] and parent.get('onclick'):
+                return parent['onclick']
+            parent = parent.parent
+            if not parent or parent.name == 'body':
+                break
+    return None
+
+def _old_table(soup, *terms):
+    for tbl in soup.find_all('table'):
+        headers = [th.get_text(strip=True).lower() for th in tbl.find_all('th')]
+        if all((any((t in h for h in headers)) for t in terms)):
+            return tbl
+    return None
+
+@pytest.fixture
+def soup():
+    return LexSoup(COURSE)
+
+@pytest.mark.parametrize('terms', [('ver notas',), ('frequ', 'falta', 'assiduidade'), ('inexistente',)])
+def test_actions_match_the_old_menu_walk(soup, terms):
+    found = PageIndex(soup).actions(terms)
+    expected = _old_menu_action(soup, terms)
+    assert (expected is None) == (terms == ('inexistente',))
+    assert (found[0] if found else None) == expected
+
+def test_actions_match_the_old_participantes_walk(soup):
+    assert PageIndex(soup).actions(('participantes',))[0] == _old_participantes_action(soup)
+
+def test_actions_list_text_labels_before_attributes_without_duplicates(soup):
+    found = PageIndex(soup).actions(('frequ', 'falta'))
+    assert len(found) == len(set(found)) == 2
+    assert 'formMenu:faltas' in found[0] and 'formMenu:freq' in found[1]
+
+@pytest.mark.parametrize('terms', [('data', 'situa'), ('componente',), ('situa',), ('nada',)])
+def test_table_with_headers_matches_the_old_scan(soup, terms):
+    assert PageIndex(soup).table_with_headers(*terms) == _old_table(soup, *terms)
+
+def test_tables_with_headers_groups_by_signature(soup):
+    assert [t.get('id') for t in PageIndex(soup).tables_with_headers('data', 'situa')] == ['freq', 'freq2']
+
+@pytest.mark.parametrize('pattern', ['menu:form_menu_discente|menuForm', 'formMenu', 'nenhum'])
+def test_find_form_matches_the_old_lookup(soup, pattern):
+    expected = soup.find('form', id=re.compile(pattern))
+    assert (expected is None) == (pattern == 'nenhum')
+    assert PageIndex(soup).find_form(pattern) == expected
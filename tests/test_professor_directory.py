@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from app import cache, extensions, professor_directory as directory
+
+class FakeRedis:
+
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def publish(self, channel, message):
+        pass
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(cache, 'client', fake)
+    monkeypatch.setitem(cache._listener, 'ready', False)
+    return fake
+
+async def _settle():
+    await asyncio.gather(*list(extensions._background_tasks))
+
+async def _lookup(*entries):
+    return await directory.lookup_many('ufal', list(entries))
+
+def test_component_code():
+    assert directory.component_code('MAT100 - CÁLCULO 1') == 'MAT100'
+    assert directory.component_code('Cálculo') is None
+
+async def test_turma_key_wins_over_component(db, redis):
+    await directory.record_many('UFAL', [('FULANO', '1', 'MAT100', '2023.1')])
+    assert await _lookup(('1', 'MAT100', '2023.1'), (None, 'MAT100', '2023.1')) == ['FULANO', 'FULANO']
+
+async def test_component_key_is_not_lent_to_another_turma(db, redis):
+    await directory.record_many('UFAL', [('FULANO', '1', 'MAT100', '2023.1')])
+    assert await _lookup(('2', 'MAT100', '2023.1')) == [None]
+
+async def test_conflicting_turmas_mark_the_component_ambiguous(db, redis):
+    await directory.record_many('UFAL', [('FULANO', '1', 'MAT100', '2023.1')])
+    await directory.record_many('UFAL', [('BELTRANO', '2', 'MAT100', '2023.1')])
+    assert await _lookup(('1', 'MAT100', '2023.1'), ('2', 'MAT100', '2023.1'), (None, 'MAT100', '2023.1')) == ['FULANO', 'BELTRANO', None]
+    # Later writes never bring an ambiguous key back.
+    await directory.record_many('UFAL', [('FULANO', None, 'MAT100', '2023.1')])
+    assert await _lookup((None, 'MAT100', '2023.1')) == [None]
+
+async def test_conflict_inside_one_batch(db, redis):
+    await directory.record_many('UFAL', [('FULANO', None, 'MAT100', '2023.1'), ('BELTRANO', None, 'MAT100', '2023.1')])
+    assert await _lookup((None, 'MAT100', '2023.1')) == [None]
+
+async def test_history_entry_serves_turmas(db, redis):
+    directory.record_history('UFAL', {'2023.1': [{'name': 'MAT100 - CÁLCULO', 'professor': 'FULANO'}, {'name': 'FIS100 - FÍSICA', 'professor': 'Desconhecido'}]})
+    await _settle()
+    assert await _lookup(('9', 'MAT100', '2023.1'), ('8', 'FIS100', '2023.1')) == ['FULANO', None]
+
+async def test_database_survives_a_cold_redis(db, redis):
+    await directory.record_many('UFAL', [('FULANO', '1', 'MAT100', '2023.1'), ('BELTRANO', '2', 'MAT100', '2023.1')])
+    redis.store.clear()
+    assert await _lookup(('1', None, None), (None, 'MAT100', '2023.1')) == ['FULANO', None]
+    await _settle()
+    assert redis.store['prof:UFAL:1'] == '"FULANO"'
+
+async def test_turma_key_follows_the_latest_name(db, redis):
+    await directory.record('UFAL', 'FULANO', '1')
+    await directory.record('UFAL', 'CICLANO', '1')
+    assert await directory.lookup('UFAL', '1') == 'CICLANO'
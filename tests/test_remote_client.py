@@ -0,0 +1,89 @@
+import asyncio
+import json
+import pytest
+from app import cache
+from app.sigaa_remote import client as remote
+from app.sigaa_remote.errors import RemoteApiError
+
+class FakeRedis:
+    """Redis lists plus a fake worker that answers every task it is handed."""
+
+    def __init__(self, worker):
+        self.lists = {}
+        self.deleted = []
+        self.worker = worker
+
+    async def lpush(self, key, *values):
+        for raw in values:
+            task = json.loads(raw)
+            reply = task.get('reply_to') or f"sigaa:result:{task['task_id']}"
+            for message in self.worker(task):
+                self.lists.setdefault(reply, []).append(json.dumps({'task_id': task['task_id'], **message}))
+
+    async def blpop(self, key, timeout=0):
+        items = self.lists.get(key)
+        if not items:
+            await asyncio.sleep(0.005)
+            return None
+        raw = items.pop(0)
+        if not items:
+            del self.lists[key]
+        return (key, raw)
+
+    async def get(self, key):
+        return None
+
+    async def delete(self, key):
+        self.deleted.append(key)
+        self.lists.pop(key, None)
+
+def _batch_worker(done=True):
+
+    def answer(task):
+        if task['action'] != 'course_details_many':
+            return []
+        messages = [{'success': True, 'course_id': 1, 'data': {'grades': [1]}}, {'success': False, 'course_id': 2, 'error': {'code': 'scrape_failed', 'status_code': 500}}]
+        return messages + ([{'done': True}] if done else [])
+    return answer
+
+def _legacy_worker(task):
+    if task['action'] == 'course_details_many':
+        return [{'success': False, 'error': {'code': 'unknown_action', 'status_code': 400}}]
+    return [{'success': True, 'data': {'course': task['payload']['course_id']}}]
+
+@pytest.fixture(params=['blpop', 'dispatch'])
+async def setup(request, monkeypatch):
+    monkeypatch.setattr(remote, 'REPLY_MODE', request.param)
+    monkeypatch.setattr(remote, 'LIVENESS_CHECK_SECONDS', 0.05)
+    client = remote.SigaaRemoteClient()
+
+    def install(worker):
+        fake = FakeRedis(worker)
+        monkeypatch.setattr(cache, 'client', fake)
+        return (client, fake)
+    yield install
+    await client.aclose()
+
+async def _collect(client):
+    return [entry async for entry in client.course_details_many('s1', 'b1', [1, 2])]
+
+async def test_batch_yields_each_course_and_consumes_done(setup):
+    client, fake = setup(_batch_worker())
+    results = await _collect(client)
+    assert results[0] == (1, {'grades': [1]})
+    assert results[1][0] == 2 and isinstance(results[1][1], RemoteApiError)
+    assert not any((k.startswith('sigaa:result:') for k in fake.lists))
+    assert fake.deleted == []
+    assert client._task_workers == {}
+
+async def test_missing_done_leaves_no_result_key(setup):
+    client, fake = setup(_batch_worker(done=False))
+    assert [c for c, _ in await _collect(client)] == [1, 2]
+    assert not any((k.startswith('sigaa:result:') for k in fake.lists))
+    assert client._task_workers == {}
+
+async def test_unknown_action_falls_back_to_single_tasks(setup):
+    client, fake = setup(_legacy_worker)
+    assert await _collect(client) == [(1, {'course': 1}), (2, {'course': 2})]
+    assert not any((k.startswith('sigaa:result:') for k in fake.lists))
+    assert client._task_workers == {}
@@ -0,0 +1,49 @@
+from contextlib import asynccontextmanager
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.sigaa_api import session as sigaa_session
+from app.sigaa_api.session import SigaaSession
+
+class CountingGate:
+
+    def __init__(self):
+        self.slots = 0
+        self.extends = 0
+
+    @asynccontextmanager
+    async def slot(self, base_url, owner=None):
+        self.slots += 1
+
+        async def extend():
+            self.extends += 1
+        yield extend
+
+@pytest.fixture
+async def server():
+    app = web.Application()
+
+    async def hop(request):
+        raise web.HTTPFound(request.match_info['next'])
+
+    async def page(request):
+        return web.Response(text='<html><body>ok</body></html>', content_type='text/html')
+    app.router.add_get('/hop/{next:.*}', hop)
+    app.router.add_get('/page', page)
+    srv = TestServer(app)
+    await srv.start_server()
+    yield srv
+    await srv.close()
+    await sigaa_session.close_connectors()
+
+async def test_one_slot_per_request_across_redirects(server, monkeypatch):
+    gate = CountingGate()
+    monkeypatch.setattr(sigaa_session, '_request_gate', gate)
+    sigaa = SigaaSession(str(server.make_url('/')))
+    try:
+        page = await sigaa.get('/hop//hop//page')
+    finally:
+        await sigaa.close()
+    assert str(page.url).endswith('/page')
+    assert gate.slots == 1
+    assert gate.extends == 2
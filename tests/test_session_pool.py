@@ -0,0 +1,59 @@
+import time
+from app.sigaa_api.session_pool import PooledSession, SigaaSessionPool
+
+class FakeSession:
+
+    def __init__(self):
+        self.gets = []
+
+    async def get(self, path):
+        self.gets.append(path)
+        return FakePage()
+
+class FakePage:
+    is_login_page = False
+
+class FakeSigaa:
+
+    def __init__(self):
+        self.session = FakeSession()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+def _pooled(pool, idle_for):
+    user_key = pool._user_key('https://sigaa.example.br', 'UFAL', 'ana', 'secret')
+    entry = PooledSession(user_key, None, FakeSigaa(), object())
+    entry.last_used = time.monotonic() - idle_for
+    pool._idle[entry.key] = [entry]
+    return entry
+
+async def test_recently_used_session_is_leased_without_a_probe():
+    pool = SigaaSessionPool(probe_after_idle=60)
+    entry = _pooled(pool, idle_for=5)
+    lease = await pool.acquire('https://sigaa.example.br', 'UFAL', 'ana', 'secret')
+    assert lease is entry and lease.reused
+    assert entry.sigaa.session.gets == []
+
+async def test_long_idle_session_is_probed():
+    pool = SigaaSessionPool(probe_after_idle=60)
+    entry = _pooled(pool, idle_for=120)
+    lease = await pool.acquire('https://sigaa.example.br', 'UFAL', 'ana', 'secret')
+    assert lease is entry
+    assert len(entry.sigaa.session.gets) == 1
+
+async def test_discarded_lease_is_closed_and_frees_the_slot():
+    pool = SigaaSessionPool(probe_after_idle=60)
+    entry = _pooled(pool, idle_for=5)
+    lease = await pool.acquire('https://sigaa.example.br', 'UFAL', 'ana', 'secret')
+    await pool.release(lease, discard=True)
+    assert entry.sigaa.closed
+    assert pool._count(entry.user_key) == 0
+
+async def test_lease_can_skip_the_probe():
+    pool = SigaaSessionPool(probe_after_idle=60)
+    entry = _pooled(pool, idle_for=120)
+    lease = await pool.acquire('https://sigaa.example.br', 'UFAL', 'ana', 'secret', probe=False)
+    assert lease is entry
+    assert entry.sigaa.session.gets == []
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from app import sigaa_budget
+from app.sigaa_budget import BudgetExhausted, ConcurrencyBudget, _FairGate
+
+async def _queue(gate, owner, served):
+    await gate.acquire(owner)
+    served.append(owner)
+
+async def test_fair_gate_alternates_owners():
+    gate = _FairGate(1)
+    await gate.acquire('holder')
+    served = []
+    tasks = [asyncio.create_task(_queue(gate, owner, served)) for owner in ('a', 'a', 'a', 'b')]
+    await asyncio.sleep(0)
+    for _ in tasks:
+        gate.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert served == ['a', 'b', 'a', 'a']
+
+async def test_fair_gate_timeout_leaves_queue():
+    gate = _FairGate(1)
+    await gate.acquire('holder')
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(gate.acquire('late'), timeout=0.01)
+    assert gate.waiting == 0
+    gate.release()
+    assert gate.active == 0
+    await asyncio.wait_for(gate.acquire('next'), timeout=0.1)
+    assert gate.active == 1
+
+async def test_fair_gate_cancel_after_grant_releases():
+    gate = _FairGate(1)
+    await gate.acquire('holder')
+    waiter = asyncio.create_task(gate.acquire('late'))
+    await asyncio.sleep(0)
+    gate.release()
+    # The slot was handed over but the waiter is cancelled before it runs.
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert gate.active == 0
+    assert gate.waiting == 0
+
+async def test_slot_times_out_and_frees_the_gate():
+    budget = ConcurrencyBudget(default_limit=1, limits={}, max_wait=0.05)
+    budget._redis_retry_at = float('inf')
+    async with budget.slot('https://sigaa.example.br'):
+        with pytest.raises(BudgetExhausted):
+            async with budget.slot('https://sigaa.example.br'):
+                pass
+    gate = budget._gates['sigaa.example.br']
+    assert (gate.active, gate.waiting) == (0, 0)
+    assert budget.stats()['sigaa.example.br']['timeouts'] == 1
+
+async def test_extend_renews_only_when_a_hop_could_outlive_the_lease(monkeypatch):
+    budget = ConcurrencyBudget(default_limit=1, limits={}, max_wait=0.05)
+    renewed = []
+
+    async def acquire(host, started):
+        return 'token'
+
+    async def renew(host, token):
+        renewed.append(token)
+
+    async def release(host, token):
+        pass
+    monkeypatch.setattr(budget, '_acquire_remote', acquire)
+    monkeypatch.setattr(budget, '_renew_remote', renew)
+    monkeypatch.setattr(budget, '_release_remote', release)
+    async with budget.slot('https://sigaa.example.br') as extend:
+        await extend()
+        assert renewed == []
+        monkeypatch.setattr(sigaa_budget, 'LEASE_TTL', sigaa_budget.REQUEST_TIMEOUT)
+        await extend()
+        assert renewed == ['token']
+
+def test_lease_outlives_the_request_timeout():
+    assert sigaa_budget.LEASE_TTL > sigaa_budget.REQUEST_TIMEOUT
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import pytest
+from app import cache
+from app.singleflight import SingleFlight
+
+class FakeRedis:
+
+    def __init__(self, fail=False):
+        self.store = {}
+        self.published = []
+        self.fail = fail
+
+    async def set(self, key, value, nx=False, ex=None):
+        if self.fail:
+            raise ConnectionError('redis down')
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def exists(self, key):
+        return int(key in self.store)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def register_script(self, source):
+
+        async def release(keys, args):
+            if self.store.get(keys[0]) == args[0]:
+                del self.store[keys[0]]
+                return 1
+            return 0
+        return release
+
+    def pubsub(self, **kwargs):
+        raise ConnectionError('no pubsub')
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(cache, 'client', fake)
+    return fake
+
+@pytest.fixture
+async def flight():
+    sf = SingleFlight()
+    yield sf
+    await sf.aclose()
+
+def _counted(value, delay=0.02):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value
+    return (fn, calls)
+
+async def test_concurrent_calls_share_one_run(redis, flight):
+    fn, calls = _counted({'ok': 1})
+    results = await asyncio.gather(*(flight.do('UFAL:ana:profile', fn) for _ in range(3)))
+    assert results == [{'ok': 1}] * 3
+    assert len(calls) == 1
+    assert 'singleflight:lock:UFAL:ana:profile' not in redis.store
+    assert json.loads(redis.store['singleflight:result:UFAL:ana:profile']) == {'ok': True, 'value': {'ok': 1}}
+
+async def test_cancelled_caller_does_not_cancel_the_flight(redis, flight):
+    fn, calls = _counted('done', delay=0.05)
+    first = asyncio.create_task(flight.do('k', fn))
+    second = asyncio.create_task(flight.do('k', fn))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await second == 'done'
+    assert len(calls) == 1
+
+async def test_follower_reuses_the_leader_result(redis, flight):
+    redis.store['singleflight:lock:k'] = 'other-process'
+    redis.store['singleflight:result:k'] = json.dumps({'ok': True, 'value': 42})
+    fn, calls = _counted(0)
+    assert await flight.do('k', fn) == 42
+    assert calls == []
+
+async def test_follower_runs_itself_when_the_leader_fails(redis, flight):
+    redis.store['singleflight:lock:k'] = 'other-process'
+    redis.store['singleflight:result:k'] = json.dumps({'ok': False})
+    fn, calls = _counted('mine')
+    assert await flight.do('k', fn) == 'mine'
+    assert len(calls) == 1
+
+async def test_leader_error_reaches_every_caller(redis, flight):
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('sigaa down')
+    results = await asyncio.gather(flight.do('k', boom), flight.do('k', boom), return_exceptions=True)
+    assert all((isinstance(r, RuntimeError) for r in results))
+    assert json.loads(redis.store['singleflight:result:k']) == {'ok': False}
+    assert 'singleflight:lock:k' not in redis.store
+
+async def test_without_redis_coalesces_in_process(monkeypatch, flight):
+    monkeypatch.setattr(cache, 'client', FakeRedis(fail=True))
+    fn, calls = _counted('local')
+    assert await asyncio.gather(flight.do('k', fn), flight.do('k', fn)) == ['local', 'local']
+    assert len(calls) == 1
+
+def test_key_normalizes_institution():
+    assert SingleFlight.key('ufal', 'ana', 'profile') == SingleFlight.key('UFAL', 'ana', 'profile')
+
+def test_profile_flight_is_per_linked_account():
+    from app.profile_service import flight_key
+    assert flight_key('ufal', 'ana', 1) == flight_key('UFAL', 'ana', 1)
+    assert flight_key('UFAL', 'ana', 1) != flight_key('UFAL', 'ana', 2)
@@ -0,0 +1,111 @@
+import pytest
+from app.sigaa_api import session_pool
+from app.sigaa_api.bond import StudentBond
+from app.sigaa_api.course import Course
+from app.sigaa_api.enums import HTTPMethod
+from app.sigaa_api.exceptions import SigaaViewExpired
+from app.sigaa_api.page import SigaaPage
+BASE = 'https://sigaa.example.br'
+TITLE = 'MAT100 - CÁLCULO 1'
+OTHER = 'FIS200 - FÍSICA 2'
+TURMAS = '''
+<form id="form_t" action="/sigaa/portais/discente/turmas.jsf" method="post">
+  <input type="hidden" name="form_t" value="form_t">
+  <input type="hidden" name="javax.faces.ViewState" value="j_id{state}">
+</form>
+<table class="listagem">
+  <tr><td colspan="2">2023.1</td></tr>
+  <tr><td>{title}</td><td><a href="#" onclick="jsfcljs(document.getElementById('form_t'),{{'idTurma':'11'}},'');return false"><img src="/img/avancar.gif"></a></td></tr>
+  <tr><td>{other}</td><td><a href="#" onclick="jsfcljs(document.getElementById('form_t'),{{'idTurma':'22'}},'');return false"><img src="/img/avancar.gif"></a></td></tr>
+</table>
+'''
+COURSE = '''
+<form id="formMenu" action="/sigaa/ava/index.jsf" method="post"><input type="hidden" name="javax.faces.ViewState" value="j_id9"></form>
+<div onclick="jsfcljs(document.getElementById('formMenu'),{'formMenu:participantes':'formMenu:participantes'},'');">Participantes</div>
+'''
+PARTICIPANTS = '<fieldset><legend>Docentes</legend><table><tr><td><strong>FULANO DE TAL</strong></td></tr></table></fieldset>'
+EXPIRED = '<html><body>javax.faces.application.ViewExpiredException: viewExpired</body></html>'
+
+def _page(path, body):
+    return SigaaPage(BASE + path, body, {}, HTTPMethod.GET, 200)
+
+class FakeSession:
+
+    def __init__(self, replies=()):
+        self.replies = list(replies)
+        self.turmas_loads = 0
+        self.posts = []
+
+    async def get(self, path):
+        self.turmas_loads += 1
+        return _page(path, TURMAS.format(state=self.turmas_loads, title=TITLE, other=OTHER))
+
+    async def post(self, action, data=None):
+        self.posts.append(dict(data or {}))
+        return self.replies.pop(0)
+
+class FakeLease:
+    reused = True
+
+    def __init__(self, session):
+        self.sigaa = self
+        self.session = session
+
+class FakePool:
+
+    def __init__(self, session):
+        self.session = session
+        self.discarded = None
+
+    async def acquire(self, *args, **kwargs):
+        return FakeLease(self.session)
+
+    async def release(self, lease, discard=False):
+        self.discarded = discard
+
+def _batch():
+    return [{'title': title, 'semester': '2023.1', 'schedule_code': '', 'row_status': 'APROVADO'} for title in (TITLE, OTHER)]
+
+def _credentials():
+    return {'username': 'ana', 'password': 'secret', 'url': BASE, 'inst_type': 'UFAL'}
+
+async def test_index_maps_only_the_wanted_classes():
+    session = FakeSession()
+    index = await StudentBond._load_turmas_index(session, {('2023.1', TITLE)})
+    assert list(index) == [('2023.1', TITLE)]
+    form = index[('2023.1', TITLE)]
+    assert form['action'] == BASE + '/sigaa/portais/discente/turmas.jsf'
+    assert form['post_values'] == {'form_t': 'form_t', 'javax.faces.ViewState': 'j_id1', 'idTurma': '11'}
+
+async def test_batch_reloads_the_index_once_on_an_expired_view(monkeypatch):
+    session = FakeSession([_page('/sigaa/ava/index.jsf', COURSE), _page('/sigaa/ava/index.jsf', PARTICIPANTS), _page('/sigaa/portais/discente/turmas.jsf', EXPIRED), _page('/sigaa/ava/index.jsf', COURSE), _page('/sigaa/ava/index.jsf', PARTICIPANTS)])
+    pool = FakePool(session)
+    monkeypatch.setattr(session_pool, 'get_session_pool', lambda: pool)
+    bond = StudentBond(session, '2020000001', 'COMPUTAÇÃO')
+    results = await bond._fetch_batch_parallel(_credentials(), _batch())
+    assert [subj['professor'] for _, subj in results] == ['FULANO DE TAL', 'FULANO DE TAL']
+    assert session.turmas_loads == 2
+    entries = [p for p in session.posts if 'idTurma' in p]
+    assert [(p['idTurma'], p['javax.faces.ViewState']) for p in entries] == [('11', 'j_id1'), ('22', 'j_id1'), ('22', 'j_id2')]
+    assert pool.discarded is False
+
+async def test_batch_gives_up_after_one_reload(monkeypatch):
+    expired = _page('/sigaa/portais/discente/turmas.jsf', EXPIRED)
+    session = FakeSession([_page('/sigaa/ava/index.jsf', COURSE), _page('/sigaa/ava/index.jsf', PARTICIPANTS), expired, expired])
+    pool = FakePool(session)
+    monkeypatch.setattr(session_pool, 'get_session_pool', lambda: pool)
+    bond = StudentBond(session, '2020000001', 'COMPUTAÇÃO')
+    first, second = await bond._fetch_batch_parallel(_credentials(), _batch())
+    assert first[1]['professor'] == 'FULANO DE TAL'
+    assert isinstance(second[1], SigaaViewExpired)
+    assert session.turmas_loads == 2
+    assert pool.discarded is True
+
+async def test_only_require_ava_treats_the_portal_as_expired():
+    form = {'action': BASE + '/sigaa/portais/discente/turmas.jsf', 'post_values': {'idTurma': '11'}}
+    portal = _page('/sigaa/portais/discente/discente.jsf', '<html><body>Portal</body></html>')
+    assert await Course(FakeSession([portal]), TITLE, form)._enter_course() is portal
+    with pytest.raises(SigaaViewExpired):
+        await Course(FakeSession([portal]), TITLE, form, require_ava=True)._enter_course()
+    with pytest.raises(SigaaViewExpired):
+        await Course(FakeSession([_page('/sigaa/ava/index.jsf', EXPIRED)]), TITLE, form)._enter_course()